@@ -0,0 +1,256 @@
+import json
+import operator
+import threading
+import time
+from collections import deque
+
+from storage import disk_percent, from_epoch, to_epoch
+
+METRICS = ("cpu", "ram", "disk", "swap", "temp")
+
+OPERATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+# Rate rules split rate_window into this many sub-windows and remember only
+# the first sample of each, so their state is the same size whatever the
+# window and however often hosts report.
+RATE_BUCKETS = 10
+
+DEFAULT_RULES = [
+    {"name": "cpu_high", "metric": "cpu", "op": ">", "threshold": 90, "for_seconds": 300, "clear": 80},
+    {"name": "ram_high", "metric": "ram", "op": ">", "threshold": 90, "for_seconds": 300, "clear": 85},
+    {"name": "disk_full", "metric": "disk", "op": ">", "threshold": 90, "clear": 88, "severity": "critical"},
+    {"name": "disk_filling", "metric": "disk", "op": ">", "threshold": 1, "rate_window": 600},
+    {"name": "swap_high", "metric": "swap", "op": ">", "threshold": 50, "for_seconds": 600},
+    {"name": "temp_high", "metric": "temp", "op": ">", "threshold": 85, "for_seconds": 60, "clear": 80,
+     "severity": "critical"},
+]
+
+
+def sample_values(data):
+    """The alertable metrics of one HardwareData report, in METRICS order"""
+    return (
+        data.cpu.total_cpu_usage,
+        data.memory.percentage,
+        disk_percent(data),
+        data.memory.swap_percent,
+        data.cpu.temperature,
+    )
+
+
+class Rule:
+    """One alert condition on a single metric.
+
+    A plain threshold fires on the first sample that matches. With
+    for_seconds the condition must hold that long first (pending until
+    then). With rate_window the value compared is the change per minute
+    over that many seconds (measured from the first sample of the oldest
+    sub-window still inside it) rather than the metric itself. clear, when
+    given, is the level the value has to get back past before a firing
+    alert resolves, so a metric hovering at the threshold does not flap.
+    """
+
+    def __init__(self, name, metric, threshold, op=">", for_seconds=0, rate_window=None, clear=None,
+                 severity="warning"):
+        if metric not in METRICS:
+            raise ValueError(f"Rule {name}: unknown metric {metric!r}, expected one of {', '.join(METRICS)}")
+        if op not in OPERATORS:
+            raise ValueError(f"Rule {name}: unknown operator {op!r}")
+        if rate_window is not None and rate_window <= 0:
+            raise ValueError(f"Rule {name}: rate_window must be positive")
+        self.name = name
+        self.metric = metric
+        self.index = METRICS.index(metric)
+        self.op = op
+        self.compare = OPERATORS[op]
+        self.threshold = float(threshold)
+        self.for_seconds = float(for_seconds)
+        self.rate_window = float(rate_window) if rate_window is not None else None
+        self.clear = float(clear) if clear is not None else None
+        self.severity = severity
+
+    @classmethod
+    def from_dict(cls, spec):
+        try:
+            return cls(**spec)
+        except TypeError as e:
+            raise ValueError(f"Invalid alert rule {spec!r}: {e}")
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "metric": self.metric,
+            "op": self.op,
+            "threshold": self.threshold,
+            "for_seconds": self.for_seconds,
+            "rate_window": self.rate_window,
+            "clear": self.clear,
+            "severity": self.severity,
+        }
+
+
+def rules_from_file(path):
+    with open(path) as f:
+        return [Rule.from_dict(spec) for spec in json.load(f)]
+
+
+class _State:
+    __slots__ = ("state", "since", "value", "marks")
+
+    def __init__(self, rate):
+        self.state = "ok"
+        self.since = None
+        self.value = None
+        # Rate rules: (sub-window number, ts, value) of the first sample of
+        # each of the last RATE_BUCKETS sub-windows, indexed by number modulo.
+        self.marks = [None] * RATE_BUCKETS if rate else None
+
+
+class _Host:
+    __slots__ = ("last_ts", "states")
+
+    def __init__(self, rules):
+        self.last_ts = None
+        self.states = [_State(rule.rate_window is not None) for rule in rules]
+
+
+class AlertEngine:
+    """Evaluates alert rules per host as samples are committed.
+
+    Each (rule, host) pair keeps a few fields: its state (ok, pending or
+    firing), when the condition started holding, and for rate rules the
+    first sample of each of RATE_BUCKETS sub-windows. A sample therefore
+    costs one dict lookup and a handful of comparisons per rule, with no
+    history queries.
+    Samples not newer than the last one seen for a host are ignored, so
+    the same sample arriving twice (own ingest and another worker's
+    commit) counts once. Firing/resolved transitions go to a bounded,
+    numbered log that clients can poll with since=<id>.
+    """
+
+    def __init__(self, rules=None, max_transitions=1000):
+        self.rules = [rule if isinstance(rule, Rule) else Rule.from_dict(rule) for rule in (rules or DEFAULT_RULES)]
+        names = [rule.name for rule in self.rules]
+        if len(set(names)) != len(names):
+            raise ValueError("Alert rule names must be unique")
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self._transitions = deque(maxlen=max_transitions)
+        self._next_id = 1
+        self._counters = {"samples": 0, "evaluations": 0, "transitions": 0, "eval_ms": 0.0}
+
+    def observe_batch(self, batch):
+        """Ingest listener: evaluate every HardwareData in a committed batch"""
+        now = time.time()
+        self.observe_many(
+            (data.system_info.computer_name, to_epoch(data.timestamp, now), sample_values(data)) for data in batch
+        )
+
+    def observe_many(self, samples):
+        """Evaluate (host, ts, values) tuples, values in METRICS order"""
+        started = time.perf_counter()
+        rules = self.rules
+        count = evaluated = 0
+        with self._lock:
+            for host, ts, values in samples:
+                count += 1
+                record = self._hosts.get(host)
+                if record is None:
+                    record = self._hosts[host] = _Host(rules)
+                elif record.last_ts is not None and ts <= record.last_ts:
+                    continue
+                record.last_ts = ts
+                evaluated += 1
+                for rule, state in zip(rules, record.states):
+                    value = values[rule.index]
+                    if value is not None:
+                        self._evaluate(rule, host, state, ts, value)
+            self._counters["samples"] += count
+            self._counters["evaluations"] += evaluated * len(rules)
+            self._counters["eval_ms"] += (time.perf_counter() - started) * 1000
+
+    def _evaluate(self, rule, host, state, ts, value):
+        if state.marks is not None:
+            marks = state.marks
+            number = int(ts // (rule.rate_window / RATE_BUCKETS))
+            mark = marks[number % RATE_BUCKETS]
+            if mark is None or mark[0] != number:
+                marks[number % RATE_BUCKETS] = (number, ts, value)
+            # Oldest sub-window that is still (entirely) inside rate_window.
+            start = min(m for m in marks if m is not None and number - m[0] < RATE_BUCKETS)
+            _, start_ts, start_value = start
+            # Wait for half a window of data before judging a trend.
+            if ts - start_ts < rule.rate_window / 2:
+                return
+            value = (value - start_value) / (ts - start_ts) * 60
+        state.value = value
+        if state.state == "firing":
+            limit = rule.clear if rule.clear is not None else rule.threshold
+            if not rule.compare(value, limit):
+                self._transition(rule, host, state, "resolved", ts)
+                state.state, state.since = "ok", None
+            return
+        if not rule.compare(value, rule.threshold):
+            state.state, state.since = "ok", None
+            return
+        if state.state == "ok":
+            state.state, state.since = "pending", ts
+        if ts - state.since >= rule.for_seconds:
+            state.state = "firing"
+            self._transition(rule, host, state, "firing", ts)
+
+    def _transition(self, rule, host, state, new_state, ts):
+        self._transitions.append({
+            "id": self._next_id,
+            "rule": rule.name,
+            "host": host,
+            "severity": rule.severity,
+            "state": new_state,
+            "value": round(state.value, 2),
+            "threshold": rule.threshold,
+            "since": from_epoch(state.since),
+            "at": from_epoch(ts),
+        })
+        self._next_id += 1
+        self._counters["transitions"] += 1
+
+    def active(self, host=None):
+        """Pending and firing alerts, firing first"""
+        with self._lock:
+            hosts = self._hosts.items() if host is None else [(host, self._hosts[host])] if host in self._hosts else []
+            alerts = [
+                {
+                    "rule": rule.name,
+                    "host": name,
+                    "severity": rule.severity,
+                    "state": state.state,
+                    "value": round(state.value, 2),
+                    "threshold": rule.threshold,
+                    "since": from_epoch(state.since),
+                    "last_sample": from_epoch(record.last_ts),
+                }
+                for name, record in hosts
+                for rule, state in zip(self.rules, record.states)
+                if state.state != "ok"
+            ]
+        alerts.sort(key=lambda alert: (alert["state"] != "firing", alert["since"]))
+        return alerts
+
+    def transitions(self, since=0, limit=100):
+        """Transitions with id > since, oldest first, and the id to poll from next"""
+        with self._lock:
+            items = [t for t in self._transitions if t["id"] > since][:limit]
+            last_id = self._next_id - 1
+        return {"last_id": items[-1]["id"] if items else last_id, "transitions": items}
+
+    def firing_count(self):
+        with self._lock:
+            return sum(state.state == "firing" for record in self._hosts.values() for state in record.states)
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._counters)
+            result["hosts"] = len(self._hosts)
+        result["eval_ms"] = round(result["eval_ms"], 2)
+        result["us_per_sample"] = round(result["eval_ms"] * 1000 / result["samples"], 2) if result["samples"] else 0.0
+        result["rules"] = len(self.rules)
+        return result
@@ -1,28 +1,109 @@
+import datetime
+import gzip
+import json
+import platform
 import psutil
 import socket
 import requests
 import time
+import uuid
 
 SERVER_URL = "http://localhost:5001/update-hardware"
 COMPUTER_NAME = socket.gethostname()
+BATCH_SIZE = 3  # reports per request to the bulk endpoint
+MAX_PENDING = 100  # reports kept while the server is unreachable
+RETRY_STATUSES = (408, 429)  # 4xx answers worth resending; other 4xx mean the batch itself is bad
+
+# One keep-alive session for every request instead of a new connection each time
+session = requests.Session()
+session.headers.update({"Content-Type": "application/json", "Content-Encoding": "gzip"})
+
+BOOT_TIME = datetime.datetime.fromtimestamp(psutil.boot_time(), datetime.timezone.utc)
 
 def get_hardware_details():
+    """A minimal report in the backend's HardwareData shape (see client-agent/ for the full agent)"""
+    per_core = psutil.cpu_percent(percpu=True)
+    freq = psutil.cpu_freq()
+    memory = psutil.virtual_memory()
+    swap = psutil.swap_memory()
+    partitions = []
+    for partition in psutil.disk_partitions():
+        try:
+            usage = psutil.disk_usage(partition.mountpoint)
+        except OSError:
+            continue
+        partitions.append({
+            "device": partition.device,
+            "mountpoint": partition.mountpoint,
+            "fstype": partition.fstype,
+            "total": usage.total,
+            "used": usage.used,
+            "free": usage.free,
+            "percent": usage.percent,
+        })
+    io = psutil.disk_io_counters()
+    now = datetime.datetime.now(datetime.timezone.utc)
     return {
-        "computer_name": COMPUTER_NAME,
-        "cpu": psutil.cpu_percent(),
-        "ram": psutil.virtual_memory().percent,
-        "disk": psutil.disk_usage('/').percent,
-        "usb_devices": [device.device for device in psutil.disk_partitions()]
+        "system_info": {
+            "computer_name": COMPUTER_NAME,
+            "os": f"{platform.system()} {platform.release()}",
+            "os_version": platform.version(),
+            "architecture": platform.machine(),
+            "processor": platform.processor(),
+            "machine_id": str(uuid.getnode()),
+            "boot_time": BOOT_TIME.isoformat(),
+            "uptime": str(now - BOOT_TIME).split('.')[0],
+        },
+        "cpu": {
+            "physical_cores": psutil.cpu_count(logical=False) or 0,
+            "total_cores": psutil.cpu_count(logical=True) or 0,
+            "max_frequency": freq.max if freq and freq.max else None,
+            "current_frequency": freq.current if freq else None,
+            "cpu_usage_per_core": per_core,
+            "total_cpu_usage": round(sum(per_core) / len(per_core), 1) if per_core else 0.0,
+            "temperature": None,
+        },
+        "memory": {
+            "total": memory.total,
+            "available": memory.available,
+            "used": memory.used,
+            "percentage": memory.percent,
+            "swap_total": swap.total,
+            "swap_used": swap.used,
+            "swap_free": swap.free,
+            "swap_percent": swap.percent,
+        },
+        "disk": {
+            "partitions": partitions,
+            "total_read": io.read_bytes if io else 0,
+            "total_write": io.write_bytes if io else 0,
+        },
+        "network": {},
+        "gpu": {"name": "N/A", "memory": "N/A"},
+        "processes": {"total": len(psutil.pids()), "running": 0, "top_cpu": []},
+        "usb_devices": [device.device for device in psutil.disk_partitions() if "removable" in device.opts],
+        "timestamp": now.isoformat(),
     }
 
 def sync_with_server():
+    pending = []
     while True:
         try:
-            data = get_hardware_details()
-            response = requests.post(SERVER_URL, json=data)
-            print(f"Synced: {response.status_code}")
+            pending.append(get_hardware_details())
+            if len(pending) >= BATCH_SIZE:
+                body = gzip.compress(json.dumps(pending, separators=(",", ":")).encode())
+                response = session.post(SERVER_URL + "/bulk", data=body, timeout=10)
+                if 400 <= response.status_code < 500 and response.status_code not in RETRY_STATUSES:
+                    # Resending the same reports would be refused forever.
+                    print(f"Dropped {len(pending)} reports rejected by the server: {response.status_code} {response.text[:200]}")
+                else:
+                    response.raise_for_status()
+                    print(f"Synced: {response.status_code}")
+                pending = []
         except Exception as e:
             print(f"Error: {e}")
+            pending = pending[-MAX_PENDING:]
         time.sleep(5)  # Sync every 5 seconds
 
-sync_with_server()
+if __name__ == "__main__":
+    sync_with_server()
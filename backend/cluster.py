@@ -0,0 +1,153 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+def _lock(f, blocking=True):
+    """Take an exclusive lock on an open file; returns False if non-blocking and already held"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+    except OSError:
+        if blocking:
+            raise
+        return False
+    return True
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on path for the duration of the block, across processes"""
+    with open(path, "a+") as f:
+        _lock(f)
+        # Closing the file releases the lock.
+        yield
+
+
+class Leader:
+    """One process out of several sharing a database, chosen by a lock file.
+
+    acquire() never blocks; whoever holds the lock keeps it until the process
+    exits, at which point the OS releases it and another worker's next
+    acquire() takes over.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    @property
+    def is_leader(self):
+        return self._file is not None
+
+    def acquire(self):
+        if self._file is not None:
+            return True
+        f = open(self.path, "a+")
+        if not _lock(f, blocking=False):
+            f.close()
+            return False
+        f.seek(0)
+        f.truncate()
+        f.write(f"{os.getpid()}\n")
+        f.flush()
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class StateFollower:
+    """Keeps this worker's LatestState in step with commits made by other workers.
+
+    Every interval seconds it checks PRAGMA data_version, which changes only
+    when another connection has committed, and only then asks
+    latest_state.refresh() for the samples written since the last check.
+    on_change(version, rows) gets the rows that changed, so live streams
+    connected to this worker see other workers' ingest too, and
+    on_samples(samples) every new sample. on_tick() runs on every poll
+    (used for leader hand-over).
+    """
+
+    def __init__(self, db_file, latest_state, on_change=None, interval=0.5, on_tick=None, on_samples=None):
+        self.db_file = db_file
+        self.latest_state = latest_state
+        self.on_change = on_change
+        self.on_samples = on_samples
+        self.on_tick = on_tick
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._counters = {"polls": 0, "refreshes": 0, "rows": 0, "errors": 0}
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="state-follower", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute("PRAGMA busy_timeout = 5000")
+        return conn
+
+    def poll(self, conn, last_version):
+        """One check; returns the data_version seen"""
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        with self._lock:
+            self._counters["polls"] += 1
+        if data_version == last_version:
+            return data_version
+        version, changed, samples = self.latest_state.refresh(conn)
+        with self._lock:
+            self._counters["refreshes"] += 1
+            self._counters["rows"] += len(changed)
+        if changed and self.on_change:
+            self.on_change(version, changed)
+        if samples and self.on_samples:
+            self.on_samples(samples)
+        return data_version
+
+    def _run(self):
+        conn = self._connect()
+        last_version = None
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    if self.on_tick:
+                        self.on_tick()
+                    last_version = self.poll(conn, last_version)
+                except Exception as e:
+                    with self._lock:
+                        self._counters["errors"] += 1
+                    print(f"Error following shared state: {e}")
+        finally:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._counters)
+        result["running"] = bool(self._thread and self._thread.is_alive())
+        result["interval"] = self.interval
+        return result
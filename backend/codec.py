@@ -0,0 +1,159 @@
+import json
+import zlib
+from functools import lru_cache
+from typing import List
+
+from pydantic import TypeAdapter, ValidationError
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Upper bound on a decompressed request body, so a small compressed upload
+# cannot expand into an arbitrarily large one.
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+JSON_TYPE = "application/json"
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/ndjson")
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+
+class BodyError(ValueError):
+    """Raised when a request body cannot be decoded"""
+
+
+def decompress(body, content_encoding):
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding in ("identity", ""):
+        data = body
+    elif encoding in ("gzip", "x-gzip", "deflate"):
+        wbits = zlib.MAX_WBITS | 16 if encoding != "deflate" else zlib.MAX_WBITS
+        decoder = zlib.decompressobj(wbits)
+        try:
+            data = decoder.decompress(body, MAX_BODY_BYTES)
+        except zlib.error as e:
+            raise BodyError(f"Invalid {encoding} body: {e}")
+        if decoder.unconsumed_tail:
+            raise BodyError("Decompressed body too large")
+    elif encoding == "zstd":
+        if zstandard is None:
+            raise BodyError("zstd bodies need the zstandard package")
+        try:
+            data = zstandard.ZstdDecompressor().decompress(body, max_output_size=MAX_BODY_BYTES)
+        except zstandard.ZstdError as e:
+            raise BodyError(f"Invalid zstd body: {e}")
+    else:
+        raise BodyError(f"Unsupported Content-Encoding: {content_encoding}")
+    if len(data) > MAX_BODY_BYTES:
+        raise BodyError("Body too large")
+    return data
+
+
+def _media_type(content_type):
+    return (content_type or JSON_TYPE).split(";")[0].strip().lower()
+
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def dumps(obj):
+    """Compact JSON as bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+def _unpack(data):
+    if msgpack is None:
+        raise BodyError("MessagePack bodies need the msgpack package")
+    try:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    except (ValueError, msgpack.UnpackException) as e:
+        raise BodyError(f"Invalid MessagePack: {e}")
+
+
+def _as_list(records):
+    if isinstance(records, dict):
+        return [records]
+    if not isinstance(records, list):
+        raise BodyError("Expected an array of reports")
+    return records
+
+
+def decode_records(body, content_type=None, content_encoding=None):
+    """Decode a JSON array, NDJSON or MessagePack body into a list of objects"""
+    data = decompress(body, content_encoding)
+    media_type = _media_type(content_type)
+    if media_type in MSGPACK_TYPES:
+        return _as_list(_unpack(data))
+    try:
+        if media_type in NDJSON_TYPES:
+            records = [loads(line) for line in data.splitlines() if line.strip()]
+        else:
+            records = loads(data)
+    except ValueError as e:
+        raise BodyError(f"Invalid JSON: {e}")
+    return _as_list(records)
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(model):
+    return TypeAdapter(List[model])
+
+
+def _validate_json(validate, data):
+    try:
+        return validate(data)
+    except ValidationError as e:
+        # Malformed JSON is a bad body, not a bad report.
+        if any(error["type"] == "json_invalid" for error in e.errors()):
+            raise BodyError(e.errors()[0]["msg"])
+        raise
+
+
+def decode_models(body, content_type, content_encoding, model):
+    """Decode and validate reports into model instances.
+
+    JSON is validated by pydantic-core straight from the bytes, so no
+    intermediate dicts are built; NDJSON is validated line by line and
+    MessagePack is unpacked first. Raises BodyError for undecodable bodies
+    and pydantic's ValidationError for reports that do not match the model.
+    """
+    data = decompress(body, content_encoding)
+    media_type = _media_type(content_type)
+    if media_type in MSGPACK_TYPES:
+        return [model.model_validate(record) for record in _as_list(_unpack(data))]
+    if media_type in NDJSON_TYPES:
+        return [_validate_json(model.model_validate_json, line) for line in data.splitlines() if line.strip()]
+    if data.lstrip()[:1] == b"{":
+        return [_validate_json(model.model_validate_json, data)]
+    if data.lstrip()[:1] != b"[":
+        raise BodyError("Expected a JSON array of reports")
+    return _validate_json(_list_adapter(model).validate_json, data)
+
+
+def negotiate(accept):
+    """Media type for a response: MessagePack when the client asks for it and it is available"""
+    if msgpack is not None and accept:
+        for part in accept.split(","):
+            if _media_type(part) in MSGPACK_TYPES:
+                return MSGPACK_TYPES[0]
+    return JSON_TYPE
+
+
+def encode(obj, media_type=JSON_TYPE):
+    if media_type in MSGPACK_TYPES:
+        return msgpack.packb(obj, use_bin_type=True)
+    return dumps(obj)
@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class DeltaGap(Exception):
+    """A change-only message did not follow the last one applied for its session"""
+
+
+# client-agent/delta.py keeps a line-for-line copy of patch(), DeltaGap and
+# this state machine (as DeltaDecoder) for the relay; tests/test_deltas.py
+# runs the same tests against both, so change them together.
+def patch(base, changes, removed=()):
+    """Apply an agent diff without mutating base; untouched sub-dicts are shared"""
+    result = dict(base)
+    for key, value in changes.items():
+        current = result.get(key)
+        if isinstance(value, dict) and isinstance(current, dict):
+            result[key] = patch(current, value)
+        else:
+            result[key] = value
+    for path in removed:
+        node = result
+        for key in path[:-1]:
+            child = node.get(key)
+            if not isinstance(child, dict):
+                node = None
+                break
+            child = dict(child)
+            node[key] = child
+            node = child
+        if node is not None and path:
+            node.pop(path[-1], None)
+    return result
+
+
+class DeltaState:
+    """Reconstructs full reports from the agents' change-only messages.
+
+    Each agent session starts with a full report and then sends diffs
+    numbered seq + 1, seq + 2, ... A diff for an unknown session or with a
+    skipped number cannot be applied; apply_many() stops there and the
+    caller tells the agent to resync. Sessions idle for longer than ttl
+    seconds, or beyond max_sessions, are forgotten (oldest first) and simply
+    resync on their next message.
+    """
+
+    def __init__(self, max_sessions=100000, ttl=3600.0):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.full = 0
+        self.deltas = 0
+        self.resyncs = 0
+
+    def _expire(self, now):
+        while self._sessions:
+            session, (_, _, seen) = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - seen <= self.ttl:
+                break
+            del self._sessions[session]
+
+    def _apply(self, message, staged):
+        session, seq = message.get("session"), message.get("seq")
+        if not isinstance(session, str) or not isinstance(seq, int):
+            raise ValueError("Delta messages need a session string and an integer seq")
+        if "full" in message:
+            return session, seq, message["full"]
+        current = staged.get(session) or self._sessions.get(session)
+        if current is None or seq != current[0] + 1:
+            raise DeltaGap(session)
+        return session, seq, patch(current[1], message.get("set") or {}, message.get("unset") or ())
+
+    def apply_many(self, messages, validate, accept=None):
+        """Apply messages in order; returns (validated reports, resync needed).
+
+        validate(report dict) checks a reconstructed report, returns what to
+        keep, and may raise. Session updates are staged and only kept once
+        the batch is accepted: up to a gap (the reports before it are
+        returned with resync set), or to the end, and once accept(reports)
+        has returned. If anything raises, no session moves, so the agent's
+        resend of the batch still applies.
+        """
+        reports = []
+        staged = {}
+        counts = {"full": 0, "deltas": 0}
+        resync = False
+        now = time.monotonic()
+        with self._lock:
+            for message in messages:
+                if not isinstance(message, dict):
+                    raise ValueError("Expected an array of delta messages")
+                try:
+                    session, seq, report = self._apply(message, staged)
+                except DeltaGap:
+                    self.resyncs += 1
+                    resync = True
+                    break
+                reports.append(validate(report))
+                staged[session] = (seq, report, now)
+                counts["full" if "full" in message else "deltas"] += 1
+            if accept is not None:
+                accept(reports)
+            for session, state in staged.items():
+                self._sessions[session] = state
+                self._sessions.move_to_end(session)
+            self.full += counts["full"]
+            self.deltas += counts["deltas"]
+            self._expire(now)
+        return reports, resync
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "full": self.full,
+                "deltas": self.deltas,
+                "resyncs": self.resyncs,
+            }
@@ -0,0 +1,191 @@
+import asyncio
+import heapq
+import os
+import threading
+import time
+from datetime import datetime
+
+import psutil
+
+GB = 1024 ** 3
+PROC_NET_FILES = ("/proc/net/tcp", "/proc/net/tcp6", "/proc/net/udp", "/proc/net/udp6")
+
+
+def _gb(value):
+    return f"{value / GB:.1f}GB"
+
+
+def _mhz(value):
+    return f"{value:.1f}MHz" if value else "Unknown"
+
+
+def count_connections():
+    """Count sockets without building a psutil connection object for each one"""
+    if all(os.path.exists(path) for path in PROC_NET_FILES):
+        total = 0
+        for path in PROC_NET_FILES:
+            with open(path, "rb") as f:
+                total += max(0, sum(1 for _ in f) - 1)  # minus the header line
+        return total
+    try:
+        return len(psutil.net_connections())
+    except (psutil.AccessDenied, OSError):
+        return None
+
+
+class ProcessSampler:
+    """Walks the process table in the background so cpu_percent has a baseline.
+
+    psutil reports 0.0 the first time cpu_percent() is read on a Process;
+    process_iter() caches Process objects between calls, so sampling every
+    `interval` seconds keeps a meaningful top-N ready for diagnose requests.
+    """
+
+    def __init__(self, interval=5.0, top_n=5):
+        self.interval = interval
+        self.top_n = top_n
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._latest = None
+
+    def sample(self):
+        # Keep the system-wide per-core baseline fresh as well.
+        psutil.cpu_percent(percpu=True)
+        total = running = 0
+        candidates = []
+        for p in psutil.process_iter(["name", "status", "cpu_percent", "memory_percent"]):
+            info = p.info
+            total += 1
+            if info["status"] == psutil.STATUS_RUNNING:
+                running += 1
+            candidates.append(info)
+        top = heapq.nlargest(self.top_n, candidates, key=lambda info: info["cpu_percent"] or 0.0)
+        result = {
+            "total": total,
+            "running": running,
+            "top_cpu": [
+                {
+                    "name": info["name"],
+                    "cpu_percent": info["cpu_percent"] or 0.0,
+                    "memory_percent": info["memory_percent"] or 0.0,
+                }
+                for info in top
+            ],
+        }
+        with self._lock:
+            self._latest = result
+        return result
+
+    def latest(self):
+        with self._lock:
+            latest = self._latest
+        return latest if latest is not None else self.sample()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Error sampling processes: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="process-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+            self._thread = None
+
+
+class DiagnosticsEngine:
+    """Local diagnostics snapshot, gathered once per source and cached for ttl seconds.
+
+    Concurrent requests while a collection is running all await the same
+    task instead of starting their own.
+    """
+
+    def __init__(self, ttl=5.0, sampler=None):
+        self.ttl = ttl
+        self.sampler = sampler or ProcessSampler()
+        self.physical_cores = psutil.cpu_count(logical=False)
+        self.total_cores = psutil.cpu_count(logical=True)
+        self._cached = None
+        self._cached_at = 0.0
+        self._task = None
+        self.collections = 0
+        self.cache_hits = 0
+
+    def collect(self):
+        freq = psutil.cpu_freq()
+        memory = psutil.virtual_memory()
+        disks = []
+        for partition in psutil.disk_partitions():
+            try:
+                usage = psutil.disk_usage(partition.mountpoint)
+            except OSError:
+                continue
+            disks.append({
+                "device": partition.device,
+                "mountpoint": partition.mountpoint,
+                "filesystem_type": partition.fstype,
+                "total": _gb(usage.total),
+                "used": _gb(usage.used),
+                "free": _gb(usage.free),
+            })
+        result = {
+            "cpu_details": {
+                "physical_cores": self.physical_cores,
+                "total_cores": self.total_cores,
+                "max_frequency": _mhz(freq.max if freq else None),
+                "current_frequency": _mhz(freq.current if freq else None),
+                "per_core_usage": [f"{x}%" for x in psutil.cpu_percent(percpu=True)],
+            },
+            "memory_details": {
+                "total": _gb(memory.total),
+                "available": _gb(memory.available),
+                "used": _gb(memory.used),
+                "cached": _gb(getattr(memory, "cached", 0)),
+            },
+            "disk_details": disks,
+            "network": {
+                "interfaces": list(psutil.net_if_stats().keys()),
+                "connections": count_connections(),
+            },
+            "processes": self.sampler.latest(),
+            "timestamp": datetime.now().isoformat()
+        }
+        self._cached = result
+        self._cached_at = time.monotonic()
+        self.collections += 1
+        return result
+
+    def cached(self):
+        if self._cached is not None and time.monotonic() - self._cached_at < self.ttl:
+            return self._cached
+        return None
+
+    async def get(self, run):
+        """Return a fresh snapshot; run(func) executes func off the event loop"""
+        cached = self.cached()
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(run(self.collect))
+        # shield() so one caller disconnecting does not cancel the shared task.
+        return await asyncio.shield(self._task)
+
+    def stats(self):
+        return {
+            "collections": self.collections,
+            "cache_hits": self.cache_hits,
+            "ttl": self.ttl,
+            "age": round(time.monotonic() - self._cached_at, 2) if self._cached is not None else None,
+        }
@@ -0,0 +1,274 @@
+import csv
+import io
+import sqlite3
+from datetime import datetime
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from codec import dumps
+from storage import ROLLUP_METRICS, ROLLUP_TIERS, SCALE, from_epoch, hist_decode, hist_percentile
+
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+SAMPLE_COLUMNS = (
+    "cpu_pct", "cpu_freq", "cpu_temp", "mem_total", "mem_used", "mem_available", "mem_pct",
+    "swap_total", "swap_used", "swap_pct", "disk_pct", "disk_read", "disk_write",
+    "gpu_mem_used", "gpu_mem_total", "proc_total", "proc_running",
+)
+# Stored as hundredths; exported as plain numbers.
+SCALED_COLUMNS = {"cpu_pct", "cpu_temp", "mem_pct", "swap_pct", "disk_pct"}
+
+
+class ExportError(ValueError):
+    """Raised for export parameters that cannot be served"""
+
+
+def parse_time(value):
+    """Epoch seconds or an ISO 8601 timestamp (naive means local time) -> epoch seconds"""
+    if value is None or value == "":
+        return None
+    try:
+        return int(float(value))
+    except ValueError:
+        pass
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        raise ExportError(f"Invalid time {value!r}, expected epoch seconds or ISO 8601")
+
+
+def connect_reader(db_file):
+    conn = sqlite3.connect(db_file, check_same_thread=False)
+    conn.execute("PRAGMA query_only = ON")
+    conn.execute("PRAGMA busy_timeout = 5000")
+    return conn
+
+
+def columns(source):
+    """(name, kind) of every output column for a source, ending with the resume cursor.
+
+    kind is str, time (epoch seconds), int or float.
+    """
+    if source == "samples":
+        values = [(c, "float" if c in SCALED_COLUMNS else "int") for c in SAMPLE_COLUMNS]
+    else:
+        values = [
+            (f"{m}_{stat}", "int" if stat == "n" else "float")
+            for m in ROLLUP_METRICS for stat in ("n", "min", "avg", "max", "p95")
+        ]
+    return [("host", "str"), ("timestamp", "time"), *values, ("cursor", "str")]
+
+
+def _host_ids(conn, hosts):
+    if not hosts:
+        return None
+    marks = ", ".join("?" * len(hosts))
+    rows = conn.execute(f"SELECT id FROM hosts WHERE computer_name IN ({marks})", list(hosts)).fetchall()
+    return [row[0] for row in rows]
+
+
+def _sample_rows(conn, host_ids, start, end, cursor, limit):
+    """Raw samples in id order; the cursor is the last sample id already exported"""
+    where, params = ["s.id > ?"], [_parse_cursor("samples", cursor) or 0]
+    if host_ids is not None:
+        where.append(f"s.host_id IN ({', '.join('?' * len(host_ids))})")
+        params += host_ids
+    if start is not None:
+        where.append("s.ts >= ?")
+        params.append(start)
+    if end is not None:
+        where.append("s.ts < ?")
+        params.append(end)
+    query = (
+        f"SELECT h.computer_name, s.ts, {', '.join('s.' + c for c in SAMPLE_COLUMNS)}, s.id "
+        f"FROM samples s JOIN hosts h ON h.id = s.host_id WHERE {' AND '.join(where)} ORDER BY s.id"
+    )
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    scaled = [c in SCALED_COLUMNS for c in SAMPLE_COLUMNS]
+    for name, ts, *values, sample_id in conn.execute(query, params):
+        yield [
+            name, ts,
+            *(v / SCALE if s and v is not None else v for v, s in zip(values, scaled)),
+            str(sample_id),
+        ]
+
+
+def _parse_cursor(source, cursor):
+    if not cursor:
+        return None
+    try:
+        if source == "samples":
+            return int(cursor)
+        host_id, bucket = cursor.split(":")
+        return int(host_id), int(bucket)
+    except ValueError:
+        raise ExportError(f"Invalid cursor {cursor!r}")
+
+
+def _rollup_rows(conn, table, host_ids, start, end, cursor, limit):
+    """Rollup buckets in (host, bucket) key order; the cursor is "<host_id>:<bucket>" of the last row"""
+    where, params = [], []
+    after = _parse_cursor(table, cursor)
+    if after is not None:
+        where.append("(r.host_id, r.bucket) > (?, ?)")
+        params += after
+    if host_ids is not None:
+        where.append(f"r.host_id IN ({', '.join('?' * len(host_ids))})")
+        params += host_ids
+    if start is not None:
+        where.append("r.bucket >= ?")
+        params.append(start)
+    if end is not None:
+        where.append("r.bucket < ?")
+        params.append(end)
+    stats = ", ".join(f"r.{m}_n, r.{m}_sum, r.{m}_min, r.{m}_max, r.{m}_hist" for m in ROLLUP_METRICS)
+    query = (
+        f"SELECT h.computer_name, r.host_id, r.bucket, {stats} FROM {table} r JOIN hosts h ON h.id = r.host_id"
+        + (f" WHERE {' AND '.join(where)}" if where else "")
+        + " ORDER BY r.host_id, r.bucket"
+    )
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    for name, host_id, bucket, *aggs in conn.execute(query, params):
+        row = [name, bucket]
+        for i in range(len(ROLLUP_METRICS)):
+            n, total, low, high, blob = aggs[i * 5:i * 5 + 5]
+            if not n:
+                row += [0, None, None, None, None]
+                continue
+            p95 = hist_percentile(hist_decode(blob), 0.95, low, high)
+            row += [n, low / SCALE, round(total / n / SCALE, 2), high / SCALE, round(p95 / SCALE, 2)]
+        row.append(f"{host_id}:{bucket}")
+        yield row
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last take()"""
+
+    def __init__(self):
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def _formatter(kinds):
+    times = [i for i, kind in enumerate(kinds) if kind == "time"]
+
+    def text_row(row):
+        for i in times:
+            row[i] = from_epoch(row[i])
+        return row
+    return text_row
+
+
+def _encode_csv(schema, chunks):
+    text_row = _formatter([kind for _, kind in schema])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow([name for name, _ in schema])
+    for chunk in chunks:
+        writer.writerows(map(text_row, chunk))
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _encode_ndjson(schema, chunks):
+    text_row = _formatter([kind for _, kind in schema])
+    names = [name for name, _ in schema]
+    for chunk in chunks:
+        yield b"".join(dumps(dict(zip(names, text_row(row)))) + b"\n" for row in chunk)
+
+
+def _arrow_schema(schema):
+    types = {
+        "str": pyarrow.string(),
+        "time": pyarrow.timestamp("s", tz="UTC"),
+        "int": pyarrow.int64(),
+        "float": pyarrow.float64(),
+    }
+    return pyarrow.schema([(name, types[kind]) for name, kind in schema])
+
+
+def _encode_parquet(schema, chunks):
+    # One row group per chunk; the footer is written when the writer closes.
+    arrow_schema = _arrow_schema(schema)
+    sink = _Sink()
+    writer = pyarrow.parquet.ParquetWriter(sink, arrow_schema)
+    for chunk in chunks:
+        arrays = [
+            pyarrow.array([row[i] for row in chunk], type=field.type) for i, field in enumerate(arrow_schema)
+        ]
+        writer.write_table(pyarrow.Table.from_arrays(arrays, schema=arrow_schema))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+def stream_export(db_file, fmt, source="samples", hosts=None, start=None, end=None, cursor=None, limit=None,
+                  chunk_size=2000):
+    """Generator of encoded export chunks; reads chunk_size rows at a time from one connection.
+
+    Rows come in a stable key order and each one ends with a cursor value;
+    passing the last cursor received resumes the export right after that
+    row, so an interrupted download (or a paged one, with limit) can pick
+    up where it stopped. Memory use is bounded by chunk_size whatever the
+    size of the export.
+    """
+    validate(fmt, source, cursor)
+    conn = connect_reader(db_file)
+    try:
+        host_ids = _host_ids(conn, hosts)
+        if host_ids == []:
+            rows = iter(())
+        elif source == "samples":
+            rows = _sample_rows(conn, host_ids, start, end, cursor, limit)
+        else:
+            rows = _rollup_rows(conn, source, host_ids, start, end, cursor, limit)
+        encoder = {"csv": _encode_csv, "ndjson": _encode_ndjson, "parquet": _encode_parquet}[fmt]
+        yield from encoder(columns(source), _chunks(rows, chunk_size))
+    finally:
+        conn.close()
+
+
+def validate(fmt, source, cursor=None):
+    """Raise ExportError for parameters that would fail mid-stream"""
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format {fmt!r}, expected one of {', '.join(FORMATS)}")
+    if fmt == "parquet" and pyarrow is None:
+        raise ExportError("Parquet export needs the pyarrow package")
+    if source != "samples" and source not in ROLLUP_TIERS:
+        raise ExportError(f"Unknown source {source!r}, expected samples or one of {', '.join(ROLLUP_TIERS)}")
+    _parse_cursor(source, cursor)
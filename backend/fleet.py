@@ -0,0 +1,347 @@
+import math
+import re
+import threading
+import time
+
+from storage import (
+    ROLLUP_METRICS, SCALE, decode_pct, disk_percent, encode_pct, from_epoch, hist_bin, hist_percentile,
+    hist_unpack, to_epoch,
+)
+
+STATS = ("last", "ewma", "min", "avg", "max", "p95", "samples")
+ATTRS = ("os", "os_version", "architecture", "processor", "total_cores")
+
+_FILTER = re.compile(r"^\s*([\w.]+)\s*(>=|<=|!=|==|=|>|<)\s*(.*?)\s*$")
+
+
+def parse_filter(text):
+    """"swap.last>50" or "os==Linux" -> (field, op, value); raises ValueError"""
+    match = _FILTER.match(text)
+    if not match:
+        raise ValueError(f"Invalid filter {text!r}, expected <field><op><value>")
+    field, op, value = match.groups()
+    _check_field(field)
+    return field, "==" if op == "=" else op, value
+
+
+def _check_field(field):
+    metric, _, stat = field.partition(".")
+    if stat:
+        if metric not in ROLLUP_METRICS or stat not in STATS:
+            raise ValueError(f"Unknown field {field!r}; metrics are {', '.join(ROLLUP_METRICS)}, "
+                             f"stats are {', '.join(STATS)}")
+    elif field not in ("host", "last_seen", *ATTRS):
+        raise ValueError(f"Unknown field {field!r}")
+
+
+def _get(row, field):
+    metric, _, stat = field.partition(".")
+    if not stat:
+        return row.get(field)
+    summary = row.get(metric)
+    return summary.get(stat) if summary else None
+
+
+def _matches(value, op, expected):
+    """Compare numerically when the field holds a number, as text otherwise"""
+    if value is None:
+        return op == "!="
+    if isinstance(value, (int, float)):
+        try:
+            expected = float(expected)
+        except ValueError:
+            return op == "!="
+    else:
+        value = str(value)
+    if op == "==":
+        return value == expected
+    if op == "!=":
+        return value != expected
+    if op == ">":
+        return value > expected
+    if op == ">=":
+        return value >= expected
+    if op == "<":
+        return value < expected
+    return value <= expected
+
+
+class _Host:
+    __slots__ = ("attrs", "last_ts", "last", "ewma", "slots", "totals", "summary", "valid_until")
+
+    def __init__(self, nslots):
+        self.attrs = None
+        self.last_ts = None
+        self.last = [None] * len(ROLLUP_METRICS)
+        self.ewma = [None] * len(ROLLUP_METRICS)
+        # Ring of (bucket start, per-metric [n, sum, min, max, packed hist]).
+        self.slots = [None] * nslots
+        # Per-metric [n, sum, packed hist] over every slot in the ring.
+        self.totals = [[0, 0, 0] for _ in ROLLUP_METRICS]
+        self.summary = None
+        self.valid_until = 0
+
+
+class FleetSummaries:
+    """Running per-host summaries for fleet-wide queries.
+
+    Every sample updates, per metric (ROLLUP_METRICS), the host's last
+    value, a time-weighted EWMA and one bucket of a ring covering the last
+    window seconds. Buckets hold count/sum/min/max and a histogram packed
+    into one integer (the rollup layout), and the ring keeps running
+    totals, so dropping a bucket that aged out is a subtraction. A host's
+    summary (min/avg/max/p95 over the window) is rebuilt only after it
+    changed or a bucket expired, so a query over thousands of hosts is a
+    filter and a sort over cached dicts.
+    """
+
+    def __init__(self, window=3600, buckets=12, ewma_seconds=300):
+        self.window = int(window)
+        self.nslots = int(buckets)
+        self.width = max(1, self.window // self.nslots)
+        self.ewma_seconds = ewma_seconds
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _record(self, host):
+        record = self._hosts.get(host)
+        if record is None:
+            record = self._hosts[host] = _Host(self.nslots)
+        return record
+
+    def _slot(self, record, bucket):
+        index = bucket // self.width % self.nslots
+        slot = record.slots[index]
+        if slot is not None and slot[0] == bucket:
+            return slot[1]
+        if slot is not None:
+            if slot[0] > bucket:
+                return None  # older than anything the ring still holds
+            self._evict(record, index)
+        aggs = [[0, 0, None, None, 0] for _ in ROLLUP_METRICS]
+        record.slots[index] = (bucket, aggs)
+        return aggs
+
+    @staticmethod
+    def _evict(record, index):
+        _, aggs = record.slots[index]
+        for total, (n, value_sum, _, _, hist) in zip(record.totals, aggs):
+            total[0] -= n
+            total[1] -= value_sum
+            total[2] -= hist
+        record.slots[index] = None
+
+    def _observe(self, host, ts, values, attrs=None):
+        """values are scaled integers (storage.encode_pct) in ROLLUP_METRICS order"""
+        record = self._record(host)
+        if attrs is not None:
+            record.attrs = attrs
+        if record.last_ts is not None and ts <= record.last_ts:
+            return
+        dt = ts - record.last_ts if record.last_ts is not None else None
+        record.last_ts = ts
+        alpha = 1 - math.exp(-dt / self.ewma_seconds) if dt else 1.0
+        aggs = self._slot(record, ts - ts % self.width)
+        for i, value in enumerate(values):
+            if value is None:
+                continue
+            pct = value / SCALE
+            record.last[i] = pct
+            ewma = record.ewma[i]
+            record.ewma[i] = pct if ewma is None else ewma + alpha * (pct - ewma)
+            if aggs is None:
+                continue
+            agg, total = aggs[i], record.totals[i]
+            bit = 1 << (32 * hist_bin(value))
+            agg[0] += 1
+            agg[1] += value
+            agg[2] = value if agg[2] is None else min(agg[2], value)
+            agg[3] = value if agg[3] is None else max(agg[3], value)
+            agg[4] += bit
+            total[0] += 1
+            total[1] += value
+            total[2] += bit
+        record.summary = None
+
+    def observe_batch(self, batch):
+        """Ingest listener: fold a committed batch of HardwareData"""
+        now = time.time()
+        with self._lock:
+            for data in batch:
+                info = data.system_info
+                self._observe(
+                    info.computer_name,
+                    to_epoch(data.timestamp, now),
+                    (
+                        encode_pct(data.cpu.total_cpu_usage),
+                        encode_pct(data.memory.percentage),
+                        encode_pct(data.memory.swap_percent),
+                        encode_pct(disk_percent(data)),
+                        encode_pct(data.cpu.temperature),
+                    ),
+                    {
+                        "os": info.os,
+                        "os_version": info.os_version,
+                        "architecture": info.architecture,
+                        "processor": info.processor,
+                        "total_cores": data.cpu.total_cores,
+                    },
+                )
+
+    def observe_many(self, samples):
+        """Fold (host, ts, (cpu, ram, disk, swap, temp)) samples committed by other workers"""
+        with self._lock:
+            for host, ts, (cpu, ram, disk, swap, temp) in samples:
+                self._observe(host, ts, tuple(map(encode_pct, (cpu, ram, swap, disk, temp))))
+
+    def missing_attrs(self):
+        with self._lock:
+            return [host for host, record in self._hosts.items() if record.attrs is None]
+
+    def load_attrs(self, conn, hosts=None):
+        """Fill in host attributes from the hosts table (all hosts, or just the named ones)"""
+        query = "SELECT computer_name, " + ", ".join(ATTRS) + " FROM hosts"
+        rows = conn.execute(query).fetchall()
+        wanted = set(hosts) if hosts is not None else None
+        with self._lock:
+            for name, *values in rows:
+                if wanted is not None and name not in wanted:
+                    continue
+                self._record(name).attrs = dict(zip(ATTRS, values))
+                self._hosts[name].summary = None
+
+    def load(self, conn, now=None):
+        """Warm start: attributes, newest sample and the window's 1-minute rollups from the database"""
+        now = int(now if now is not None else time.time())
+        self.load_attrs(conn)
+        columns = ", ".join(f"{m}_n, {m}_sum, {m}_min, {m}_max, {m}_hist" for m in ROLLUP_METRICS)
+        rollups = conn.execute(
+            f"SELECT h.computer_name, r.bucket, {columns} FROM rollup_1m r JOIN hosts h ON h.id = r.host_id "
+            "WHERE r.bucket > ? ORDER BY r.bucket",
+            (now - self.window,),
+        ).fetchall()
+        latest = conn.execute("""
+            SELECT h.computer_name, s.ts, s.cpu_pct, s.mem_pct, s.swap_pct, s.disk_pct, s.cpu_temp
+            FROM hosts h
+            JOIN samples s ON s.id = (
+                SELECT id FROM samples WHERE host_id = h.id ORDER BY ts DESC LIMIT 1
+            )
+        """).fetchall()
+        with self._lock:
+            for name, bucket, *row in rollups:
+                record = self._record(name)
+                aggs = self._slot(record, bucket - bucket % self.width)
+                if aggs is None:
+                    continue
+                for i in range(len(ROLLUP_METRICS)):
+                    n, value_sum, low, high, blob = row[i * 5:i * 5 + 5]
+                    if not n:
+                        continue
+                    agg, total = aggs[i], record.totals[i]
+                    hist = int.from_bytes(blob or b"", "little")
+                    agg[0] += n
+                    agg[1] += value_sum
+                    agg[2] = low if agg[2] is None else min(agg[2], low)
+                    agg[3] = high if agg[3] is None else max(agg[3], high)
+                    agg[4] += hist
+                    total[0] += n
+                    total[1] += value_sum
+                    total[2] += hist
+            for name, ts, *values in latest:
+                record = self._record(name)
+                record.last_ts = ts
+                record.last = [decode_pct(v) for v in values]
+                record.ewma = list(record.last)
+                record.summary = None
+
+    def _summary(self, host, record, now):
+        if record.summary is not None and now < record.valid_until:
+            return record.summary
+        expires = float("inf")
+        for index, slot in enumerate(record.slots):
+            if slot is None:
+                continue
+            if slot[0] + self.width <= now - self.window:
+                self._evict(record, index)
+            else:
+                expires = min(expires, slot[0] + self.width + self.window)
+        summary = {"host": host, **(record.attrs or dict.fromkeys(ATTRS))}
+        summary["last_seen"] = from_epoch(record.last_ts) if record.last_ts is not None else None
+        for i, metric in enumerate(ROLLUP_METRICS):
+            n, value_sum, hist = record.totals[i]
+            stats = {
+                "last": record.last[i],
+                "ewma": round(record.ewma[i], 2) if record.ewma[i] is not None else None,
+                "min": None, "avg": None, "max": None, "p95": None,
+                "samples": n,
+            }
+            if n:
+                aggs = [slot[1][i] for slot in record.slots if slot is not None and slot[1][i][0]]
+                low = min(agg[2] for agg in aggs)
+                high = max(agg[3] for agg in aggs)
+                stats["min"] = low / SCALE
+                stats["max"] = high / SCALE
+                stats["avg"] = round(value_sum / n / SCALE, 2)
+                stats["p95"] = round(hist_percentile(hist_unpack(hist), 0.95, low, high) / SCALE, 2)
+            summary[metric] = stats
+        record.summary = summary
+        record.valid_until = expires
+        return summary
+
+    def summaries(self, now=None):
+        now = now if now is not None else time.time()
+        with self._lock:
+            return [self._summary(host, record, now) for host, record in self._hosts.items()]
+
+    def query(self, sort="host", descending=False, filters=(), offset=0, limit=50, now=None):
+        """Filter, sort and page the per-host summaries.
+
+        filters are (field, op, value) from parse_filter(); fields are host
+        attributes (host, os, architecture, ...) or <metric>.<stat> such as
+        cpu.p95 or swap.last. Hosts without a value for the sort field come
+        last in either direction.
+        """
+        _check_field(sort)
+        rows = self.summaries(now)
+        for field, op, value in filters:
+            rows = [row for row in rows if _matches(_get(row, field), op, value)]
+        present = [row for row in rows if _get(row, sort) is not None]
+        missing = [row for row in rows if _get(row, sort) is None]
+        present.sort(key=lambda row: _get(row, sort), reverse=descending)
+        ordered = present + missing
+        return {
+            "total": len(ordered),
+            "offset": offset,
+            "limit": limit,
+            "window_seconds": self.window,
+            "hosts": ordered[offset:offset + limit],
+        }
+
+    def groups(self, by="os", field="cpu.last", filters=(), now=None):
+        """Hosts grouped by an attribute, with count/min/avg/max of field per group"""
+        _check_field(by)
+        _check_field(field)
+        rows = self.summaries(now)
+        for name, op, value in filters:
+            rows = [row for row in rows if _matches(_get(row, name), op, value)]
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(_get(row, by), []).append(_get(row, field))
+        result = []
+        for key, values in grouped.items():
+            values = [v for v in values if isinstance(v, (int, float))]
+            result.append({
+                by: key,
+                "hosts": len(grouped[key]),
+                "min": min(values) if values else None,
+                "avg": round(sum(values) / len(values), 2) if values else None,
+                "max": max(values) if values else None,
+            })
+        result.sort(key=lambda group: (group[by] is None, str(group[by])))
+        return {"by": by, "field": field, "window_seconds": self.window, "groups": result}
+
+    def stats(self):
+        with self._lock:
+            hosts = len(self._hosts)
+            cached = sum(record.summary is not None for record in self._hosts.values())
+        return {"hosts": hosts, "cached_summaries": cached, "window_seconds": self.window, "buckets": self.nslots}
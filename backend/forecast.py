@@ -0,0 +1,468 @@
+import math
+import sqlite3
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from storage import PARTITION_ROLLUP, SCALE, disk_percent, from_epoch, to_epoch
+
+HOUR = 3600
+DAY = 86400
+KINDS = ("mem", "swap", "disk", "partition")
+# Beyond this a "full at" date means nothing (and may not fit a timestamp).
+MAX_DAYS = 100 * 365
+# Weighted sums kept per series for the least-squares fit: w, wx, wy, wxx, wxy, wyy.
+STATS = 6
+
+
+def _zeros(size):
+    return np.zeros((STATS, size)) if np is not None else [[0.0] * size for _ in range(STATS)]
+
+
+def _grow(sums, size):
+    if np is not None:
+        if sums.shape[1] >= size:
+            return sums
+        grown = np.zeros((STATS, max(size, 2 * sums.shape[1])))
+        grown[:, :sums.shape[1]] = sums
+        return grown
+    for column in sums:
+        column.extend([0.0] * (size - len(column)))
+    return sums
+
+
+def _decay(sums, factor):
+    if np is not None:
+        sums *= factor
+        return
+    for column in sums:
+        column[:] = [value * factor for value in column]
+
+
+def _accumulate(sums, index, x, y, w):
+    """Add weighted points (parallel sequences) to their series' sums"""
+    if np is not None:
+        size = sums.shape[1]
+        wx, wy = w * x, w * y
+        for k, values in enumerate((w, wx, wy, wx * x, wx * y, wy * y)):
+            sums[k] += np.bincount(index, weights=values, minlength=size)
+        return
+    sw, swx, swy, swxx, swxy, swyy = sums
+    for i, xi, yi, wi in zip(index, x, y, w):
+        sw[i] += wi
+        swx[i] += wi * xi
+        swy[i] += wi * yi
+        swxx[i] += wi * xi * xi
+        swxy[i] += wi * xi * yi
+        swyy[i] += wi * yi * yi
+
+
+def _solve(sums, size):
+    """Slope, intercept and r² of every series' weighted fit; NaN where undefined"""
+    if np is not None:
+        w, x, y, xx, xy, yy = sums[:, :size]
+        spread = w * xx - x * x
+        cov = w * xy - x * y
+        var_y = w * yy - y * y
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = np.where(spread > 1e-9 * w * w, cov / spread, np.nan)
+            intercept = (y - slope * x) / w
+            r2 = np.where(var_y > 1e-9 * w * w, cov * cov / (spread * var_y), np.nan)
+        return slope, intercept, r2
+    slope, intercept, r2 = [], [], []
+    for w, x, y, xx, xy, yy in zip(*(column[:size] for column in sums)):
+        spread, cov, var_y = w * xx - x * x, w * xy - x * y, w * yy - y * y
+        b = cov / spread if spread > 1e-9 * w * w else math.nan
+        slope.append(b)
+        intercept.append((y - b * x) / w if w else math.nan)
+        r2.append(cov * cov / (spread * var_y) if var_y > 1e-9 * w * w and not math.isnan(b) else math.nan)
+    return slope, intercept, r2
+
+
+def _number(value, digits):
+    if value is None or math.isnan(value) or math.isinf(value):
+        return None
+    return round(float(value), digits) if digits else int(round(value))
+
+
+class ForecastEngine:
+    """Usage trends per host (mem, swap, disk) and per partition, for "what fills up next".
+
+    Each series is fitted by least squares over hourly averages: host
+    metrics from rollup_1h, partitions from partition_rollup_1h. Older
+    hours count for less, halving every half_life seconds, so the fit
+    only needs six running sums per series: when an hour closes the sums
+    are scaled down and that hour's points added. The last settle seconds
+    of closed hours are read again on every refresh, and a point whose
+    hour changed since (late batches, spool replays) is swapped for its
+    new value; data landing in an hour older than that is not counted.
+    Every refresh and every fit is one batched pass over all series
+    (NumPy when installed). Ingest only updates each series'
+    current level; the days-until-full ranking is recomputed from the
+    cached fit when it is next asked for.
+    """
+
+    def __init__(self, db_file, half_life=7 * DAY, lookback=21 * DAY, interval=300.0, min_hours=6, full_pct=100.0,
+                 settle=6 * HOUR):
+        self.db_file = db_file
+        self.half_life = half_life
+        self.lookback = lookback
+        self.settle = settle
+        self.interval = interval
+        self.min_hours = min_hours
+        self.full_pct = full_pct
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._host_ids = {}
+        self._names = {}
+        self._partitions = {}  # (host_id, mountpoint) -> partition id
+        self._partition_info = {}  # partition id -> (host_id, mountpoint)
+        self._index = {}  # ("mem", host_id) / ("partition", partition_id) -> series index
+        self._series = []  # (kind, host_id, partition_id)
+        self._sums = _zeros(0)
+        self._hours = []
+        self._current = []
+        self._current_ts = []
+        self._capacity = []
+        self._settling = {}  # (series index, bucket) -> value folded in, for hours still re-read
+        self._origin = None
+        self._until = None
+        self._fit = None
+        self._view = None
+        self._counters = {
+            "refreshes": 0,
+            "points": 0,
+            "errors": 0,
+            "last_refresh": None,
+            "refresh_ms": 0.0,
+            "fits": 0,
+            "fit_ms": 0.0,
+        }
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="forecast", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute("PRAGMA busy_timeout = 5000")
+        try:
+            delay = 0
+            while not self._stop.wait(delay):
+                delay = self.interval
+                try:
+                    self.refresh(conn)
+                except Exception as e:
+                    with self._lock:
+                        self._counters["errors"] += 1
+                    print(f"Forecast refresh failed: {e}")
+        finally:
+            conn.close()
+
+    def _series_id(self, key, kind, host_id, partition_id=None):
+        i = self._index.get(key)
+        if i is None:
+            i = self._index[key] = len(self._series)
+            self._series.append((kind, host_id, partition_id))
+            self._hours.append(0)
+            self._current.append(math.nan)
+            self._current_ts.append(0)
+            self._capacity.append(None)
+        return i
+
+    def refresh(self, conn, now=None):
+        """Fold every hour closed since the last refresh into the fits; returns the points added"""
+        started = time.perf_counter()
+        now = int(now if now is not None else time.time())
+        closed = now - now % HOUR
+        with self._lock:
+            start = closed - self.lookback
+            if self._until is not None:
+                # New hours since the last refresh, plus the ones still settling.
+                start = max(start, min(self._until, closed - self.settle))
+        if closed <= start:
+            return 0
+        hosts = conn.execute("SELECT id, computer_name FROM hosts").fetchall()
+        partitions = conn.execute("SELECT id, host_id, mountpoint FROM partitions").fetchall()
+        # CROSS JOIN keeps hosts (partitions) as the outer loop, so each is an
+        # index range on (key, bucket) rather than a scan of the whole table.
+        host_rows = conn.execute("""
+            SELECT r.host_id, r.bucket, r.mem_n, r.mem_sum, r.swap_n, r.swap_sum, r.disk_n, r.disk_sum
+            FROM hosts h CROSS JOIN rollup_1h r ON r.host_id = h.id
+            WHERE r.bucket >= ? AND r.bucket < ?
+        """, (start, closed)).fetchall()
+        partition_rows = conn.execute(f"""
+            SELECT r.partition_id, r.bucket, r.n, r.pct_sum, r.total_max
+            FROM partitions p CROSS JOIN {PARTITION_ROLLUP} r ON r.partition_id = p.id
+            WHERE r.bucket >= ? AND r.bucket < ? AND r.n > 0
+        """, (start, closed)).fetchall()
+        with self._lock:
+            for host_id, name in hosts:
+                self._host_ids[name] = host_id
+                self._names[host_id] = name
+            for partition_id, host_id, mountpoint in partitions:
+                self._partitions[host_id, mountpoint] = partition_id
+                self._partition_info[partition_id] = (host_id, mountpoint)
+            if self._origin is None:
+                self._origin = closed
+            elif closed > self._until:
+                _decay(self._sums, 0.5 ** ((closed - self._until) / self.half_life))
+            keep_from = closed - self.settle
+            self._settling = {key: value for key, value in self._settling.items() if key[1] >= keep_from}
+            points = self._add_rows(host_rows, partition_rows, closed)
+            self._until = max(closed, self._until or closed)
+            self._fit = self._view = None
+            self._counters["refreshes"] += 1
+            self._counters["points"] += points
+            self._counters["last_refresh"] = now
+            self._counters["refresh_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return points
+
+    def _settle(self, index, buckets, y, closed):
+        """Rows of hours still being re-read: records their values and returns (row, previous value)
+        for those folded in before"""
+        keep_from = closed - self.settle
+        if np is not None:
+            rows = np.flatnonzero(buckets >= keep_from).tolist()
+        else:
+            rows = [k for k, bucket in enumerate(buckets) if bucket >= keep_from]
+        previous = []
+        for k in rows:
+            key = (int(index[k]), int(buckets[k]))
+            old = self._settling.get(key)
+            if old is not None:
+                previous.append((k, old))
+            self._settling[key] = float(y[k])
+        return previous
+
+    def _add_rows(self, host_rows, partition_rows, closed):
+        groups = []  # (kind, keys, buckets, y, sizes) as parallel sequences; sizes only for partitions
+        if np is not None:
+            if host_rows:
+                rows = np.array(host_rows, dtype=float)
+                for k, kind in enumerate(("mem", "swap", "disk")):
+                    n, total = rows[:, 2 + 2 * k], rows[:, 3 + 2 * k]
+                    keep = n > 0
+                    groups.append((kind, rows[keep, 0], rows[keep, 1], total[keep] / n[keep] / SCALE, None))
+            if partition_rows:
+                rows = np.array(partition_rows, dtype=float)
+                groups.append(("partition", rows[:, 0], rows[:, 1], rows[:, 3] / rows[:, 2] / SCALE, rows[:, 4]))
+        else:
+            for k, kind in enumerate(("mem", "swap", "disk")):
+                rows = [(row[0], row[1], row[3 + 2 * k] / row[2 + 2 * k] / SCALE) for row in host_rows if row[2 + 2 * k]]
+                groups.append((kind, *zip(*rows), None) if rows else (kind, (), (), (), None))
+            rows = [(row[0], row[1], row[3] / row[2] / SCALE, row[4]) for row in partition_rows]
+            groups.append(("partition", *zip(*rows)) if rows else ("partition", (), (), (), None))
+        points = 0
+        for kind, keys, buckets, y, sizes in groups:
+            if not len(y):
+                continue
+            if np is not None:
+                unique, inverse = np.unique(keys.astype(np.int64), return_inverse=True)
+                index = np.array([self._key_id(kind, int(key)) for key in unique], dtype=np.int64)[inverse]
+                self._sums = _grow(self._sums, len(self._series))
+                middle = buckets + HOUR / 2
+                x, w = (middle - self._origin) / DAY, 0.5 ** ((closed - middle) / self.half_life)
+                previous = self._settle(index, buckets, y, closed)
+                if previous:
+                    # Take out what these hours contributed last time before adding them again.
+                    rows = np.array([k for k, _ in previous], dtype=np.int64)
+                    _accumulate(self._sums, index[rows], x[rows], np.array([old for _, old in previous]), -w[rows])
+                _accumulate(self._sums, index, x, y, w)
+                counts = np.bincount(index, minlength=len(self._series))
+                if previous:
+                    counts -= np.bincount(index[rows], minlength=len(self._series))
+                for i in np.flatnonzero(counts).tolist():
+                    self._hours[i] += int(counts[i])
+                # Only each series' newest bucket matters for its current level.
+                order = np.lexsort((buckets, index))
+                last = order[np.append(index[order][1:] != index[order][:-1], True)]
+                index, buckets, y = index[last].tolist(), buckets[last].tolist(), y[last].tolist()
+                sizes = sizes[last].tolist() if sizes is not None else None
+            else:
+                index = [self._key_id(kind, key) for key in keys]
+                self._sums = _grow(self._sums, len(self._series))
+                middle = [b + HOUR / 2 for b in buckets]
+                x = [(m - self._origin) / DAY for m in middle]
+                w = [0.5 ** ((closed - m) / self.half_life) for m in middle]
+                previous = self._settle(index, buckets, y, closed)
+                _accumulate(self._sums, [index[k] for k, _ in previous], [x[k] for k, _ in previous],
+                            [old for _, old in previous], [-w[k] for k, _ in previous])
+                _accumulate(self._sums, index, x, y, w)
+                for i in index:
+                    self._hours[i] += 1
+                for k, _ in previous:
+                    self._hours[index[k]] -= 1
+            points += len(keys) - len(previous)
+            # The newest bucket is a series' current level until ingest reports a fresher one.
+            for i, bucket, value, size in zip(index, buckets, y, sizes or [None] * len(index)):
+                end = int(bucket) + HOUR
+                if end >= self._current_ts[i]:
+                    self._current[i], self._current_ts[i] = value, end
+                if size:
+                    self._capacity[i] = int(size)
+        return points
+
+    def _key_id(self, kind, key):
+        if kind == "partition":
+            host_id, _ = self._partition_info.get(key, (None, None))
+            return self._series_id(("partition", key), kind, host_id, key)
+        return self._series_id((kind, key), kind, key)
+
+    def _observe(self, key, ts, value, capacity):
+        i = self._index.get(key)
+        if i is None or value is None or ts < self._current_ts[i]:
+            return
+        self._current[i], self._current_ts[i] = float(value), ts
+        if capacity:
+            self._capacity[i] = capacity
+        self._view = None
+
+    def observe_batch(self, batch):
+        """Ingest listener: the newest level of every known series"""
+        now = time.time()
+        with self._lock:
+            for data in batch:
+                host_id = self._host_ids.get(data.system_info.computer_name)
+                if host_id is None:
+                    continue
+                ts = to_epoch(data.timestamp, now)
+                memory, partitions = data.memory, data.disk.partitions
+                self._observe(("mem", host_id), ts, memory.percentage, memory.total)
+                self._observe(("swap", host_id), ts, memory.swap_percent, memory.swap_total)
+                self._observe(("disk", host_id), ts, disk_percent(data), sum(p.total for p in partitions))
+                for p in partitions:
+                    partition_id = self._partitions.get((host_id, p.mountpoint))
+                    if partition_id is not None:
+                        self._observe(("partition", partition_id), ts, p.percent, p.total)
+
+    def observe_many(self, samples):
+        """(host, ts, (cpu, ram, disk, swap, temp)) samples committed by other workers"""
+        with self._lock:
+            for host, ts, (_, ram, disk, swap, _) in samples:
+                host_id = self._host_ids.get(host)
+                if host_id is not None:
+                    self._observe(("mem", host_id), ts, ram, None)
+                    self._observe(("swap", host_id), ts, swap, None)
+                    self._observe(("disk", host_id), ts, disk, None)
+
+    def _fitted(self):
+        if self._fit is None:
+            started = time.perf_counter()
+            self._fit = _solve(self._sums, len(self._series))
+            self._counters["fits"] += 1
+            self._counters["fit_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return self._fit
+
+    def _ranking(self):
+        """Series indices with a growing trend, soonest to fill first, and days-to-full per series"""
+        if self._view is not None:
+            return self._view
+        slope = self._fitted()[0]
+        if np is not None:
+            current, hours = np.array(self._current), np.array(self._hours)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                days = np.maximum((self.full_pct - current) / slope, 0)
+            growing = (slope > 0) & (hours >= self.min_hours) & ~np.isnan(current) & (days <= MAX_DAYS)
+            days = np.where(growing, days, np.inf)
+            order = np.argsort(days, kind="stable")[:int(growing.sum())].tolist()
+            days = days.tolist()
+        else:
+            days = [
+                max((self.full_pct - current) / b, 0) if b > 0 and hours >= self.min_hours and not math.isnan(current)
+                else math.inf
+                for b, current, hours in zip(slope, self._current, self._hours)
+            ]
+            days = [d if d <= MAX_DAYS else math.inf for d in days]
+            order = sorted((i for i, d in enumerate(days) if d != math.inf), key=days.__getitem__)
+        self._view = order, days
+        return self._view
+
+    def _row(self, i, days, now):
+        kind, host_id, partition_id = self._series[i]
+        slope, _, r2 = (values[i] for values in self._fitted())
+        if self._hours[i] < self.min_hours:
+            slope = r2 = math.nan
+        capacity = self._capacity[i]
+        return {
+            "host": self._names.get(host_id),
+            "metric": kind,
+            "mountpoint": self._partition_info.get(partition_id, (None, None))[1],
+            "current": _number(self._current[i], 2),
+            "as_of": from_epoch(self._current_ts[i]) if self._current_ts[i] else None,
+            "slope_per_day": _number(slope, 3),
+            "bytes_per_day": _number(slope * capacity / 100, 0) if capacity else None,
+            "r2": _number(r2, 3),
+            "hours": self._hours[i],
+            "days_to_full": _number(days[i], 1),
+            "full_at": from_epoch(int(now + days[i] * DAY)) if days[i] <= MAX_DAYS else None,
+        }
+
+    def filling(self, metric=None, host=None, within_days=None, min_r2=None, limit=50, now=None):
+        """Growing series, soonest to reach full_pct first ("what fills up next").
+
+        min_r2 drops series whose trend explains less of their variation
+        than that, i.e. noise that happens to slope upwards.
+        """
+        if metric is not None and metric not in KINDS:
+            raise ValueError(f"Unknown metric {metric!r}, expected one of {', '.join(KINDS)}")
+        now = now if now is not None else time.time()
+        with self._lock:
+            order, days = self._ranking()
+            r2 = self._fitted()[2]
+            host_id = self._host_ids.get(host) if host is not None else None
+            rows, total = [], 0
+            for i in order:
+                if within_days is not None and days[i] > within_days:
+                    break
+                kind, series_host, _ = self._series[i]
+                if (metric is not None and kind != metric) or (host is not None and series_host != host_id):
+                    continue
+                if min_r2 is not None and not r2[i] >= min_r2:
+                    continue
+                total += 1
+                if len(rows) < limit:
+                    rows.append(self._row(i, days, now))
+            updated = self._until
+        return {"fitted_through": from_epoch(updated) if updated else None, "total": total, "series": rows}
+
+    def host(self, name, now=None):
+        """Every series of one host, growing or not; None for an unknown host"""
+        now = now if now is not None else time.time()
+        with self._lock:
+            host_id = self._host_ids.get(name)
+            indices = [i for i, (_, series_host, _) in enumerate(self._series) if series_host == host_id]
+            if host_id is None or not indices:
+                return None
+            _, days = self._ranking()
+            return {
+                "fitted_through": from_epoch(self._until),
+                "series": [self._row(i, days, now) for i in indices],
+            }
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._counters)
+            result["series"] = len(self._series)
+            result["hosts"] = len({host_id for _, host_id, _ in self._series})
+            result["fitted_through"] = from_epoch(self._until) if self._until else None
+        result["last_refresh"] = from_epoch(result["last_refresh"]) if result["last_refresh"] else None
+        result["half_life_days"] = self.half_life / DAY
+        result["lookback_days"] = self.lookback / DAY
+        result["numpy"] = np is not None
+        return result
@@ -0,0 +1,214 @@
+import math
+import time
+
+from storage import HIST_BYTES, ROLLUP_METRICS, ROLLUP_TIERS, SCALE, from_epoch, hist_decode, hist_percentile
+
+RAW_COLUMNS = "cpu_pct, mem_pct, swap_pct, disk_pct, cpu_temp"
+
+
+def choose_step(span, step=None, max_points=500):
+    """Pick a bucket width that keeps the response under max_points buckets"""
+    floor = max(1, math.ceil(span / max_points))
+    return max(step or floor, floor)
+
+
+def choose_source(step, age=None, retention=None):
+    """Use the coarsest rollup tier whose buckets are no wider than step.
+
+    With retention (table -> seconds kept), a tier that has already pruned
+    data age seconds old is passed over for the next coarser one.
+    """
+    retention = retention or {}
+    source, width = "samples", 1
+    for table, tier_width in sorted(ROLLUP_TIERS.items(), key=lambda item: item[1]):
+        kept = retention.get(source)
+        if step >= tier_width or (age is not None and kept and age > kept):
+            source, width = table, tier_width
+    return source, width
+
+
+def _point(bucket, aggs):
+    point = {"timestamp": from_epoch(bucket)}
+    for metric, agg in zip(ROLLUP_METRICS, aggs):
+        if not agg["n"]:
+            point[metric] = None
+            continue
+        point[metric] = {
+            "min": agg["min"] / SCALE,
+            "avg": round(agg["sum"] / agg["n"] / SCALE, 2),
+            "max": agg["max"] / SCALE,
+            "p95": round(agg["p95"] / SCALE, 2),
+        }
+    return point
+
+
+def _raw_points(conn, host_id, start, end, step):
+    buckets = {}
+    cursor = conn.execute(
+        f"SELECT ts, {RAW_COLUMNS} FROM samples WHERE host_id = ? AND ts >= ? AND ts <= ? ORDER BY ts",
+        (host_id, start, end),
+    )
+    for ts, *values in cursor:
+        series = buckets.setdefault(ts - ts % step, [[] for _ in ROLLUP_METRICS])
+        for column, value in zip(series, values):
+            if value is not None:
+                column.append(value)
+    points = []
+    for bucket, series in buckets.items():
+        aggs = []
+        for values in series:
+            values.sort()
+            aggs.append({
+                "n": len(values),
+                "sum": sum(values),
+                "min": values[0] if values else None,
+                "max": values[-1] if values else None,
+                "p95": values[max(0, math.ceil(0.95 * len(values)) - 1)] if values else None,
+            })
+        points.append(_point(bucket, aggs))
+    return points
+
+
+class HistSum:
+    """SQLite aggregate that adds histogram blobs bin by bin"""
+
+    def __init__(self):
+        self.packed = None
+
+    def step(self, blob):
+        if blob is not None:
+            self.packed = int.from_bytes(blob, "little") + (self.packed or 0)
+
+    def finalize(self):
+        return None if self.packed is None else self.packed.to_bytes(HIST_BYTES, "little")
+
+
+def _rollup_points(conn, table, host_id, start, end, step):
+    conn.create_aggregate("hist_sum", 1, HistSum)
+    columns = ", ".join(
+        f"SUM({m}_n), SUM({m}_sum), MIN({m}_min), MAX({m}_max), hist_sum({m}_hist)" for m in ROLLUP_METRICS
+    )
+    cursor = conn.execute(
+        f"SELECT bucket - bucket % ? AS slot, {columns} FROM {table} "
+        f"WHERE host_id = ? AND bucket >= ? AND bucket <= ? GROUP BY slot ORDER BY slot",
+        (step, host_id, start, end),
+    )
+    points = []
+    for bucket, *row in cursor:
+        aggs = []
+        for i in range(len(ROLLUP_METRICS)):
+            n, total, low, high, blob = row[i * 5:i * 5 + 5]
+            aggs.append({
+                "n": n,
+                "sum": total,
+                "min": low,
+                "max": high,
+                "p95": hist_percentile(hist_decode(blob), 0.95, low, high) if n else None,
+            })
+        points.append(_point(bucket, aggs))
+    return points
+
+
+def query_history(conn, computer_name, start, end, step=None, max_points=500, retention=None):
+    """Bucketed min/avg/max/p95 series for one host between start and end (epoch seconds)"""
+    row = conn.execute("SELECT id FROM hosts WHERE computer_name = ?", (computer_name,)).fetchone()
+    step = choose_step(end - start, step, max_points)
+    source, width = choose_source(step, time.time() - start, retention)
+    # Rollup buckets cannot be split, so round the step up to a whole number of them.
+    step = math.ceil(step / width) * width
+    start -= start % step
+    result = {
+        "computer_name": computer_name,
+        "start": from_epoch(start),
+        "end": from_epoch(end),
+        "step": step,
+        "source": source,
+        "points": [],
+    }
+    if row is None:
+        return result
+    if source == "samples":
+        result["points"] = _raw_points(conn, row[0], start, end, step)
+    else:
+        result["points"] = _rollup_points(conn, source, row[0], start, end, step)
+    return result
+
+
+def query_recent(recent, computer_name, start, end, step=None, max_points=500):
+    """query_history() served from the in-memory rings, or None when they do not cover start"""
+    step = choose_step(end - start, step, max_points)
+    start -= start % step
+    if not recent.covers(computer_name, start):
+        return None
+    return {
+        "computer_name": computer_name,
+        "start": from_epoch(start),
+        "end": from_epoch(end),
+        "step": step,
+        "source": "memory",
+        "points": [_point(bucket, aggs) for bucket, aggs in recent.buckets(computer_name, start, end, step)],
+    }
+
+
+def agent_costs(conn, since, limit=20):
+    """Hosts whose agent used the most CPU since the given epoch, with per-collector cost.
+
+    Error, timeout and drop counters are cumulative on the agent, so the
+    number within the window is the difference between the last and first value.
+    """
+    hosts = conn.execute(
+        """
+        SELECT s.host_id, h.computer_name, COUNT(*), AVG(a.cpu_pct), MAX(a.cpu_pct), MAX(a.rss),
+               AVG(a.send_us), MAX(a.send_max_us), MAX(a.send_errors) - MIN(a.send_errors),
+               MAX(a.dropped) - MIN(a.dropped), AVG(a.wire_bytes), AVG(a.raw_bytes)
+        FROM sample_agent a
+        JOIN samples s ON s.id = a.sample_id
+        JOIN hosts h ON h.id = s.host_id
+        WHERE s.ts >= ?
+        GROUP BY s.host_id
+        ORDER BY AVG(a.cpu_pct) DESC
+        LIMIT ?
+        """,
+        (since, limit),
+    ).fetchall()
+    result = []
+    by_id = {}
+    for host_id, name, reports, cpu_avg, cpu_max, rss, send_us, send_max_us, errors, dropped, wire, raw in hosts:
+        entry = by_id[host_id] = {
+            "computer_name": name,
+            "reports": reports,
+            "cpu_percent_avg": round(cpu_avg / SCALE, 2) if cpu_avg is not None else None,
+            "cpu_percent_max": cpu_max / SCALE if cpu_max is not None else None,
+            "rss_bytes_max": rss,
+            "send_ms_avg": round(send_us / 1000, 2) if send_us is not None else None,
+            "send_ms_max": round(send_max_us / 1000, 2) if send_max_us is not None else None,
+            "send_errors": errors,
+            "dropped": dropped,
+            "wire_bytes_avg": round(wire) if wire is not None else None,
+            "raw_bytes_avg": round(raw) if raw is not None else None,
+            "collectors": {},
+        }
+        result.append(entry)
+    if not by_id:
+        return result
+    marks = ", ".join("?" * len(by_id))
+    cursor = conn.execute(
+        f"""
+        SELECT s.host_id, c.name, AVG(c.avg_us), MAX(c.max_us), AVG(c.cpu_us),
+               MAX(c.errors) - MIN(c.errors), MAX(c.timeouts) - MIN(c.timeouts)
+        FROM sample_agent_collectors c
+        JOIN samples s ON s.id = c.sample_id
+        WHERE s.ts >= ? AND s.host_id IN ({marks})
+        GROUP BY s.host_id, c.name
+        """,
+        (since, *by_id),
+    )
+    for host_id, name, avg_us, max_us, cpu_us, errors, timeouts in cursor:
+        by_id[host_id]["collectors"][name] = {
+            "avg_ms": round(avg_us / 1000, 2) if avg_us is not None else None,
+            "max_ms": round(max_us / 1000, 2) if max_us is not None else None,
+            "cpu_ms": round(cpu_us / 1000, 2) if cpu_us is not None else None,
+            "errors": errors,
+            "timeouts": timeouts,
+        }
+    return result
@@ -0,0 +1,156 @@
+import queue
+import sqlite3
+import threading
+import time
+
+from metrics import INGEST_COMMIT, INGEST_FAILED_ROWS, INGEST_REJECTED, INGEST_ROWS
+
+
+class IngestQueueFull(Exception):
+    """Raised when the ingest queue cannot take another sample"""
+
+
+def connect_writer(db_file):
+    """Open the long-lived connection used by the ingest writer"""
+    conn = sqlite3.connect(db_file, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+class IngestPipeline:
+    """Bounded queue in front of a single SQLite writer thread.
+
+    Request handlers call submit() and return immediately; the writer drains
+    the queue and group-commits everything it collected in one transaction,
+    either when batch_size samples are waiting or flush_interval has passed.
+    """
+
+    def __init__(self, db_file, write_batch, max_queue=10000, batch_size=500, flush_interval=0.5):
+        self.db_file = db_file
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        # Serializes producers so submit_many's room check and its puts are
+        # one step; the writer only ever frees space in between.
+        self._submit_lock = threading.Lock()
+        self._listeners = []
+        self._counters = {
+            "accepted": 0,
+            "rejected": 0,
+            "committed": 0,
+            "failed": 0,
+            "batches": 0,
+            "last_batch_size": 0,
+            "max_batch_size": 0,
+            "last_commit_ms": 0.0,
+        }
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def add_listener(self, callback):
+        """Call callback(batch) on the writer thread after each committed batch"""
+        self._listeners.append(callback)
+
+    def submit(self, sample):
+        self.submit_many([sample])
+
+    def submit_many(self, samples):
+        """Queue a whole batch, or none of it if the queue lacks room"""
+        with self._submit_lock:
+            if self._queue.maxsize - self._queue.qsize() < len(samples):
+                with self._lock:
+                    self._counters["rejected"] += len(samples)
+                INGEST_REJECTED.inc(len(samples))
+                raise IngestQueueFull()
+            for sample in samples:
+                self._queue.put_nowait(sample)
+        with self._lock:
+            self._counters["accepted"] += len(samples)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        counters["queue_depth"] = self._queue.qsize()
+        counters["queue_capacity"] = self._queue.maxsize
+        counters["avg_batch_size"] = round(counters["committed"] / counters["batches"], 1) if counters["batches"] else 0.0
+        counters["running"] = bool(self._thread and self._thread.is_alive())
+        return counters
+
+    def _collect(self):
+        # Block for the first sample, then keep draining until the batch is
+        # full or the flush window closes.
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, conn, batch):
+        started = time.perf_counter()
+        try:
+            # Take the write lock up front: with several worker processes a
+            # deferred transaction that reads before writing could fail with
+            # SQLITE_BUSY instead of waiting out busy_timeout.
+            conn.execute("BEGIN IMMEDIATE")
+            with conn:
+                self.write_batch(conn, batch)
+        except Exception as e:
+            print(f"Error writing ingest batch of {len(batch)}: {e}")
+            rollback = getattr(self.write_batch, "rollback", None)
+            if rollback:
+                rollback()
+            with self._lock:
+                self._counters["failed"] += len(batch)
+            INGEST_FAILED_ROWS.inc(len(batch))
+            return False
+        elapsed = (time.perf_counter() - started) * 1000
+        INGEST_COMMIT.observe(elapsed / 1000)
+        INGEST_ROWS.inc(len(batch))
+        with self._lock:
+            self._counters["committed"] += len(batch)
+            self._counters["batches"] += 1
+            self._counters["last_batch_size"] = len(batch)
+            self._counters["max_batch_size"] = max(self._counters["max_batch_size"], len(batch))
+            self._counters["last_commit_ms"] = round(elapsed, 2)
+        for callback in self._listeners:
+            try:
+                callback(batch)
+            except Exception as e:
+                print(f"Error in ingest listener {callback}: {e}")
+        return True
+
+    def _run(self):
+        conn = connect_writer(self.db_file)
+        try:
+            while not self._stop.is_set() or not self._queue.empty():
+                batch = self._collect()
+                if batch:
+                    self._flush(conn, batch)
+        finally:
+            conn.close()
@@ -1,19 +1,41 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from datetime import datetime
+import asyncio
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from pydantic import BaseModel, ValidationError
+from datetime import datetime, timezone
 import sqlite3
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 import os
 import platform
-import psutil
 from typing import List, Optional, Dict
 import subprocess
+import time
+from alerts import AlertEngine, rules_from_file
+from cluster import Leader, StateFollower, file_lock
+from diagnostics import DiagnosticsEngine
+from export import FORMATS, ExportError, parse_time, stream_export, validate as validate_export
+from fleet import FleetSummaries, parse_filter
+from forecast import ForecastEngine
+from metrics import CONTENT_TYPE, REGISTRY, MetricsMiddleware
+from maintenance import Maintenance, database_stats, retention_from_env
+from codec import JSON_TYPE, BodyError, decode_models, decode_records, encode, negotiate
+from deltas import DeltaState
+from ingest import IngestPipeline, IngestQueueFull
+from history import agent_costs, query_history, query_recent
+from state import LatestState
+from recent import RecentStore
+from storage import MetricsWriter, ReadPool, init_schema
+from stream import Broadcaster, sse_stream
+from workers import BlockingPool, PoolBusy
 
 
 
 
 app = FastAPI()
-DB_FILE = "hardware.db"
+DB_FILE = os.environ.get("HARDWARE_DB", "hardware.db")
+# Worker processes serving the app (uvicorn --workers / gunicorn -w); each
+# runs its own ingest writer against the shared database.
+WORKERS = int(os.environ.get("WEB_CONCURRENCY", 1))
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,6 +44,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 class SystemInfo(BaseModel):
     computer_name: str
@@ -65,6 +88,10 @@ class DiskInfo(BaseModel):
     partitions: List[DiskPartition]
     total_read: int
     total_write: int
+    read_bytes_per_sec: Optional[float] = None
+    write_bytes_per_sec: Optional[float] = None
+    read_iops: Optional[float] = None
+    write_iops: Optional[float] = None
 
 class NetworkInterface(BaseModel):
     speed: int
@@ -72,6 +99,8 @@ class NetworkInterface(BaseModel):
     ipv6: Optional[str]
     bytes_sent: int
     bytes_recv: int
+    send_bytes_per_sec: Optional[float] = None
+    recv_bytes_per_sec: Optional[float] = None
 
 class GpuInfo(BaseModel):
     name: str
@@ -89,6 +118,38 @@ class ProcessesInfo(BaseModel):
     running: int
     top_cpu: List[ProcessInfo]
 
+class CollectorStats(BaseModel):
+    interval: float
+    runs: int
+    errors: int
+    timeouts: int
+    last_duration_ms: float
+    avg_ms: float = 0.0
+    max_ms: float = 0.0
+    cpu_ms: float = 0.0
+
+class TransportStats(BaseModel):
+    sent: int
+    failed: int
+    dropped: int
+    requests: int = 0
+    errors: int = 0
+    buffered: int = 0
+    send_ms: float = 0.0
+    send_max_ms: float = 0.0
+    raw_bytes: int = 0
+    wire_bytes: int = 0
+
+class AgentProcessStats(BaseModel):
+    cpu_percent: float
+    rss_bytes: int
+    threads: int
+
+class AgentStats(BaseModel):
+    collectors: Dict[str, CollectorStats] = {}
+    transport: Optional[TransportStats] = None
+    process: Optional[AgentProcessStats] = None
+
 class HardwareData(BaseModel):
     system_info: SystemInfo
     cpu: CpuInfo
@@ -99,219 +160,632 @@ class HardwareData(BaseModel):
     processes: ProcessesInfo
     usb_devices: List[str]
     timestamp: str
+    agent: Optional[AgentStats] = None
 
 # Initialize DB
 def init_db():
+    conn = None
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        # Drop table if exists to start fresh (remove this in production)
-        cursor.execute("DROP TABLE IF EXISTS hardware_metrics")
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS hardware_metrics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                computer_name TEXT,
-                cpu REAL,
-                ram REAL,
-                disk REAL,
-                usb_devices TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Add some initial test data
-        cursor.execute("""
-            INSERT INTO hardware_metrics (computer_name, cpu, ram, disk, usb_devices)
-            VALUES 
-                ('Test PC 1', 45.5, 60.0, 75.2, 'USB Device 1,USB Device 2'),
-                ('Test PC 2', 85.5, 70.0, 55.2, 'USB Device 3,USB Device 4')
-        """)
-        
-        conn.commit()
+        # Workers start together; the first one migrates, the rest find the
+        # schema already at SCHEMA_VERSION.
+        with file_lock(DB_FILE + ".init.lock"):
+            conn = sqlite3.connect(DB_FILE)
+            conn.execute("PRAGMA journal_mode=WAL")
+            init_schema(conn)
         print("Database initialized successfully")
     except Exception as e:
         print(f"Error initializing database: {e}")
     finally:
-        conn.close()
+        if conn:
+            conn.close()
+
+def sample_hardware_data(computer_name: str = "Test PC") -> HardwareData:
+    return HardwareData(
+        system_info=SystemInfo(
+            computer_name=computer_name, os="Test OS", os_version="1.0", architecture="x86_64",
+            processor="Test CPU", machine_id="0", boot_time=datetime.now(timezone.utc).isoformat(), uptime="0:00:00",
+        ),
+        cpu=CpuInfo(
+            physical_cores=2, total_cores=4, max_frequency=3000.0, current_frequency=2400.0,
+            cpu_usage_per_core=[40.0, 50.0, 45.0, 47.0], total_cpu_usage=45.5, temperature=None,
+        ),
+        memory=MemoryInfo(
+            total=8 * 1024**3, available=3 * 1024**3, used=5 * 1024**3, percentage=60.0,
+            swap_total=2 * 1024**3, swap_used=0, swap_free=2 * 1024**3, swap_percent=0.0,
+        ),
+        disk=DiskInfo(
+            partitions=[DiskPartition(
+                device="/dev/sda1", mountpoint="/", fstype="ext4",
+                total=100 * 1024**3, used=75 * 1024**3, free=25 * 1024**3, percent=75.2,
+            )],
+            total_read=0,
+            total_write=0,
+        ),
+        network={},
+        gpu=GpuInfo(name="Test GPU", memory="Unknown"),
+        processes=ProcessesInfo(total=0, running=0, top_cpu=[]),
+        usb_devices=["USB Device 1", "USB Device 2"],
+        timestamp=datetime.now(timezone.utc).isoformat(),
+    )
+
+metrics_writer = MetricsWriter()
+
+ingest = IngestPipeline(
+    DB_FILE,
+    metrics_writer,
+    max_queue=int(os.environ.get("INGEST_MAX_QUEUE", 10000)),
+    batch_size=int(os.environ.get("INGEST_BATCH_SIZE", 500)),
+    flush_interval=float(os.environ.get("INGEST_FLUSH_INTERVAL", 0.5)),
+)
+
+# Blocking work from async handlers runs on these pools, never on the event
+# loop: SQLite reads and body decoding on one, psutil/subprocess on the other.
+db_pool = BlockingPool("db", max_workers=int(os.environ.get("DB_POOL_WORKERS", 4)))
+system_pool = BlockingPool("system", max_workers=2, max_pending=8)
+read_pool = ReadPool(DB_FILE, size=int(os.environ.get("DB_POOL_WORKERS", 4)))
+
+async def offload(pool, label, func, *args, timeout=None):
+    try:
+        return await pool.run(label, func, *args, timeout=timeout)
+    except PoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"{label} timed out")
 
-@app.post("/update-hardware")
-def update_hardware(data: HardwareData):
+retention = retention_from_env()
+maintenance = Maintenance(
+    DB_FILE,
+    retention,
+    interval=float(os.environ.get("MAINTENANCE_INTERVAL", 300)),
+)
+
+diagnostics = DiagnosticsEngine(ttl=float(os.environ.get("DIAGNOSE_TTL", 5)))
+
+latest_state = LatestState()
+broadcaster = Broadcaster(max_pending=int(os.environ.get("STREAM_MAX_PENDING", 1000)))
+
+def publish_latest(batch):
+    version, changed = latest_state.update(batch)
+    broadcaster.publish(version, changed)
+
+ingest.add_listener(publish_latest)
+
+# Alert rules come from the JSON file named by ALERT_RULES (a list of rule
+# objects, see alerts.DEFAULT_RULES for the fields); evaluated on every
+# committed batch.
+alerts = AlertEngine(
+    rules_from_file(os.environ["ALERT_RULES"]) if os.environ.get("ALERT_RULES") else None,
+    max_transitions=int(os.environ.get("ALERT_HISTORY", 1000)),
+)
+ingest.add_listener(alerts.observe_batch)
+
+fleet = FleetSummaries(
+    window=int(os.environ.get("FLEET_WINDOW", 3600)),
+    buckets=int(os.environ.get("FLEET_BUCKETS", 12)),
+    ewma_seconds=float(os.environ.get("FLEET_EWMA_SECONDS", 300)),
+)
+ingest.add_listener(fleet.observe_batch)
+
+# Last RECENT_CAPACITY samples per host (15 minutes at the agent's 5s
+# interval by default) in typed arrays, for sparklines and short history.
+recent = RecentStore(capacity=int(os.environ.get("RECENT_CAPACITY", 180)))
+ingest.add_listener(recent.observe_batch)
+
+# Usage trends per host and partition, refitted every FORECAST_INTERVAL
+# seconds from closed hours; ingest keeps their current levels fresh.
+forecast = ForecastEngine(
+    DB_FILE,
+    half_life=float(os.environ.get("FORECAST_HALF_LIFE_DAYS", 7)) * 86400,
+    lookback=float(os.environ.get("FORECAST_LOOKBACK_DAYS", 21)) * 86400,
+    interval=float(os.environ.get("FORECAST_INTERVAL", 300)),
+    min_hours=int(os.environ.get("FORECAST_MIN_HOURS", 6)),
+    settle=float(os.environ.get("FORECAST_SETTLE_HOURS", 6)) * 3600,
+)
+ingest.add_listener(forecast.observe_batch)
+
+def _observe_followed(samples):
+    alerts.observe_many(samples)
+    fleet.observe_many(samples)
+    recent.observe_many(samples)
+    forecast.observe_many(samples)
+
+# Retention runs in one worker only; if that worker exits, another takes over
+# on its next follower tick.
+leader = Leader(DB_FILE + ".leader.lock")
+
+def _lead():
+    if not leader.is_leader and leader.acquire():
+        maintenance.start()
+
+state_follower = StateFollower(
+    DB_FILE,
+    latest_state,
+    on_change=broadcaster.publish,
+    interval=float(os.environ.get("STATE_SYNC_INTERVAL", 0.5 if WORKERS > 1 else 0) or 0),
+    on_tick=_lead,
+    on_samples=_observe_followed,
+)
+
+def _db_bytes():
+    return {
+        name: os.path.getsize(path) if os.path.exists(path) else 0
+        for name, path in (("db", DB_FILE), ("wal", DB_FILE + "-wal"))
+    }
+
+# Read when /metrics is scraped, so they cost nothing between scrapes.
+REGISTRY.gauge("ingest_queue_depth", "Samples waiting for the ingest writer", func=lambda: ingest.stats()["queue_depth"])
+REGISTRY.gauge("ingest_queue_capacity", "Ingest queue size limit", func=lambda: ingest.stats()["queue_capacity"])
+REGISTRY.gauge(
+    "blocking_pool_pending", "Blocking calls queued or running per pool", ("pool",),
+    func=lambda: {pool.name: pool.stats()["pending"] for pool in (db_pool, system_pool)},
+)
+REGISTRY.gauge("stream_subscribers", "Connected /stream/hardware clients", func=lambda: broadcaster.stats()["subscribers"])
+REGISTRY.gauge("alerts_firing", "Alerts currently firing", func=alerts.firing_count)
+REGISTRY.gauge("hosts_reporting", "Hosts in the latest-state cache", func=lambda: len(latest_state.rows()[1]))
+REGISTRY.gauge("database_file_bytes", "Size of the SQLite database and its WAL", ("file",), func=_db_bytes)
+
+@app.on_event("startup")
+def start_ingest():
     conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO hardware_metrics (computer_name, cpu, ram, disk, usb_devices)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (data.computer_name, data.cpu, data.ram, data.disk, ",".join(data.usb_devices)))
-    conn.commit()
-    conn.close()
-    return {"message": "Hardware data updated"}
+    try:
+        latest_state.load(conn)
+        fleet.load(conn)
+        recent.load(conn, int(time.time()) - recent.capacity * int(os.environ.get("RECENT_WARM_INTERVAL", 5)))
+    finally:
+        conn.close()
+    ingest.start()
+    diagnostics.sampler.start()
+    forecast.start()
+    _lead()
+    if state_follower.interval > 0:
+        state_follower.start()
+
+@app.on_event("shutdown")
+def stop_ingest():
+    ingest.stop()
+    diagnostics.sampler.stop()
+    forecast.stop()
+    state_follower.stop()
+    maintenance.stop()
+    leader.release()
+    db_pool.shutdown()
+    system_pool.shutdown()
+
+def encoded_response(request: Request, content, status_code: int = 200, headers: Optional[dict] = None):
+    """Serialize with the fast codec (MessagePack if the client accepts it) instead of FastAPI's encoder"""
+    media_type = negotiate(request.headers.get("accept"))
+    headers = dict(headers or {}, Vary="Accept")
+    return Response(encode(content, media_type), status_code=status_code, media_type=media_type, headers=headers)
+
+def _queue_full():
+    return HTTPException(
+        status_code=503,
+        detail="Ingest queue is full, retry later",
+        headers={"Retry-After": "1"},
+    )
+
+def _decode_reports(body, content_type, content_encoding):
+    return decode_models(body, content_type, content_encoding, HardwareData)
+
+@app.post("/update-hardware", status_code=202)
+async def update_hardware(request: Request):
+    """One HardwareData report as JSON or MessagePack, optionally gzip/zstd compressed"""
+    body = await request.body()
+    try:
+        # Decompression and validation are CPU work; keep them off the event loop.
+        reports = await offload(
+            db_pool, "decode_single", _decode_reports,
+            body, request.headers.get("content-type"), request.headers.get("content-encoding"),
+        )
+    except BodyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False, include_input=False))
+    if len(reports) != 1:
+        raise HTTPException(status_code=400, detail="Expected a single report; use /update-hardware/bulk for several")
+    try:
+        ingest.submit(reports[0])
+    except IngestQueueFull:
+        raise _queue_full()
+    return {"message": "Hardware data queued"}
+
+@app.post("/update-hardware/bulk", status_code=202)
+async def update_hardware_bulk(request: Request):
+    """Accept several reports at once as a JSON array, NDJSON or MessagePack, optionally gzip/zstd compressed"""
+    body = await request.body()
+    try:
+        batch = await offload(
+            db_pool, "decode_bulk", _decode_reports,
+            body, request.headers.get("content-type"), request.headers.get("content-encoding"),
+        )
+    except BodyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False, include_input=False))
+    try:
+        ingest.submit_many(batch)
+    except IngestQueueFull:
+        raise _queue_full()
+    return {"message": "Hardware data queued", "accepted": len(batch)}
+
+# Sessions live in this process only. With several workers an agent whose
+# next request lands on another worker is told to resync and resends a full
+# report, so the cost is bandwidth, never wrong data.
+delta_state = DeltaState(
+    max_sessions=int(os.environ.get("DELTA_MAX_SESSIONS", 100000)),
+    ttl=float(os.environ.get("DELTA_SESSION_TTL", 3600)),
+)
+
+def _apply_deltas(body, content_type, content_encoding):
+    messages = decode_records(body, content_type, content_encoding)
+    # Queued before the sessions advance: if the queue is full the agent's
+    # retry of the same messages must still apply.
+    return delta_state.apply_many(messages, HardwareData.model_validate, ingest.submit_many)
+
+@app.post("/update-hardware/delta", status_code=202)
+async def update_hardware_delta(request: Request):
+    """Change-only reports: a full report per agent session, then numbered diffs.
+
+    Messages are applied in order until one does not follow its session's
+    last seq; the response then says how many were accepted and asks the
+    agent to resync, i.e. resend the rest starting with a full report.
+    """
+    body = await request.body()
+    try:
+        batch, resync = await offload(
+            db_pool, "decode_delta", _apply_deltas,
+            body, request.headers.get("content-type"), request.headers.get("content-encoding"),
+        )
+    except IngestQueueFull:
+        raise _queue_full()
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False, include_input=False))
+    except ValueError as e:
+        # BodyError and malformed messages
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Hardware data queued", "accepted": len(batch), "resync": resync}
+
+@app.get("/update-hardware/delta/stats")
+def get_delta_stats():
+    return delta_state.stats()
+
+@app.get("/alerts")
+def get_alerts(request: Request, host: Optional[str] = None):
+    return encoded_response(request, alerts.active(host))
+
+@app.get("/alerts/rules")
+def get_alert_rules():
+    return [rule.to_dict() for rule in alerts.rules]
+
+@app.get("/alerts/history")
+def get_alert_history(request: Request, since: int = 0, limit: int = Query(100, ge=1, le=1000)):
+    return encoded_response(request, alerts.transitions(since, limit))
+
+@app.get("/alerts/stats")
+def get_alert_stats():
+    return alerts.stats()
+
+def _fleet_filters(filters):
+    try:
+        return [parse_filter(f) for f in filters or ()]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _fill_fleet_attrs():
+    # Hosts first seen through another worker's commits have no attributes yet.
+    missing = fleet.missing_attrs()
+    if missing:
+        with read_pool.connection() as conn:
+            fleet.load_attrs(conn, missing)
+
+def _query_fleet(sort, desc, filters, offset, limit):
+    _fill_fleet_attrs()
+    return fleet.query(sort, desc, filters, offset, limit)
+
+def _group_fleet(by, field, filters):
+    _fill_fleet_attrs()
+    return fleet.groups(by, field, filters)
+
+@app.get("/fleet/hosts")
+async def get_fleet_hosts(
+    request: Request,
+    sort: str = "host",
+    desc: bool = False,
+    filter: Optional[List[str]] = Query(None),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=1000),
+):
+    try:
+        result = await offload(db_pool, "fleet", _query_fleet, sort, desc, _fleet_filters(filter), offset, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return encoded_response(request, result)
+
+@app.get("/fleet/groups")
+async def get_fleet_groups(
+    request: Request,
+    by: str = "os",
+    field: str = "cpu.last",
+    filter: Optional[List[str]] = Query(None),
+):
+    try:
+        result = await offload(db_pool, "fleet", _group_fleet, by, field, _fleet_filters(filter))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return encoded_response(request, result)
+
+@app.get("/ingest/stats")
+def get_ingest_stats():
+    return ingest.stats()
 
 @app.get("/get-hardware")
-async def get_hardware():
+def get_hardware(request: Request, since: Optional[int] = None):
+    if since is not None:
+        version, changed = latest_state.changed_since(since)
+        return encoded_response(request, {"version": version, "hosts": changed}, headers={"X-State-Version": str(version)})
+
+    # The full list is serialized once per version and shared by every poller.
+    media_type = negotiate(request.headers.get("accept"))
+    version, body = latest_state.encoded_rows(encode, media_type)
+    etag = f'W/"{version}"' if media_type == JSON_TYPE else f'W/"{version}-msgpack"'
+    headers = {"ETag": etag, "X-State-Version": str(version), "Vary": "Accept"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=media_type, headers=headers)
+
+@app.get("/stream/hardware")
+async def stream_hardware(request: Request, hosts: Optional[str] = None):
+    """Server-Sent Events: a snapshot, then per-host updates as reports arrive"""
+    host_filter = [h for h in hosts.split(",") if h] if hosts else None
+    return StreamingResponse(
+        sse_stream(request, broadcaster, latest_state.rows, host_filter),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/stream/stats")
+def get_stream_stats():
+    return broadcaster.stats()
+
+def _check_database():
+    # Taking and releasing the write lock proves the file is writable
+    # without writing anything.
+    conn = sqlite3.connect(DB_FILE, timeout=2)
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        # First, let's ensure we have some test data
-        cursor.execute("""
-            INSERT INTO hardware_metrics (computer_name, cpu, ram, disk, usb_devices)
-            VALUES (?, ?, ?, ?, ?)
-        """, ("Test PC", 45.5, 60.0, 75.2, "USB Device 1,USB Device 2"))
-        conn.commit()
-        
-        # Now fetch the data
-        cursor.execute("""
-            SELECT computer_name, cpu, ram, disk, usb_devices, timestamp 
-            FROM hardware_metrics 
-            ORDER BY timestamp DESC
-            LIMIT 20
-        """)
-        rows = cursor.fetchall()
-        print(f"Fetched rows: {rows}")  # Debug log
-        
-        result = [
-            {
-                "computer": row[0],
-                "cpuUsage": round(row[1], 1),
-                "ramUsage": round(row[2], 1),
-                "diskUsage": round(row[3], 1),
-                "usbDevices": row[4].split(",") if row[4] else [],
-                "lastupdate": row[5]
-            }
-            for row in rows
-        ]
-        print(f"Returning result: {result}")  # Debug log
-        return result
-        
-    except Exception as e:
-        print(f"Error fetching data: {e}")
-        return []
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("ROLLBACK")
     finally:
         conn.close()
 
-# Add a health check endpoint
+HEALTH_MAX_QUEUE_FILL = float(os.environ.get("HEALTH_MAX_QUEUE_FILL", 0.9))
+
+# Readiness: 503 when the database cannot be written or ingest is stalled
 @app.get("/health")
-async def health_check():
-    return {"status": "healthy"}
+async def health_check(response: Response):
+    started = time.perf_counter()
+    try:
+        await offload(db_pool, "health", _check_database, timeout=5)
+        database = {"writable": True, "ms": round((time.perf_counter() - started) * 1000, 2)}
+    except Exception as e:
+        database = {"writable": False, "error": getattr(e, "detail", None) or str(e)}
+    stats = ingest.stats()
+    ingest_ok = stats["running"] and stats["queue_depth"] < stats["queue_capacity"] * HEALTH_MAX_QUEUE_FILL
+    healthy = database["writable"] and ingest_ok
+    if not healthy:
+        response.status_code = 503
+    return {
+        "status": "healthy" if healthy else "unhealthy",
+        "checks": {
+            "database": database,
+            "ingest": {
+                "ok": ingest_ok,
+                "running": stats["running"],
+                "queue_depth": stats["queue_depth"],
+                "queue_capacity": stats["queue_capacity"],
+                "failed": stats["failed"],
+            },
+        },
+    }
+
+@app.get("/metrics")
+def get_metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
 
 # Add this for testing
 @app.get("/add-test-data")
 async def add_test_data():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO hardware_metrics (computer_name, cpu, ram, disk, usb_devices)
-        VALUES (?, ?, ?, ?, ?)
-    """, ("Test PC", 45.5, 60.0, 75.2, "USB Device 1, USB Device 2"))
-    conn.commit()
-    conn.close()
+    try:
+        ingest.submit(sample_hardware_data())
+    except IngestQueueFull:
+        raise _queue_full()
     return {"message": "Test data added"}
 
+def _shutdown_local():
+    if platform.system() == "Windows":
+        os.system("shutdown /s /t 1")
+    else:
+        os.system("shutdown -h now")
+
 @app.post("/shutdown/{computer_name}")
 async def shutdown_computer(computer_name: str):
+    # Check if the request is for the current computer
+    if computer_name != platform.node():
+        # For remote computers, you'll need to implement remote shutdown logic
+        # This could involve SSH, WMI for Windows, or other remote management protocols
+        raise HTTPException(status_code=400, detail="Remote shutdown not implemented")
     try:
-        # Check if the request is for the current computer
-        if computer_name == platform.node():
-            if platform.system() == "Windows":
-                os.system("shutdown /s /t 1")
-            else:
-                os.system("shutdown -h now")
-            return {"message": f"Shutdown initiated for {computer_name}"}
-        else:
-            # For remote computers, you'll need to implement remote shutdown logic
-            # This could involve SSH, WMI for Windows, or other remote management protocols
-            raise HTTPException(status_code=400, detail="Remote shutdown not implemented")
+        await offload(system_pool, "shutdown", _shutdown_local)
+        return {"message": f"Shutdown initiated for {computer_name}"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/diagnose/{computer_name}")
 async def diagnose_computer(computer_name: str):
+    # Check if the request is for the current computer
+    if computer_name != platform.node():
+        raise HTTPException(status_code=400, detail="Remote diagnostics not implemented")
     try:
-        # Check if the request is for the current computer
-        if computer_name == platform.node():
-            diagnostics = {
-                "cpu_details": {
-                    "physical_cores": psutil.cpu_count(logical=False),
-                    "total_cores": psutil.cpu_count(logical=True),
-                    "max_frequency": f"{psutil.cpu_freq().max:.1f}MHz",
-                    "current_frequency": f"{psutil.cpu_freq().current:.1f}MHz",
-                    "per_core_usage": [f"{x}%" for x in psutil.cpu_percent(percpu=True)],
-                },
-                "memory_details": {
-                    "total": f"{psutil.virtual_memory().total / (1024**3):.1f}GB",
-                    "available": f"{psutil.virtual_memory().available / (1024**3):.1f}GB",
-                    "used": f"{psutil.virtual_memory().used / (1024**3):.1f}GB",
-                    "cached": f"{psutil.virtual_memory().cached / (1024**3):.1f}GB",
-                },
-                "disk_details": [
-                    {
-                        "device": partition.device,
-                        "mountpoint": partition.mountpoint,
-                        "filesystem_type": partition.fstype,
-                        "total": f"{psutil.disk_usage(partition.mountpoint).total / (1024**3):.1f}GB",
-                        "used": f"{psutil.disk_usage(partition.mountpoint).used / (1024**3):.1f}GB",
-                        "free": f"{psutil.disk_usage(partition.mountpoint).free / (1024**3):.1f}GB",
-                    }
-                    for partition in psutil.disk_partitions()
-                ],
-                "network": {
-                    "interfaces": list(psutil.net_if_stats().keys()),
-                    "connections": len(psutil.net_connections()),
-                },
-                "processes": {
-                    "total": len(psutil.pids()),
-                    "running": len([p for p in psutil.process_iter(['status']) if p.info['status'] == 'running']),
-                    "top_cpu": [
-                        {
-                            "name": p.name(),
-                            "cpu_percent": p.cpu_percent(),
-                            "memory_percent": p.memory_percent(),
-                        }
-                        for p in sorted(psutil.process_iter(['name', 'cpu_percent', 'memory_percent']), 
-                                      key=lambda p: p.cpu_percent(), reverse=True)[:5]
-                    ],
-                },
-                "timestamp": datetime.now().isoformat()
-            }
-            return diagnostics
-        else:
-            raise HTTPException(status_code=400, detail="Remote diagnostics not implemented")
+        return await diagnostics.get(lambda collect: offload(system_pool, "diagnose", collect, timeout=30))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/diagnose/stats")
+def get_diagnose_stats():
+    return diagnostics.stats()
+
+def _check_for_updates():
+    if platform.system() == "Windows":
+        subprocess.run(["wuauclt", "/detectnow"], timeout=600)
+    else:
+        subprocess.run(["apt-get", "update"], timeout=600)
+
 # Add system update endpoint
 @app.post("/system/update/{computer_name}")
 async def update_system(computer_name: str):
     try:
-        if platform.system() == "Windows":
-            subprocess.run(["wuauclt", "/detectnow"])
-        else:
-            subprocess.run(["apt-get", "update"])
+        await offload(system_pool, "system_update", _check_for_updates, timeout=600)
         return {"message": "Update check initiated"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _read_history(computer_name, start, end, step, max_points):
+    with read_pool.connection() as conn:
+        return query_history(conn, computer_name, start, end, step, max_points, retention)
+
 # Add historical data endpoint
 @app.get("/hardware/history/{computer_name}")
-async def get_hardware_history(computer_name: str, hours: int = 24):
+async def get_hardware_history(
+    request: Request,
+    computer_name: str,
+    hours: int = Query(24, ge=1, le=24 * 365),
+    minutes: Optional[int] = Query(None, ge=1, description="Overrides hours for short windows"),
+    step: Optional[int] = Query(None, ge=1, description="Bucket width in seconds"),
+    max_points: int = Query(500, ge=1, le=5000),
+):
+    end = int(time.time())
+    start = end - (minutes * 60 if minutes else hours * 3600)
+    # Windows the in-memory rings still hold never touch SQLite.
+    history = query_recent(recent, computer_name, start, end, step, max_points)
+    if history is None:
+        history = await offload(
+            db_pool, "history", _read_history, computer_name, start, end, step, max_points, timeout=30
+        )
+    return encoded_response(request, history)
+
+@app.get("/hardware/recent/{computer_name}")
+def get_hardware_recent(
+    request: Request,
+    computer_name: str,
+    minutes: float = Query(15, gt=0),
+    points: Optional[int] = Query(None, ge=1, le=5000, description="Average into at most this many points"),
+):
+    result = recent.series(computer_name, int(time.time() - minutes * 60), points)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"No recent samples for {computer_name}")
+    return encoded_response(request, dict(result, computer_name=computer_name))
+
+@app.get("/recent/stats")
+def get_recent_stats():
+    return recent.stats()
+
+@app.get("/forecast")
+def get_forecast(
+    request: Request,
+    metric: Optional[str] = Query(None, description="mem, swap, disk or partition"),
+    host: Optional[str] = None,
+    within_days: Optional[float] = Query(None, gt=0),
+    min_r2: Optional[float] = Query(None, ge=0, le=1),
+    limit: int = Query(50, ge=1, le=1000),
+):
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT * FROM hardware_metrics 
-            WHERE computer_name = ? 
-            AND timestamp >= datetime('now', '-' || ? || ' hours')
-            ORDER BY timestamp DESC
-        """, (computer_name, hours))
-        return cursor.fetchall()
-    finally:
-        conn.close()
+        result = forecast.filling(metric, host, within_days, min_r2, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return encoded_response(request, result)
+
+@app.get("/forecast/stats")
+def get_forecast_stats():
+    return forecast.stats()
+
+@app.get("/forecast/{computer_name}")
+def get_host_forecast(request: Request, computer_name: str):
+    result = forecast.host(computer_name)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"No forecast for {computer_name}")
+    return encoded_response(request, dict(result, computer_name=computer_name))
+
+@app.get("/export")
+async def export_history(
+    format: str = "csv",
+    source: str = "samples",
+    hosts: Optional[str] = Query(None, description="Comma-separated host names (default: all)"),
+    start: Optional[str] = Query(None, description="Epoch seconds or ISO 8601, inclusive"),
+    end: Optional[str] = Query(None, description="Epoch seconds or ISO 8601, exclusive"),
+    cursor: Optional[str] = Query(None, description="Resume after the row carrying this cursor value"),
+    limit: Optional[int] = Query(None, ge=1, description="Stop after this many rows (paged export)"),
+):
+    try:
+        validate_export(format, source, cursor)
+        start_ts, end_ts = parse_time(start), parse_time(end)
+    except ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    host_names = [h for h in hosts.split(",") if h] if hosts else None
+    media_type, extension = FORMATS[format]
+    # Starlette drives the sync generator from its thread pool, one chunk at a time.
+    return StreamingResponse(
+        stream_export(DB_FILE, format, source, host_names, start_ts, end_ts, cursor, limit,
+                      chunk_size=int(os.environ.get("EXPORT_CHUNK_ROWS", 2000))),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="hardware-{source}.{extension}"'},
+    )
+
+def _read_agent_costs(since, limit):
+    with read_pool.connection() as conn:
+        return agent_costs(conn, since, limit)
+
+@app.get("/agents/cost")
+async def get_agent_costs(
+    request: Request,
+    hours: int = Query(1, ge=1, le=24 * 30),
+    limit: int = Query(20, ge=1, le=1000),
+):
+    since = int(time.time()) - hours * 3600
+    return encoded_response(request, await offload(db_pool, "agent_costs", _read_agent_costs, since, limit, timeout=30))
+
+def _read_db_stats():
+    with read_pool.connection() as conn:
+        return database_stats(conn, DB_FILE)
+
+@app.get("/db/stats")
+async def get_db_stats():
+    stats = await offload(db_pool, "db_stats", _read_db_stats, timeout=30)
+    # Retention counters are per process; only the leader worker runs it.
+    stats["maintenance"] = dict(maintenance.stats(), leader=leader.is_leader)
+    return stats
+
+@app.get("/workers/stats")
+def get_worker_stats():
+    return {
+        "db": db_pool.stats(),
+        "system": system_pool.stats(),
+        "process": {
+            "pid": os.getpid(),
+            "workers": WORKERS,
+            "leader": leader.is_leader,
+            "state_follower": state_follower.stats(),
+        },
+    }
 
 # Initialize the database on start
 init_db()
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="localhost", port=5001)
+    # Several workers need an import string so each process can load the app.
+    uvicorn.run("main:app" if WORKERS > 1 else app, host="localhost", port=5001, workers=WORKERS)
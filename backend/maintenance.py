@@ -0,0 +1,170 @@
+import os
+import threading
+import time
+
+from ingest import connect_writer
+from storage import PARTITION_ROLLUP, ROLLUP_TIERS, SAMPLE_DETAIL_TABLES
+
+DAY = 86400
+
+# Seconds of history kept per tier: table -> retention.
+DEFAULT_RETENTION = {"samples": 7 * DAY, "rollup_1m": 30 * DAY, "rollup_1h": 365 * DAY, PARTITION_ROLLUP: 365 * DAY}
+
+
+def retention_from_env(environ=os.environ):
+    """RETENTION_RAW_DAYS, RETENTION_1M_DAYS and RETENTION_1H_DAYS override the defaults.
+
+    The hourly partition rollup follows RETENTION_1H_DAYS.
+    """
+    names = {"samples": "RETENTION_RAW_DAYS", "rollup_1m": "RETENTION_1M_DAYS", "rollup_1h": "RETENTION_1H_DAYS"}
+    retention = dict(DEFAULT_RETENTION)
+    for table, name in names.items():
+        if environ.get(name):
+            retention[table] = int(float(environ[name]) * DAY)
+    retention[PARTITION_ROLLUP] = retention["rollup_1h"]
+    return retention
+
+
+def database_stats(conn, db_file):
+    """File sizes and row counts per tier"""
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    wal_file = db_file + "-wal"
+    tiers = {}
+    for table in ("samples", *ROLLUP_TIERS, PARTITION_ROLLUP):
+        column = "ts" if table == "samples" else "bucket"
+        rows, oldest, newest = conn.execute(f"SELECT COUNT(*), MIN({column}), MAX({column}) FROM {table}").fetchone()
+        tiers[table] = {"rows": rows, "oldest": oldest, "newest": newest}
+    return {
+        "file_bytes": page_size * page_count,
+        "free_bytes": page_size * freelist,
+        "wal_bytes": os.path.getsize(wal_file) if os.path.exists(wal_file) else 0,
+        "hosts": conn.execute("SELECT COUNT(*) FROM hosts").fetchone()[0],
+        "tiers": tiers,
+    }
+
+
+class Maintenance:
+    """Background thread that keeps the database bounded in size.
+
+    Rollup rows are written by the ingest writer in the same transaction as
+    the raw samples they summarize, so expired raw samples (and then expired
+    1-minute buckets) can simply be deleted: the coarser tier already holds
+    them. Deletes run in chunks of chunk_size samples per transaction so the
+    ingest writer is never locked out for long. Each pass then checkpoints
+    the WAL and returns up to vacuum_pages free pages to the filesystem.
+    """
+
+    def __init__(self, db_file, retention=None, interval=300.0, chunk_size=500, vacuum_pages=2000):
+        self.db_file = db_file
+        self.retention = dict(retention or DEFAULT_RETENTION)
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.vacuum_pages = vacuum_pages
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._counters = {
+            "runs": 0,
+            "errors": 0,
+            "last_run": None,
+            "last_duration_ms": 0.0,
+            "last_error": None,
+            "deleted": {table: 0 for table in self.retention},
+            "vacuumed_pages": 0,
+        }
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="db-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        delay = min(self.interval, 30)  # let startup finish before the first pass
+        while not self._stop.wait(delay):
+            delay = self.interval
+            try:
+                self.run_once()
+            except Exception as e:
+                with self._lock:
+                    self._counters["errors"] += 1
+                    self._counters["last_error"] = str(e)
+                print(f"Database maintenance failed: {e}")
+
+    def _prune_samples(self, conn, cutoff):
+        deleted = 0
+        host_ids = [row[0] for row in conn.execute("SELECT id FROM hosts")]
+        for host_id in host_ids:
+            while not self._stop.is_set():
+                ids = [row[0] for row in conn.execute(
+                    "SELECT id FROM samples WHERE host_id = ? AND ts < ? LIMIT ?",
+                    (host_id, cutoff, self.chunk_size),
+                )]
+                if not ids:
+                    break
+                marks = ", ".join("?" * len(ids))
+                with conn:
+                    for table in SAMPLE_DETAIL_TABLES:
+                        conn.execute(f"DELETE FROM {table} WHERE sample_id IN ({marks})", ids)
+                    conn.execute(f"DELETE FROM samples WHERE id IN ({marks})", ids)
+                deleted += len(ids)
+        return deleted
+
+    def _prune_rollups(self, conn, table, cutoff):
+        key = "partition_id" if table == PARTITION_ROLLUP else "host_id"
+        deleted = 0
+        while not self._stop.is_set():
+            with conn:
+                cursor = conn.execute(
+                    f"DELETE FROM {table} WHERE ({key}, bucket) IN "
+                    f"(SELECT {key}, bucket FROM {table} WHERE bucket < ? LIMIT ?)",
+                    (cutoff, self.chunk_size * 10),
+                )
+            if not cursor.rowcount:
+                break
+            deleted += cursor.rowcount
+        return deleted
+
+    def run_once(self, now=None):
+        """One retention + checkpoint + incremental vacuum pass; returns rows deleted per tier"""
+        now = int(now if now is not None else time.time())
+        started = time.perf_counter()
+        conn = connect_writer(self.db_file)
+        try:
+            deleted = {}
+            for table, keep in self.retention.items():
+                if table == "samples":
+                    deleted[table] = self._prune_samples(conn, now - keep)
+                else:
+                    deleted[table] = self._prune_rollups(conn, table, now - keep)
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            # executescript steps the pragma to completion; execute() frees a single page.
+            conn.executescript(f"PRAGMA incremental_vacuum({self.vacuum_pages})")
+            vacuumed = free_before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+            conn.execute("PRAGMA optimize")
+        finally:
+            conn.close()
+        with self._lock:
+            self._counters["runs"] += 1
+            self._counters["last_run"] = now
+            self._counters["last_duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            self._counters["vacuumed_pages"] += vacuumed
+            for table, count in deleted.items():
+                self._counters["deleted"][table] += count
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._counters, deleted=dict(self._counters["deleted"]))
+        result["retention_days"] = {table: keep / DAY for table, keep in self.retention.items()}
+        return result
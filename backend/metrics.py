@@ -0,0 +1,226 @@
+import bisect
+import threading
+import time
+
+# Latency buckets in seconds, from sub-millisecond handler work up to the
+# multi-second subprocess calls.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self):
+        with self._lock:
+            return list(self._values.items())
+
+    def render(self):
+        lines = self.header()
+        for labels, value in self.samples():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """A gauge that is either set directly or read from func() at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), func=None):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, amount=1, *labels):
+        self.inc(-amount, *labels)
+
+    def samples(self):
+        if self.func is None:
+            return super().samples()
+        value = self.func()
+        if isinstance(value, dict):
+            return [((k,) if not isinstance(k, tuple) else k, v) for k, v in value.items()]
+        return [((), value)]
+
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram; observe() is one bisect and three additions"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # Per-bucket (not yet cumulative) counts, then sum and count.
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._values.items()]
+        for labels, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), func=None):
+        return self.register(Gauge(name, documentation, labelnames, func))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Text exposition format 0.0.4"""
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time from request start to the end of the response body",
+    ("method", "route", "status"),
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "Requests currently being handled")
+HTTP_REQUEST_BYTES = REGISTRY.histogram(
+    "http_request_size_bytes", "Declared Content-Length of request bodies", ("route",), SIZE_BUCKETS,
+)
+INGEST_COMMIT = REGISTRY.histogram("ingest_commit_seconds", "Time to write and commit one ingest batch")
+INGEST_ROWS = REGISTRY.counter("ingest_rows_total", "Samples committed by the ingest writer")
+INGEST_FAILED_ROWS = REGISTRY.counter("ingest_failed_rows_total", "Samples lost to failed ingest batches")
+INGEST_REJECTED = REGISTRY.counter("ingest_rejected_total", "Samples refused because the ingest queue was full")
+BLOCKING_CALL = REGISTRY.histogram(
+    "blocking_call_duration_seconds", "Run time of blocking calls on the worker pools (DB queries, psutil, subprocess)",
+    ("pool", "label"),
+)
+BLOCKING_WAIT = REGISTRY.histogram(
+    "blocking_call_wait_seconds", "Time blocking calls waited for a pool thread", ("pool", "label"),
+)
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsMiddleware:
+    """ASGI middleware that times every HTTP request by route template.
+
+    Plain ASGI rather than BaseHTTPMiddleware, so streaming responses (SSE)
+    pass through untouched and the per-request overhead is a couple of
+    dictionary updates. Routes are labelled by their path template
+    (/hardware/history/{computer_name}), never the raw path, to keep label
+    cardinality bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # The router stores the matched route in the shared scope.
+            route = _route(scope)
+            HTTP_LATENCY.observe(time.perf_counter() - started, scope["method"], route, str(status[0]))
+            length = _content_length(scope)
+            if length:
+                HTTP_REQUEST_BYTES.observe(length, route)
+
+
+def _route(scope):
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def _content_length(scope):
+    for name, value in scope.get("headers", ()):
+        if name == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
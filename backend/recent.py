@@ -0,0 +1,395 @@
+import bisect
+import math
+import threading
+import time
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from storage import ROLLUP_METRICS, SCALE, disk_percent, encode_pct, to_epoch
+
+# Scaled percentages (storage.encode_pct) as unsigned 16-bit, with one value
+# reserved for "not reported". Rates are float32 bytes per second, NaN when
+# unknown.
+MISSING = 0xFFFF
+RATES = ("net_rx", "net_tx")
+MAX_CORES = 256
+
+
+def _clamp_pct(value):
+    if value is None:
+        return MISSING
+    return min(MISSING - 1, max(0, value))
+
+
+class HostRing:
+    """Fixed-size ring of one host's recent samples in typed arrays.
+
+    Per sample it stores the timestamp (int64), cpu/mem/swap/disk/temp
+    (uint16 hundredths of a percent), total NIC receive/transmit rates
+    (float32) and per-core CPU (uint16, one row per sample). Everything is
+    allocated up front, so memory per host is nbytes() and never grows.
+
+    Samples are appended in time order only. One older than the newest
+    held (an agent replaying its spool after a fresh batch) is not stored;
+    gap_ts remembers the latest such timestamp, and windows reaching back
+    to it are not served from the ring until it has wrapped past it.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.head = 0
+        self.count = 0
+        self.ts = array("q", bytes(8 * capacity))
+        self.pct = [array("H", [MISSING]) * capacity for _ in ROLLUP_METRICS]
+        self.rates = [array("f", [math.nan]) * capacity for _ in RATES]
+        self.ncores = 0
+        self.cores = array("H")
+        self.gap_ts = None
+        self._counters = None
+
+    def nbytes(self):
+        arrays = [self.ts, self.cores, *self.pct, *self.rates]
+        return sum(a.itemsize * len(a) for a in arrays)
+
+    @property
+    def last_ts(self):
+        return self.ts[(self.head - 1) % self.capacity] if self.count else None
+
+    @property
+    def first_ts(self):
+        return self.ts[(self.head - self.count) % self.capacity] if self.count else None
+
+    def holds(self, ts):
+        """Whether a sample with exactly this timestamp is in the ring"""
+        if not self.count:
+            return False
+        start = self.head - self.count
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.ts[(start + mid) % self.capacity] < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo < self.count and self.ts[(start + lo) % self.capacity] == ts
+
+    def complete(self, start):
+        """Whether no sample from start on has been left out (see gap_ts)"""
+        return self.gap_ts is None or self.gap_ts < start
+
+    def append(self, ts, values, cores=None, counters=None):
+        """values are scaled percentages in ROLLUP_METRICS order; counters is (bytes_sent, bytes_recv)"""
+        last_ts = self.last_ts
+        if last_ts is not None and ts <= last_ts:
+            # A resent sample the ring already has changes nothing; an older
+            # one it never saw leaves a hole that SQLite has to fill.
+            if not self.holds(ts):
+                self.gap_ts = ts if self.gap_ts is None else max(self.gap_ts, ts)
+            return False
+        i = self.head
+        self.ts[i] = ts
+        for column, value in zip(self.pct, values):
+            column[i] = _clamp_pct(value)
+        rx = tx = math.nan
+        if counters is not None:
+            previous = self._counters
+            if previous is not None and ts > previous[0]:
+                dt = ts - previous[0]
+                sent, recv = counters[0] - previous[1], counters[1] - previous[2]
+                # Counters go backwards when a host reboots or a NIC is reset.
+                if sent >= 0 and recv >= 0:
+                    rx, tx = recv / dt, sent / dt
+            self._counters = (ts, counters[0], counters[1])
+        self.rates[0][i] = rx
+        self.rates[1][i] = tx
+        if cores is not None:
+            cores = cores[:MAX_CORES]
+            if len(cores) != self.ncores:
+                # Core count changed (first sample, or different hardware):
+                # start the per-core table over.
+                self.ncores = len(cores)
+                self.cores = array("H", [MISSING]) * (self.capacity * self.ncores)
+            self.cores[i * self.ncores:(i + 1) * self.ncores] = array("H", map(_clamp_pct, cores))
+        elif self.ncores:
+            self.cores[i * self.ncores:(i + 1) * self.ncores] = array("H", [MISSING]) * self.ncores
+        self.head = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        return True
+
+    def _ordered(self, column, width=1):
+        """column in time order, oldest first (a copy)"""
+        start = (self.head - self.count) % self.capacity
+        if start + self.count <= self.capacity:
+            return column[start * width:(start + self.count) * width]
+        return column[start * width:] + column[:self.head * width]
+
+    def snapshot(self, since=None):
+        """Time-ordered copies of every series from since on: (ts, pct columns, rate columns, cores, ncores)"""
+        ts = self._ordered(self.ts)
+        lo = bisect.bisect_left(ts, since) if since is not None else 0
+        pct = [self._ordered(column)[lo:] for column in self.pct]
+        rates = [self._ordered(column)[lo:] for column in self.rates]
+        cores = self._ordered(self.cores, self.ncores)[lo * self.ncores:] if self.ncores else array("H")
+        return ts[lo:], pct, rates, cores, self.ncores
+
+
+# Column views: with numpy the snapshot arrays are wrapped with frombuffer and
+# aggregated vectorized; without it the same functions loop over them.
+
+def _pct_view(column):
+    if np is not None:
+        values = np.frombuffer(column, dtype=np.uint16).astype(np.float64)
+        values[values == MISSING] = np.nan
+        return values
+    return [None if v == MISSING else v for v in column]
+
+
+def _rate_view(column):
+    if np is not None:
+        return np.frombuffer(column, dtype=np.float32).astype(np.float64)
+    return [None if math.isnan(v) else v for v in column]
+
+
+def _range_stats(column, ranges):
+    """n/sum/min/max/p95 per (bucket, lo, hi) range, ignoring missing values (None for empty ranges).
+
+    ranges must be contiguous and cover the whole column. p95 is the
+    ceil(0.95 n)-th smallest value, the same definition as the raw SQLite
+    path. With numpy every statistic is one reduceat over the column and
+    the p95 picks come from a single sort keyed by bucket.
+    """
+    if not ranges:
+        return []
+    if np is not None:
+        starts = np.array([lo for _, lo, _ in ranges], dtype=np.int64)
+        sizes = np.array([hi - lo for _, lo, hi in ranges], dtype=np.int64)
+        valid = ~np.isnan(column)
+        counts = np.add.reduceat(valid.astype(np.int64), starts)
+        sums = np.add.reduceat(np.where(valid, column, 0.0), starts)
+        mins = np.minimum.reduceat(np.where(valid, column, np.inf), starts)
+        maxs = np.maximum.reduceat(np.where(valid, column, -np.inf), starts)
+        # Sort by bucket, then value; NaNs sort last inside each bucket.
+        ordered = column[np.lexsort((column, np.repeat(np.arange(len(ranges)), sizes)))]
+        picks = starts + np.maximum(0, np.ceil(0.95 * counts).astype(np.int64) - 1)
+        p95s = ordered[np.minimum(picks, len(column) - 1)]
+        return [
+            {"n": n, "sum": total, "min": low, "max": high, "p95": p95} if n else None
+            for n, total, low, high, p95 in zip(
+                counts.tolist(), sums.tolist(), mins.tolist(), maxs.tolist(), p95s.tolist()
+            )
+        ]
+    result = []
+    for _, lo, hi in ranges:
+        values = sorted(v for v in column[lo:hi] if v is not None)
+        result.append({
+            "n": len(values),
+            "sum": sum(values),
+            "min": values[0],
+            "max": values[-1],
+            "p95": values[max(0, math.ceil(0.95 * len(values)) - 1)],
+        } if values else None)
+    return result
+
+
+def _boundaries(ts, start, step):
+    """Index ranges of ts falling into consecutive step-wide buckets from start"""
+    if not len(ts):
+        return []
+    first = int(ts[0]) - (int(ts[0]) - start) % step
+    edges = list(range(first + step, int(ts[-1]) + step + 1, step))
+    if np is not None:
+        cuts = np.searchsorted(np.frombuffer(ts, dtype=np.int64), edges).tolist()
+    else:
+        cuts = [bisect.bisect_left(ts, edge) for edge in edges]
+    ranges, lo = [], 0
+    for edge, hi in zip(edges, cuts):
+        if hi > lo:
+            ranges.append((edge - step, lo, hi))
+        lo = hi
+    return ranges
+
+
+def _avg(stats, scale=1):
+    return round(stats["sum"] / stats["n"] / scale, 2) if stats else None
+
+
+def _bucket_avgs(column, ranges, scale=1):
+    """Mean of each (bucket, lo, hi) range of a column; ranges are contiguous and end at len(column)"""
+    if not ranges:
+        return []
+    if np is not None:
+        starts = [lo for _, lo, _ in ranges]
+        valid = ~np.isnan(column)
+        sums = np.add.reduceat(np.where(valid, column, 0.0), starts)
+        counts = np.add.reduceat(valid.astype(np.int64), starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.round(sums / counts / scale, 2)
+        return [None if math.isnan(v) else v for v in means.tolist()]
+    result = []
+    for _, lo, hi in ranges:
+        values = [v for v in column[lo:hi] if v is not None]
+        result.append(round(sum(values) / len(values) / scale, 2) if values else None)
+    return result
+
+
+class RecentStore:
+    """Per-host HostRings for short-range reads that never touch SQLite.
+
+    Fed by the ingest writer after each commit (and, with several workers,
+    by the other workers' committed samples, which carry the five summary
+    series but not per-core or NIC data). covers() says whether a window is
+    fully held in memory: either the ring has wrapped past its start, or
+    the ring has been recording since before it (process start or warm
+    load), and no out-of-order sample from the window on was left out.
+    """
+
+    def __init__(self, capacity=180):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self.complete_since = int(time.time())
+
+    def _ring(self, host):
+        ring = self._hosts.get(host)
+        if ring is None:
+            ring = self._hosts[host] = HostRing(self.capacity)
+        return ring
+
+    def observe_batch(self, batch):
+        """Ingest listener"""
+        now = time.time()
+        with self._lock:
+            for data in batch:
+                nics = data.network.values()
+                self._ring(data.system_info.computer_name).append(
+                    to_epoch(data.timestamp, now),
+                    (
+                        encode_pct(data.cpu.total_cpu_usage),
+                        encode_pct(data.memory.percentage),
+                        encode_pct(data.memory.swap_percent),
+                        encode_pct(disk_percent(data)),
+                        encode_pct(data.cpu.temperature),
+                    ),
+                    [encode_pct(v) for v in data.cpu.cpu_usage_per_core],
+                    (sum(n.bytes_sent for n in nics), sum(n.bytes_recv for n in nics)) if nics else None,
+                )
+
+    def observe_many(self, samples):
+        """(host, ts, (cpu, ram, disk, swap, temp)) samples committed by other workers"""
+        with self._lock:
+            for host, ts, (cpu, ram, disk, swap, temp) in samples:
+                self._ring(host).append(ts, tuple(map(encode_pct, (cpu, ram, swap, disk, temp))))
+
+    def load(self, conn, since):
+        """Warm start from the samples committed since the given epoch second"""
+        scalars = conn.execute("""
+            SELECT s.id, h.computer_name, s.ts, s.cpu_pct, s.mem_pct, s.swap_pct, s.disk_pct, s.cpu_temp
+            FROM samples s JOIN hosts h ON h.id = s.host_id
+            WHERE s.ts >= ? ORDER BY s.id
+        """, (since,)).fetchall()
+        if not scalars:
+            self.complete_since = since
+            return 0
+        first_id = scalars[0][0]
+        cores, nics = {}, {}
+        for sample_id, core, usage in conn.execute(
+            "SELECT sample_id, core, usage FROM sample_cores WHERE sample_id >= ? ORDER BY sample_id, core",
+            (first_id,),
+        ):
+            cores.setdefault(sample_id, []).append(usage)
+        for sample_id, sent, recv in conn.execute(
+            "SELECT sample_id, SUM(bytes_sent), SUM(bytes_recv) FROM sample_nics WHERE sample_id >= ? "
+            "GROUP BY sample_id",
+            (first_id,),
+        ):
+            nics[sample_id] = (sent, recv)
+        loaded = 0
+        with self._lock:
+            for sample_id, name, ts, *values in sorted(scalars, key=lambda row: row[2]):
+                loaded += self._ring(name).append(ts, values, cores.get(sample_id), nics.get(sample_id))
+            self.complete_since = since
+        return loaded
+
+    def covers(self, host, start):
+        with self._lock:
+            ring = self._hosts.get(host)
+            if ring is None or not ring.count or not ring.complete(start):
+                return False
+            if ring.count == ring.capacity:
+                return ring.first_ts <= start
+            return self.complete_since <= start
+
+    def _snapshot(self, host, since):
+        with self._lock:
+            ring = self._hosts.get(host)
+            return ring.snapshot(since) if ring is not None else None
+
+    def buckets(self, host, start, end, step):
+        """History-style aggregates: [(bucket, [stats per ROLLUP_METRICS])] in scaled units"""
+        snapshot = self._snapshot(host, start)
+        if snapshot is None:
+            return []
+        ts, pct, _, _, _ = snapshot
+        hi = bisect.bisect_right(ts, end)
+        ts = ts[:hi]
+        columns = [_pct_view(column[:hi]) for column in pct]
+        ranges = _boundaries(ts, start, step)
+        per_column = [_range_stats(column, ranges) for column in columns]
+        return [
+            (bucket, [stats[i] or {"n": 0} for stats in per_column])
+            for i, (bucket, _, _) in enumerate(ranges)
+        ]
+
+    def series(self, host, since, points=None):
+        """Sparkline-ready series from since on, averaged into at most points buckets"""
+        snapshot = self._snapshot(host, since)
+        if snapshot is None:
+            return None
+        ts, pct, rates, cores, ncores = snapshot
+        columns = {m: _pct_view(c) for m, c in zip(ROLLUP_METRICS, pct)}
+        columns.update({r: _rate_view(c) for r, c in zip(RATES, rates)})
+        core_columns = []
+        if ncores:
+            if np is not None:
+                matrix = _pct_view(cores).reshape(-1, ncores)
+                core_columns = [matrix[:, c] for c in range(ncores)]
+            else:
+                flat = _pct_view(cores)
+                core_columns = [flat[c::ncores] for c in range(ncores)]
+        if len(ts) and points and len(ts) > points:
+            span = ts[-1] - ts[0] + 1
+            step = max(1, math.ceil(span / points))
+            ranges = _boundaries(ts, ts[0], step)
+        else:
+            step = None
+            ranges = [(t, i, i + 1) for i, t in enumerate(ts)]
+        summary, out = {}, {"timestamp": [bucket for bucket, _, _ in ranges]}
+        for name, column in columns.items():
+            scale = SCALE if name in ROLLUP_METRICS else 1
+            out[name] = _bucket_avgs(column, ranges, scale)
+            stats = _range_stats(column, [(None, 0, len(column))])[0] if len(column) else None
+            summary[name] = {
+                "min": round(stats["min"] / scale, 2),
+                "avg": _avg(stats, scale),
+                "max": round(stats["max"] / scale, 2),
+                "last": out[name][-1] if out[name] else None,
+            } if stats else None
+        out["cores"] = [_bucket_avgs(column, ranges, SCALE) for column in core_columns]
+        return {"samples": len(ts), "step": step, "series": out, "summary": summary}
+
+    def stats(self):
+        with self._lock:
+            rings = list(self._hosts.values())
+        return {
+            "hosts": len(rings),
+            "capacity": self.capacity,
+            "bytes": sum(ring.nbytes() for ring in rings),
+            # Fixed cost per host, plus per_core for each CPU core it reports.
+            "bytes_per_host": {"base": HostRing(self.capacity).nbytes(), "per_core": self.capacity * 2},
+            "numpy": np is not None,
+            "complete_since": self.complete_since,
+        }
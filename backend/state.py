@@ -0,0 +1,164 @@
+import threading
+import time
+
+from storage import decode_pct, disk_percent, from_epoch, to_epoch
+
+
+def _round(value):
+    return round(value, 1) if value is not None else 0.0
+
+
+def _public(row):
+    return {k: v for k, v in row.items() if k != "_ts"}
+
+
+def _stored_row(conn, name, sample_id, ts, cpu, ram, disk):
+    devices = [d for (d,) in conn.execute("SELECT device FROM sample_usb WHERE sample_id = ?", (sample_id,))]
+    return {
+        "computer": name,
+        "cpuUsage": _round(decode_pct(cpu)),
+        "ramUsage": _round(decode_pct(ram)),
+        "diskUsage": _round(decode_pct(disk)),
+        "usbDevices": devices,
+        "lastupdate": from_epoch(ts),
+        "_ts": ts,
+    }
+
+
+class LatestState:
+    """Latest dashboard row per host, kept in memory and versioned.
+
+    The ingest writer calls update() after every committed batch. Each
+    change bumps a global version and stamps the host with it, so readers
+    can ask for "everything changed since version N" or compare an ETag
+    without touching SQLite. When several worker processes share the
+    database, refresh() folds in the batches the other workers committed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self._versions = {}
+        # Start from wall-clock milliseconds so versions (and ETags) handed
+        # out before a restart are never reused afterwards.
+        self._version = int(time.time() * 1000)
+        self._cached_rows = None
+        self._encoded = {}
+        # Newest sample id read from the database, for refresh().
+        self._last_sample_id = 0
+
+    @property
+    def version(self):
+        return self._version
+
+    def _put(self, name, row):
+        self._version += 1
+        self._hosts[name] = row
+        self._versions[name] = self._version
+        self._cached_rows = None
+        self._encoded.clear()
+
+    def update(self, batch):
+        """Apply a committed batch; returns the new version and the changed rows"""
+        now = time.time()
+        changed = {}
+        with self._lock:
+            for data in batch:
+                name = data.system_info.computer_name
+                ts = to_epoch(data.timestamp, now)
+                current = self._hosts.get(name)
+                if current and current["_ts"] > ts:
+                    continue
+                row = {
+                    "computer": name,
+                    "cpuUsage": _round(data.cpu.total_cpu_usage),
+                    "ramUsage": _round(data.memory.percentage),
+                    "diskUsage": _round(disk_percent(data)),
+                    "usbDevices": list(data.usb_devices),
+                    "lastupdate": from_epoch(ts),
+                    "_ts": ts,
+                }
+                self._put(name, row)
+                changed[name] = row
+            return self._version, [_public(row) for row in changed.values()]
+
+    def load(self, conn):
+        """Prime the cache with the newest stored sample of every host"""
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM samples").fetchone()[0]
+        rows = conn.execute("""
+            SELECT h.computer_name, s.id, s.ts, s.cpu_pct, s.mem_pct, s.disk_pct
+            FROM hosts h
+            JOIN samples s ON s.id = (
+                SELECT id FROM samples WHERE host_id = h.id ORDER BY ts DESC LIMIT 1
+            )
+        """).fetchall()
+        with self._lock:
+            for name, sample_id, ts, cpu, ram, disk in rows:
+                self._put(name, _stored_row(conn, name, sample_id, ts, cpu, ram, disk))
+            self._last_sample_id = max(self._last_sample_id, last_id)
+
+    def refresh(self, conn):
+        """Pick up samples committed by other processes since the last load() or refresh().
+
+        Sample ids are assigned under the database write lock, so everything
+        newer than the last id seen is exactly what other writers committed
+        meanwhile. Samples this process already applied through update()
+        carry a timestamp that is not newer than the cached one and are
+        skipped. Returns the version and the changed rows, like update(),
+        plus every new sample as (host, ts, (cpu, ram, disk, swap, temp)).
+        """
+        rows = conn.execute("""
+            SELECT h.computer_name, s.id, s.ts, s.cpu_pct, s.mem_pct, s.disk_pct, s.swap_pct, s.cpu_temp
+            FROM samples s JOIN hosts h ON h.id = s.host_id
+            WHERE s.id > ?
+            ORDER BY s.id
+        """, (self._last_sample_id,)).fetchall()
+        newest = {}
+        samples = []
+        for row in rows:
+            name, _, ts, cpu, ram, disk, swap, temp = row
+            samples.append((name, ts, tuple(map(decode_pct, (cpu, ram, disk, swap, temp)))))
+            current = newest.get(name)
+            if current is None or ts >= current[2]:
+                newest[name] = row
+        changed = {}
+        with self._lock:
+            for name, sample_id, ts, cpu, ram, disk, _, _ in newest.values():
+                current = self._hosts.get(name)
+                if current and current["_ts"] >= ts:
+                    continue
+                row = changed[name] = _stored_row(conn, name, sample_id, ts, cpu, ram, disk)
+                self._put(name, row)
+            if rows:
+                self._last_sample_id = max(self._last_sample_id, rows[-1][1])
+            return self._version, [_public(row) for row in changed.values()], samples
+
+    def rows(self):
+        """All hosts, most recently updated first"""
+        with self._lock:
+            if self._cached_rows is None:
+                ordered = sorted(self._hosts.values(), key=lambda row: row["_ts"], reverse=True)
+                self._cached_rows = [_public(row) for row in ordered]
+            return self._version, self._cached_rows
+
+    def encoded_rows(self, encode, media_type):
+        """rows() serialized by encode(rows, media_type), once per version and media type"""
+        version, rows = self.rows()
+        with self._lock:
+            cached = self._encoded.get(media_type)
+            if cached is not None and cached[0] == version:
+                return cached
+        body = encode(rows, media_type)
+        with self._lock:
+            if self._version == version:
+                self._encoded[media_type] = (version, body)
+        return version, body
+
+    def changed_since(self, version):
+        with self._lock:
+            changed = [
+                _public(self._hosts[name])
+                for name, host_version in self._versions.items()
+                if host_version > version
+            ]
+            return self._version, changed
@@ -0,0 +1,662 @@
+import queue
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Percentages and temperatures are stored as integer hundredths so every
+# numeric column is an INTEGER (SQLite varint) instead of an 8-byte REAL.
+SCALE = 100
+SCHEMA_VERSION = 6
+
+# Rollup tiers kept up to date by the writer: table name -> bucket width in
+# seconds. Each row keeps count/sum/min/max plus a coarse histogram per
+# metric so percentiles can be estimated without the raw samples.
+ROLLUP_TIERS = {"rollup_1m": 60, "rollup_1h": 3600}
+ROLLUP_METRICS = ("cpu", "mem", "swap", "disk", "temp")
+HIST_BINS = 20
+
+# Hourly used percentage per partition, so partition trends can reach back
+# further than raw retention. Kept alongside rollup_1h.
+PARTITION_ROLLUP = "partition_rollup_1h"
+PARTITION_ROLLUP_WIDTH = 3600
+
+# Per-sample detail tables, keyed by sample_id.
+SAMPLE_DETAIL_TABLES = (
+    "sample_cores", "sample_partitions", "sample_nics", "sample_processes", "sample_usb",
+    "sample_agent", "sample_agent_collectors",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hosts (
+    id INTEGER PRIMARY KEY,
+    computer_name TEXT NOT NULL UNIQUE,
+    machine_id TEXT,
+    os TEXT,
+    os_version TEXT,
+    architecture TEXT,
+    processor TEXT,
+    physical_cores INTEGER,
+    total_cores INTEGER,
+    max_frequency INTEGER,
+    gpu_name TEXT,
+    boot_time INTEGER,
+    first_seen INTEGER,
+    last_seen INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS samples (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    host_id INTEGER NOT NULL REFERENCES hosts(id),
+    ts INTEGER NOT NULL,
+    cpu_pct INTEGER,
+    cpu_freq INTEGER,
+    cpu_temp INTEGER,
+    mem_total INTEGER,
+    mem_used INTEGER,
+    mem_available INTEGER,
+    mem_pct INTEGER,
+    swap_total INTEGER,
+    swap_used INTEGER,
+    swap_pct INTEGER,
+    disk_pct INTEGER,
+    disk_read INTEGER,
+    disk_write INTEGER,
+    gpu_mem_used INTEGER,
+    gpu_mem_total INTEGER,
+    proc_total INTEGER,
+    proc_running INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS sample_cores (
+    sample_id INTEGER NOT NULL,
+    core INTEGER NOT NULL,
+    usage INTEGER,
+    PRIMARY KEY (sample_id, core)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS partitions (
+    id INTEGER PRIMARY KEY,
+    host_id INTEGER NOT NULL REFERENCES hosts(id),
+    mountpoint TEXT NOT NULL,
+    device TEXT,
+    fstype TEXT,
+    UNIQUE (host_id, mountpoint)
+);
+
+CREATE TABLE IF NOT EXISTS sample_partitions (
+    sample_id INTEGER NOT NULL,
+    partition_id INTEGER NOT NULL,
+    total INTEGER,
+    used INTEGER,
+    free INTEGER,
+    pct INTEGER,
+    PRIMARY KEY (sample_id, partition_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS nics (
+    id INTEGER PRIMARY KEY,
+    host_id INTEGER NOT NULL REFERENCES hosts(id),
+    name TEXT NOT NULL,
+    speed INTEGER,
+    ipv4 TEXT,
+    ipv6 TEXT,
+    UNIQUE (host_id, name)
+);
+
+CREATE TABLE IF NOT EXISTS sample_nics (
+    sample_id INTEGER NOT NULL,
+    nic_id INTEGER NOT NULL,
+    bytes_sent INTEGER,
+    bytes_recv INTEGER,
+    PRIMARY KEY (sample_id, nic_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS sample_processes (
+    sample_id INTEGER NOT NULL,
+    rank INTEGER NOT NULL,
+    pid INTEGER,
+    name TEXT,
+    cpu_pct INTEGER,
+    mem_pct INTEGER,
+    status TEXT,
+    PRIMARY KEY (sample_id, rank)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS sample_usb (
+    sample_id INTEGER NOT NULL,
+    device TEXT NOT NULL,
+    PRIMARY KEY (sample_id, device)
+) WITHOUT ROWID;
+
+-- What the agent itself cost while producing the sample (newer agents only).
+-- Durations are integer microseconds.
+CREATE TABLE IF NOT EXISTS sample_agent (
+    sample_id INTEGER PRIMARY KEY,
+    cpu_pct INTEGER,
+    rss INTEGER,
+    threads INTEGER,
+    send_us INTEGER,
+    send_max_us INTEGER,
+    requests INTEGER,
+    send_errors INTEGER,
+    dropped INTEGER,
+    raw_bytes INTEGER,
+    wire_bytes INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS sample_agent_collectors (
+    sample_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    runs INTEGER,
+    errors INTEGER,
+    timeouts INTEGER,
+    avg_us INTEGER,
+    max_us INTEGER,
+    cpu_us INTEGER,
+    PRIMARY KEY (sample_id, name)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS partition_rollup_1h (
+    partition_id INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    n INTEGER NOT NULL DEFAULT 0,
+    pct_sum INTEGER NOT NULL DEFAULT 0,
+    total_max INTEGER,
+    PRIMARY KEY (partition_id, bucket)
+) WITHOUT ROWID;
+"""
+
+
+def encode_pct(value):
+    return None if value is None else int(round(value * SCALE))
+
+
+def decode_pct(value):
+    return None if value is None else value / SCALE
+
+
+def to_epoch(value, default=None):
+    """Parse an ISO timestamp from an agent into integer epoch seconds.
+
+    Naive timestamps are taken as UTC, never as the server's local time.
+    """
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return int(default if default is not None else time.time())
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def from_epoch(ts):
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+def disk_percent(data):
+    """Used space across all partitions of a report, as a percentage"""
+    total = sum(p.total for p in data.disk.partitions)
+    used = sum(p.used for p in data.disk.partitions)
+    return used / total * 100 if total else None
+
+
+def _us(ms):
+    return None if ms is None else int(round(ms * 1000))
+
+
+def _parse_gpu_memory(memory):
+    # nvidia-smi reports "1234 MiB/8192 MiB"; anything else is kept as unknown.
+    numbers = re.findall(r"\d+", str(memory))
+    if len(numbers) == 2:
+        return int(numbers[0]), int(numbers[1])
+    return None, None
+
+
+def _table_exists(conn, name):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()
+    return row is not None
+
+
+def _migrate_legacy(conn):
+    """Move rows from the original flat hardware_metrics table into hosts/samples"""
+    if not _table_exists(conn, "hardware_metrics"):
+        return 0
+    conn.execute("""
+        INSERT OR IGNORE INTO hosts (computer_name, first_seen, last_seen)
+        SELECT computer_name,
+               MIN(CAST(strftime('%s', timestamp) AS INTEGER)),
+               MAX(CAST(strftime('%s', timestamp) AS INTEGER))
+        FROM hardware_metrics
+        WHERE computer_name IS NOT NULL
+        GROUP BY computer_name
+    """)
+    conn.execute("""
+        INSERT INTO samples (id, host_id, ts, cpu_pct, mem_pct, disk_pct)
+        SELECT m.id, h.id, CAST(strftime('%s', m.timestamp) AS INTEGER),
+               CAST(ROUND(m.cpu * ?) AS INTEGER),
+               CAST(ROUND(m.ram * ?) AS INTEGER),
+               CAST(ROUND(m.disk * ?) AS INTEGER)
+        FROM hardware_metrics m JOIN hosts h ON h.computer_name = m.computer_name
+    """, (SCALE, SCALE, SCALE))
+    usb_rows = [
+        (sample_id, device.strip())
+        for sample_id, devices in conn.execute("SELECT id, usb_devices FROM hardware_metrics WHERE usb_devices != ''")
+        for device in devices.split(",")
+        if device.strip()
+    ]
+    conn.executemany("INSERT OR IGNORE INTO sample_usb (sample_id, device) VALUES (?, ?)", usb_rows)
+    migrated = conn.execute("SELECT COUNT(*) FROM hardware_metrics").fetchone()[0]
+    conn.execute("DROP TABLE hardware_metrics")
+    return migrated
+
+
+def _rollup_table_sql(table):
+    columns = ",\n".join(
+        f"    {m}_n INTEGER NOT NULL DEFAULT 0, {m}_sum INTEGER NOT NULL DEFAULT 0, "
+        f"{m}_min INTEGER, {m}_max INTEGER, {m}_hist BLOB"
+        for m in ROLLUP_METRICS
+    )
+    return f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            host_id INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+        {columns},
+            PRIMARY KEY (host_id, bucket)
+        ) WITHOUT ROWID
+    """
+
+
+def _rollup_upsert_sql(table):
+    columns = ["host_id", "bucket"]
+    updates = []
+    for m in ROLLUP_METRICS:
+        columns += [f"{m}_n", f"{m}_sum", f"{m}_min", f"{m}_max", f"{m}_hist"]
+        updates += [
+            f"{m}_n = {m}_n + excluded.{m}_n",
+            f"{m}_sum = {m}_sum + excluded.{m}_sum",
+            f"{m}_min = COALESCE(MIN({m}_min, excluded.{m}_min), {m}_min, excluded.{m}_min)",
+            f"{m}_max = COALESCE(MAX({m}_max, excluded.{m}_max), {m}_max, excluded.{m}_max)",
+            f"{m}_hist = hist_merge({m}_hist, excluded.{m}_hist)",
+        ]
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+        f"ON CONFLICT (host_id, bucket) DO UPDATE SET {', '.join(updates)}"
+    )
+
+
+# Histograms are packed as HIST_BINS little-endian 32-bit counters. Because
+# the bins never overflow into each other, two histograms can be merged with
+# a single big-integer addition instead of a loop over the bins.
+HIST_BYTES = HIST_BINS * 4
+
+
+def hist_encode(counts):
+    return sum(count << (32 * i) for i, count in enumerate(counts)).to_bytes(HIST_BYTES, "little")
+
+
+def hist_unpack(packed):
+    """Bin counts of a histogram held as one packed integer"""
+    return [(packed >> (32 * i)) & 0xFFFFFFFF for i in range(HIST_BINS)]
+
+
+def hist_decode(blob):
+    return hist_unpack(int.from_bytes(blob or b"", "little"))
+
+
+def hist_bin(value):
+    """Bin index of a scaled percentage"""
+    return min(HIST_BINS - 1, max(0, value * HIST_BINS // (100 * SCALE)))
+
+
+def hist_merge(a, b):
+    """SQLite function: add two histogram blobs bin by bin"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (int.from_bytes(a, "little") + int.from_bytes(b, "little")).to_bytes(HIST_BYTES, "little")
+
+
+def hist_percentile(hist, q, low, high):
+    """Estimate the q-th quantile (0..1) from histogram counts, clamped to [low, high]"""
+    total = sum(hist)
+    if not total:
+        return high
+    width = 100 * SCALE / HIST_BINS
+    target = q * total
+    seen = 0
+    for i, count in enumerate(hist):
+        if count and seen + count >= target:
+            value = (i + (target - seen) / count) * width
+            return min(high, max(low, value))
+        seen += count
+    return high
+
+
+class RollupAccumulator:
+    """Folds samples into per-tier buckets before they are upserted"""
+
+    def __init__(self):
+        self.buckets = {table: {} for table in ROLLUP_TIERS}
+        self.partitions = {}
+
+    def add_partition(self, partition_id, ts, pct, total):
+        if pct is None:
+            return
+        key = (partition_id, ts - ts % PARTITION_ROLLUP_WIDTH)
+        bucket = self.partitions.get(key)
+        if bucket is None:
+            self.partitions[key] = [1, pct, total]
+        else:
+            bucket[0] += 1
+            bucket[1] += pct
+            bucket[2] = max(bucket[2] or 0, total or 0)
+
+    def add(self, host_id, ts, values):
+        for table, width in ROLLUP_TIERS.items():
+            key = (host_id, ts - ts % width)
+            bucket = self.buckets[table].get(key)
+            if bucket is None:
+                bucket = self.buckets[table][key] = [[0, 0, None, None, [0] * HIST_BINS] for _ in ROLLUP_METRICS]
+            for agg, value in zip(bucket, values):
+                if value is None:
+                    continue
+                agg[0] += 1
+                agg[1] += value
+                agg[2] = value if agg[2] is None else min(agg[2], value)
+                agg[3] = value if agg[3] is None else max(agg[3], value)
+                agg[4][hist_bin(value)] += 1
+
+    def flush(self, conn):
+        conn.create_function("hist_merge", 2, hist_merge, deterministic=True)
+        for table, buckets in self.buckets.items():
+            rows = []
+            for (host_id, bucket), aggs in buckets.items():
+                row = [host_id, bucket]
+                for n, total, low, high, hist in aggs:
+                    row += [n, total, low, high, hist_encode(hist) if n else None]
+                rows.append(row)
+            conn.executemany(_rollup_upsert_sql(table), rows)
+            buckets.clear()
+        conn.executemany(f"""
+            INSERT INTO {PARTITION_ROLLUP} (partition_id, bucket, n, pct_sum, total_max) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (partition_id, bucket) DO UPDATE SET n = n + excluded.n, pct_sum = pct_sum + excluded.pct_sum,
+                total_max = MAX(COALESCE(total_max, 0), COALESCE(excluded.total_max, 0))
+        """, [(partition_id, bucket, n, total, size) for (partition_id, bucket), (n, total, size) in self.partitions.items()])
+        self.partitions.clear()
+
+
+def _backfill_rollups(conn):
+    accumulator = RollupAccumulator()
+    cursor = conn.execute("SELECT host_id, ts, cpu_pct, mem_pct, swap_pct, disk_pct, cpu_temp FROM samples")
+    while True:
+        rows = cursor.fetchmany(5000)
+        if not rows:
+            break
+        for host_id, ts, *values in rows:
+            accumulator.add(host_id, ts, values)
+    accumulator.flush(conn)
+
+
+def _migrate_v1(conn):
+    conn.executescript(SCHEMA)
+    with conn:
+        migrated = _migrate_legacy(conn)
+    if migrated:
+        print(f"Migrated {migrated} rows from hardware_metrics")
+
+
+def _migrate_v2(conn):
+    with conn:
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_samples_host_ts ON samples (host_id, ts)")
+        for table in ROLLUP_TIERS:
+            conn.execute(_rollup_table_sql(table))
+        _backfill_rollups(conn)
+
+
+def _migrate_v3(conn):
+    # auto_vacuum only takes effect once VACUUM has rebuilt the file; after
+    # that, pages freed by retention can be handed back with incremental_vacuum.
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+
+
+def _migrate_v4(conn):
+    # Only adds the agent self-profiling tables; everything else already exists.
+    conn.executescript(SCHEMA)
+
+
+def _migrate_v5(conn):
+    conn.executescript(SCHEMA)
+    with conn:
+        conn.execute(f"""
+            INSERT OR IGNORE INTO {PARTITION_ROLLUP} (partition_id, bucket, n, pct_sum, total_max)
+            SELECT sp.partition_id, s.ts - s.ts % {PARTITION_ROLLUP_WIDTH}, COUNT(*), SUM(sp.pct), MAX(sp.total)
+            FROM samples s JOIN sample_partitions sp ON sp.sample_id = s.id
+            WHERE sp.pct IS NOT NULL
+            GROUP BY sp.partition_id, s.ts - s.ts % {PARTITION_ROLLUP_WIDTH}
+        """)
+
+
+def _migrate_v6(conn):
+    # Sample ids must only grow: followers and export cursors resume from the
+    # last id they saw. AUTOINCREMENT keeps the high-water mark in
+    # sqlite_sequence, so ids are not reused after retention deletes the
+    # newest rows. Rebuilding the table is the only way to add it.
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'samples'").fetchone()[0]
+    if "AUTOINCREMENT" in sql.upper():
+        return
+    conn.executescript(f"""
+        BEGIN;
+        ALTER TABLE samples RENAME TO samples_v5;
+        {SCHEMA}
+        INSERT INTO samples SELECT * FROM samples_v5;
+        DROP TABLE samples_v5;
+        CREATE INDEX IF NOT EXISTS idx_samples_host_ts ON samples (host_id, ts);
+        COMMIT;
+    """)
+
+
+MIGRATIONS = {
+    1: _migrate_v1, 2: _migrate_v2, 3: _migrate_v3, 4: _migrate_v4, 5: _migrate_v5, 6: _migrate_v6,
+}
+
+
+def init_schema(conn):
+    """Bring the database up to SCHEMA_VERSION, migrating older layouts"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        MIGRATIONS[target](conn)
+        conn.execute(f"PRAGMA user_version = {target}")
+
+
+class ReadPool:
+    """A few read-only SQLite connections shared by the request worker threads"""
+
+    def __init__(self, db_file, size=4):
+        self.db_file = db_file
+        self._idle = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(None)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute("PRAGMA busy_timeout = 5000")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        conn = self._idle.get()
+        try:
+            if conn is None:
+                conn = self._connect()
+            yield conn
+        except sqlite3.Error:
+            # Do not hand a possibly broken connection to the next caller.
+            conn.close()
+            conn = None
+            raise
+        finally:
+            self._idle.put(conn)
+
+
+class MetricsWriter:
+    """Writes batches of HardwareData into the normalized tables.
+
+    Host, partition and NIC ids are cached between batches so the steady
+    state is one executemany per table; call rollback() if the surrounding
+    transaction fails so ids that were never committed are forgotten.
+    """
+
+    def __init__(self):
+        self._hosts = {}
+        self._partitions = {}
+        self._nics = {}
+
+    def rollback(self):
+        self._hosts.clear()
+        self._partitions.clear()
+        self._nics.clear()
+
+    def __call__(self, conn, batch):
+        self.write(conn, batch)
+
+    def _host_id(self, conn, data, ts):
+        info = data.system_info
+        static = (
+            info.machine_id, info.os, info.os_version, info.architecture, info.processor,
+            data.cpu.physical_cores, data.cpu.total_cores,
+            int(data.cpu.max_frequency) if data.cpu.max_frequency else None,
+            data.gpu.name, to_epoch(info.boot_time, 0),
+        )
+        cached = self._hosts.get(info.computer_name)
+        if cached and cached[1] == static:
+            return cached[0]
+        conn.execute(
+            "INSERT OR IGNORE INTO hosts (computer_name, first_seen) VALUES (?, ?)",
+            (info.computer_name, ts),
+        )
+        conn.execute("""
+            UPDATE hosts SET machine_id = ?, os = ?, os_version = ?, architecture = ?, processor = ?,
+                physical_cores = ?, total_cores = ?, max_frequency = ?, gpu_name = ?, boot_time = ?
+            WHERE computer_name = ?
+        """, static + (info.computer_name,))
+        host_id = conn.execute("SELECT id FROM hosts WHERE computer_name = ?", (info.computer_name,)).fetchone()[0]
+        self._hosts[info.computer_name] = (host_id, static)
+        return host_id
+
+    def _dimension_id(self, conn, cache, table, key_column, host_id, key, attrs):
+        cached = cache.get((host_id, key))
+        if cached and cached[1] == attrs:
+            return cached[0]
+        columns = list(attrs.keys())
+        conn.execute(
+            f"INSERT OR IGNORE INTO {table} (host_id, {key_column}) VALUES (?, ?)",
+            (host_id, key),
+        )
+        conn.execute(
+            f"UPDATE {table} SET {', '.join(c + ' = ?' for c in columns)} WHERE host_id = ? AND {key_column} = ?",
+            tuple(attrs.values()) + (host_id, key),
+        )
+        dim_id = conn.execute(
+            f"SELECT id FROM {table} WHERE host_id = ? AND {key_column} = ?", (host_id, key)
+        ).fetchone()[0]
+        cache[(host_id, key)] = (dim_id, attrs)
+        return dim_id
+
+    def write(self, conn, batch):
+        now = int(time.time())
+        samples, cores, parts, nic_rows, procs, usb = [], [], [], [], [], []
+        agents, agent_collectors = [], []
+        rollups = RollupAccumulator()
+        last_seen = {}
+        resolved = []
+        for data in batch:
+            ts = to_epoch(data.timestamp, now)
+            host_id = self._host_id(conn, data, ts)
+            last_seen[host_id] = max(ts, last_seen.get(host_id, 0))
+            resolved.append((data, ts, host_id))
+
+        # Touching hosts takes the write lock, so sample ids can be assigned
+        # up front and every table filled with a single executemany.
+        conn.executemany(
+            "UPDATE hosts SET last_seen = MAX(COALESCE(last_seen, 0), ?) WHERE id = ?",
+            [(ts, host_id) for host_id, ts in last_seen.items()],
+        )
+        next_id = conn.execute(
+            "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'samples'), 0)"
+        ).fetchone()[0] + 1
+        for sample_id, (data, ts, host_id) in enumerate(resolved, start=next_id):
+            gpu_used, gpu_total = _parse_gpu_memory(data.gpu.memory)
+            mem, disk = data.memory, data.disk
+            cpu_pct = encode_pct(data.cpu.total_cpu_usage)
+            cpu_temp = encode_pct(data.cpu.temperature)
+            mem_pct = encode_pct(mem.percentage)
+            swap_pct = encode_pct(mem.swap_percent)
+            disk_pct = encode_pct(disk_percent(data))
+            samples.append((
+                sample_id, host_id, ts, cpu_pct,
+                int(data.cpu.current_frequency) if data.cpu.current_frequency else None,
+                cpu_temp,
+                mem.total, mem.used, mem.available, mem_pct,
+                mem.swap_total, mem.swap_used, swap_pct,
+                disk_pct, disk.total_read, disk.total_write,
+                gpu_used, gpu_total,
+                data.processes.total, data.processes.running,
+            ))
+            # Same order as ROLLUP_METRICS.
+            rollups.add(host_id, ts, (cpu_pct, mem_pct, swap_pct, disk_pct, cpu_temp))
+            cores.extend((sample_id, i, encode_pct(v)) for i, v in enumerate(data.cpu.cpu_usage_per_core))
+            for p in disk.partitions:
+                part_id = self._dimension_id(
+                    conn, self._partitions, "partitions", "mountpoint", host_id, p.mountpoint,
+                    {"device": p.device, "fstype": p.fstype},
+                )
+                parts.append((sample_id, part_id, p.total, p.used, p.free, encode_pct(p.percent)))
+                rollups.add_partition(part_id, ts, parts[-1][5], p.total)
+            for name, nic in data.network.items():
+                nic_id = self._dimension_id(
+                    conn, self._nics, "nics", "name", host_id, name,
+                    {"speed": nic.speed, "ipv4": nic.ipv4, "ipv6": nic.ipv6},
+                )
+                nic_rows.append((sample_id, nic_id, nic.bytes_sent, nic.bytes_recv))
+            procs.extend(
+                (sample_id, rank, p.pid, p.name, encode_pct(p.cpu_percent), encode_pct(p.memory_percent), p.status)
+                for rank, p in enumerate(data.processes.top_cpu)
+            )
+            usb.extend((sample_id, device) for device in set(data.usb_devices))
+            agent = data.agent
+            if agent is not None:
+                process, transport = agent.process, agent.transport
+                agents.append((
+                    sample_id,
+                    encode_pct(process.cpu_percent) if process else None,
+                    process.rss_bytes if process else None,
+                    process.threads if process else None,
+                    _us(transport.send_ms) if transport else None,
+                    _us(transport.send_max_ms) if transport else None,
+                    transport.requests if transport else None,
+                    transport.errors if transport else None,
+                    transport.dropped if transport else None,
+                    transport.raw_bytes if transport else None,
+                    transport.wire_bytes if transport else None,
+                ))
+                agent_collectors.extend(
+                    (sample_id, name, c.runs, c.errors, c.timeouts, _us(c.avg_ms), _us(c.max_ms), _us(c.cpu_ms))
+                    for name, c in agent.collectors.items()
+                )
+
+        conn.executemany(
+            "INSERT INTO samples VALUES (" + ", ".join("?" * 20) + ")", samples
+        )
+        conn.executemany("INSERT INTO sample_cores VALUES (?, ?, ?)", cores)
+        conn.executemany("INSERT INTO sample_partitions VALUES (?, ?, ?, ?, ?, ?)", parts)
+        conn.executemany("INSERT INTO sample_nics VALUES (?, ?, ?, ?)", nic_rows)
+        conn.executemany("INSERT INTO sample_processes VALUES (?, ?, ?, ?, ?, ?, ?)", procs)
+        conn.executemany("INSERT INTO sample_usb VALUES (?, ?)", usb)
+        conn.executemany("INSERT INTO sample_agent VALUES (" + ", ".join("?" * 11) + ")", agents)
+        conn.executemany("INSERT INTO sample_agent_collectors VALUES (?, ?, ?, ?, ?, ?, ?, ?)", agent_collectors)
+        rollups.flush(conn)
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import threading
+from collections import OrderedDict
+
+
+class Subscriber:
+    """One live-stream client with a bounded, per-host coalescing buffer.
+
+    Only the newest row per host is kept; when more than max_pending hosts
+    are waiting the oldest one is dropped, so a slow reader costs at most
+    max_pending rows of memory no matter how fast samples arrive.
+    """
+
+    def __init__(self, loop, hosts=None, max_pending=1000):
+        self.loop = loop
+        self.hosts = set(hosts) if hosts else None
+        self.max_pending = max_pending
+        self.pending = OrderedDict()
+        self.version = 0
+        self.dropped = 0
+        self.ready = asyncio.Event()
+
+    def wants(self, name):
+        return self.hosts is None or name in self.hosts
+
+    def offer(self, version, rows):
+        # Runs on the subscriber's event loop.
+        for row in rows:
+            name = row["computer"]
+            self.pending.pop(name, None)
+            self.pending[name] = row
+            if len(self.pending) > self.max_pending:
+                self.pending.popitem(last=False)
+                self.dropped += 1
+        self.version = max(self.version, version)
+        self.ready.set()
+
+    def drain(self):
+        rows = list(self.pending.values())
+        self.pending.clear()
+        self.ready.clear()
+        return self.version, rows
+
+
+class Broadcaster:
+    """Fans out changed host rows from the ingest thread to stream clients"""
+
+    def __init__(self, max_pending=1000):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self.published = 0
+
+    def subscribe(self, hosts=None):
+        subscriber = Subscriber(asyncio.get_running_loop(), hosts, self.max_pending)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, version, rows):
+        if not rows:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        self.published += len(rows)
+        for subscriber in subscribers:
+            wanted = [row for row in rows if subscriber.wants(row["computer"])]
+            if not wanted:
+                continue
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.offer, version, wanted)
+            except RuntimeError:
+                # The subscriber's loop is gone; forget about it.
+                self.unsubscribe(subscriber)
+
+    def stats(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return {
+            "subscribers": len(subscribers),
+            "published_rows": self.published,
+            "pending_rows": sum(len(s.pending) for s in subscribers),
+            "dropped_rows": sum(s.dropped for s in subscribers),
+        }
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+async def sse_stream(request, broadcaster, snapshot, hosts=None, keepalive=15.0):
+    """Yield a snapshot event, then coalesced update events until the client leaves"""
+    subscriber = broadcaster.subscribe(hosts)
+    try:
+        version, rows = snapshot()
+        yield sse_event("snapshot", {"version": version, "hosts": [r for r in rows if subscriber.wants(r["computer"])]})
+        while not await request.is_disconnected():
+            try:
+                await asyncio.wait_for(subscriber.ready.wait(), keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            version, rows = subscriber.drain()
+            yield sse_event("update", {"version": version, "hosts": rows})
+    finally:
+        broadcaster.unsubscribe(subscriber)
@@ -0,0 +1,28 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+# main initializes its database on import; keep that out of the working tree.
+os.environ.setdefault("HARDWARE_DB", os.path.join(tempfile.mkdtemp(prefix="hardware-tests-"), "hardware.db"))
+
+
+@pytest.fixture
+def make_report():
+    """HardwareData for a host at an epoch second, built from main.sample_hardware_data"""
+    import main
+    from storage import from_epoch
+
+    def build(host="host-1", ts=1_700_000_000, cpu=45.5, mem=60.0, disk=75.2):
+        data = main.sample_hardware_data(host)
+        data.timestamp = from_epoch(ts)
+        data.cpu.total_cpu_usage = cpu
+        data.memory.percentage = mem
+        data.disk.partitions[0].percent = disk
+        return data
+
+    return build
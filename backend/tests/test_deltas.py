@@ -0,0 +1,161 @@
+import importlib.util
+import inspect
+import json
+import os
+
+import pytest
+
+import deltas
+
+
+def _load_agent_delta():
+    path = os.path.join(os.path.dirname(__file__), "..", "..", "client-agent", "delta.py")
+    spec = importlib.util.spec_from_file_location("agent_delta", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+agent_delta = _load_agent_delta()
+
+# The relay keeps a copy of the server's delta state machine; every test
+# below runs against both so the copies cannot drift apart.
+IMPLEMENTATIONS = [
+    pytest.param((deltas.DeltaState, deltas.patch), id="backend"),
+    pytest.param((agent_delta.DeltaDecoder, agent_delta.patch), id="relay"),
+]
+
+
+@pytest.fixture(params=IMPLEMENTATIONS)
+def impl(request):
+    return request.param
+
+
+@pytest.fixture
+def make_state(impl):
+    return impl[0]
+
+
+def full(session, seq, report):
+    return {"session": session, "seq": seq, "full": report}
+
+
+def change(session, seq, changes, unset=None):
+    message = {"session": session, "seq": seq, "set": changes}
+    if unset:
+        message["unset"] = unset
+    return message
+
+
+def accept_all(report):
+    return report
+
+
+def test_relay_copy_matches_the_backend():
+    assert inspect.getsource(agent_delta.patch) == inspect.getsource(deltas.patch)
+    for name in ("_expire", "_apply", "apply_many", "stats"):
+        backend = inspect.getsource(getattr(deltas.DeltaState, name))
+        relay = inspect.getsource(getattr(agent_delta.DeltaDecoder, name))
+        assert relay == backend, name
+
+
+def test_patch_shares_untouched_parts_and_leaves_base_alone(impl):
+    patch = impl[1]
+    base = {"cpu": {"total": 10, "cores": [1, 2]}, "memory": {"pct": 50}, "gpu": {"name": "x", "memory": "1"}}
+    result = patch(base, {"cpu": {"total": 20}}, [["gpu", "memory"]])
+    assert result == {"cpu": {"total": 20, "cores": [1, 2]}, "memory": {"pct": 50}, "gpu": {"name": "x"}}
+    assert result["memory"] is base["memory"]
+    assert base["cpu"]["total"] == 10
+    assert base["gpu"] == {"name": "x", "memory": "1"}
+
+
+def test_diffs_rebuild_full_reports_in_order(make_state):
+    state = make_state()
+    reports, resync = state.apply_many([
+        full("a", 1, {"cpu": 10, "ram": 50}),
+        change("a", 2, {"cpu": 20}),
+        change("a", 3, {"ram": 55}),
+    ], accept_all)
+    assert resync is False
+    assert reports == [{"cpu": 10, "ram": 50}, {"cpu": 20, "ram": 50}, {"cpu": 20, "ram": 55}]
+    assert state.stats() == {"sessions": 1, "full": 1, "deltas": 2, "resyncs": 0}
+
+
+def test_gap_stops_the_batch_and_asks_for_resync(make_state):
+    state = make_state()
+    state.apply_many([full("a", 1, {"cpu": 10})], accept_all)
+    reports, resync = state.apply_many([change("a", 2, {"cpu": 11}), change("a", 4, {"cpu": 13})], accept_all)
+    assert reports == [{"cpu": 11}]
+    assert resync is True
+    # The prefix before the gap was applied: seq 3 now follows on.
+    reports, resync = state.apply_many([change("a", 3, {"cpu": 12})], accept_all)
+    assert (reports, resync) == ([{"cpu": 12}], False)
+
+
+def test_unknown_session_needs_a_full_report_first(make_state):
+    state = make_state()
+    reports, resync = state.apply_many([change("new", 7, {"cpu": 1})], accept_all)
+    assert (reports, resync) == ([], True)
+    reports, resync = state.apply_many([full("new", 8, {"cpu": 1}), change("new", 9, {"cpu": 2})], accept_all)
+    assert (reports, resync) == ([{"cpu": 1}, {"cpu": 2}], False)
+    assert state.stats()["resyncs"] == 1
+
+
+def test_a_rejected_batch_leaves_sessions_where_they_were(make_state):
+    state = make_state()
+    state.apply_many([full("a", 1, {"cpu": 10})], accept_all)
+
+    def validate(report):
+        if report["cpu"] < 0:
+            raise ValueError("negative cpu")
+        return report
+
+    batch = [change("a", 2, {"cpu": 11}), change("a", 3, {"cpu": -1})]
+    with pytest.raises(ValueError):
+        state.apply_many(batch, validate)
+    # The agent resends the batch with the bad report fixed; seq 2 still applies.
+    batch[1] = change("a", 3, {"cpu": 12})
+    reports, resync = state.apply_many(batch, validate)
+    assert (reports, resync) == ([{"cpu": 11}, {"cpu": 12}], False)
+
+
+def test_sessions_only_advance_once_accepted(make_state):
+    state = make_state()
+    state.apply_many([full("a", 1, {"cpu": 10})], accept_all)
+
+    def queue_full(reports):
+        raise RuntimeError("queue full")
+
+    with pytest.raises(RuntimeError):
+        state.apply_many([change("a", 2, {"cpu": 11})], accept_all, queue_full)
+    accepted = []
+    reports, resync = state.apply_many([change("a", 2, {"cpu": 11})], accept_all, accepted.extend)
+    assert accepted == reports == [{"cpu": 11}]
+    assert resync is False
+
+
+def test_idle_sessions_expire(make_state):
+    state = make_state(max_sessions=2)
+    for name in ("a", "b", "c"):
+        state.apply_many([full(name, 1, {"cpu": 1})], accept_all)
+    assert state.stats()["sessions"] == 2
+    assert state.apply_many([change("a", 2, {"cpu": 2})], accept_all) == ([], True)
+
+
+def test_delta_endpoint_resync_and_bad_batches(make_report):
+    import main
+    from fastapi.testclient import TestClient
+
+    client = TestClient(main.app)
+    report = json.loads(make_report("delta-host").model_dump_json())
+    headers = {"Content-Type": "application/json"}
+    post = lambda messages: client.post("/update-hardware/delta", content=json.dumps(messages), headers=headers)
+
+    response = post([full("s1", 1, report), change("s1", 2, {"cpu": {"total_cpu_usage": 12.5}})])
+    assert response.status_code == 202
+    assert response.json()["accepted"] == 2 and response.json()["resync"] is False
+
+    response = post([change("s1", 3, {"cpu": {"total_cpu_usage": "busy"}})])
+    assert response.status_code == 422
+    response = post([change("s1", 3, {"cpu": {"total_cpu_usage": 13.0}}), change("s1", 5, {})])
+    assert response.json()["accepted"] == 1 and response.json()["resync"] is True
@@ -0,0 +1,165 @@
+import threading
+import time
+
+import pytest
+
+from ingest import IngestPipeline, IngestQueueFull
+
+
+class RecordingWriter:
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+        self.rollbacks = 0
+
+    def __call__(self, conn, batch):
+        if self.fail:
+            raise RuntimeError("disk on fire")
+        self.batches.append(list(batch))
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    return str(tmp_path / "ingest.db")
+
+
+def test_queued_samples_are_group_committed(db_file):
+    writer = RecordingWriter()
+    pipeline = IngestPipeline(db_file, writer, max_queue=1000, batch_size=40, flush_interval=0.2)
+    for i in range(100):
+        pipeline.submit(i)
+    pipeline.start()
+    try:
+        wait_for(lambda: pipeline.stats()["committed"] == 100)
+    finally:
+        pipeline.stop()
+    assert [len(batch) for batch in writer.batches] == [40, 40, 20]
+    assert [sample for batch in writer.batches for sample in batch] == list(range(100))
+    stats = pipeline.stats()
+    assert stats["batches"] == 3
+    assert stats["max_batch_size"] == 40
+
+
+def test_listeners_see_each_committed_batch(db_file):
+    seen = []
+    done = threading.Event()
+    pipeline = IngestPipeline(db_file, RecordingWriter(), batch_size=10, flush_interval=0.05)
+    pipeline.add_listener(lambda batch: (seen.append(list(batch)), done.set()))
+    pipeline.start()
+    try:
+        pipeline.submit_many(["a", "b", "c"])
+        assert done.wait(5)
+    finally:
+        pipeline.stop()
+    assert seen == [["a", "b", "c"]]
+
+
+def test_full_queue_rejects_instead_of_blocking(db_file):
+    pipeline = IngestPipeline(db_file, RecordingWriter(), max_queue=3)
+    for i in range(3):
+        pipeline.submit(i)
+    started = time.monotonic()
+    with pytest.raises(IngestQueueFull):
+        pipeline.submit(3)
+    assert time.monotonic() - started < 0.5
+    stats = pipeline.stats()
+    assert stats["accepted"] == 3
+    assert stats["rejected"] == 1
+    assert stats["queue_depth"] == stats["queue_capacity"] == 3
+
+
+def test_submit_many_is_all_or_nothing(db_file):
+    pipeline = IngestPipeline(db_file, RecordingWriter(), max_queue=5)
+    pipeline.submit_many([1, 2, 3])
+    with pytest.raises(IngestQueueFull):
+        pipeline.submit_many([4, 5, 6])
+    stats = pipeline.stats()
+    assert stats["queue_depth"] == 3
+    assert stats["rejected"] == 3
+
+
+def test_concurrent_submit_many_never_splits_a_batch(db_file):
+    writer = RecordingWriter()
+    pipeline = IngestPipeline(db_file, writer, max_queue=50, batch_size=1000)
+    barrier = threading.Barrier(16)
+    outcomes = {}
+
+    def submit(n):
+        barrier.wait()
+        try:
+            pipeline.submit_many([(n, i) for i in range(7)])
+            outcomes[n] = True
+        except IngestQueueFull:
+            outcomes[n] = False
+
+    threads = [threading.Thread(target=submit, args=(n,)) for n in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    accepted = sorted(n for n, ok in outcomes.items() if ok)
+    assert len(accepted) == 50 // 7
+    pipeline.start()
+    try:
+        wait_for(lambda: pipeline.stats()["committed"] == 7 * len(accepted))
+    finally:
+        pipeline.stop()
+    queued = [sample for batch in writer.batches for sample in batch]
+    assert sorted({n for n, _ in queued}) == accepted
+    stats = pipeline.stats()
+    assert stats["accepted"] == 7 * len(accepted)
+    assert stats["rejected"] == 7 * (16 - len(accepted))
+
+
+def test_failed_batch_is_counted_and_rolled_back(db_file):
+    writer = RecordingWriter(fail=True)
+    pipeline = IngestPipeline(db_file, writer, batch_size=10, flush_interval=0.05)
+    pipeline.submit_many([1, 2])
+    pipeline.start()
+    try:
+        wait_for(lambda: pipeline.stats()["failed"] == 2)
+    finally:
+        pipeline.stop()
+    assert writer.rollbacks == 1
+    assert pipeline.stats()["committed"] == 0
+
+
+def test_stop_drains_the_queue(db_file):
+    writer = RecordingWriter()
+    pipeline = IngestPipeline(db_file, writer, batch_size=5, flush_interval=0.05)
+    pipeline.start()
+    pipeline.submit_many(list(range(12)))
+    pipeline.stop()
+    assert sum(len(batch) for batch in writer.batches) == 12
+
+
+def test_report_endpoints_push_back_when_the_queue_is_full(monkeypatch, db_file, make_report):
+    import main
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(main, "ingest", IngestPipeline(db_file, RecordingWriter(), max_queue=2))
+    client = TestClient(main.app)
+    headers = {"Content-Type": "application/json"}
+    body = make_report().model_dump_json()
+
+    assert client.post("/update-hardware", content=body, headers=headers).status_code == 202
+    response = client.post("/update-hardware/bulk", content=f"[{body},{body}]", headers=headers)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"]
+    assert main.ingest.stats()["queue_depth"] == 1
+    response = client.post("/update-hardware", content=body, headers=headers)
+    assert response.status_code == 202
+    response = client.post("/update-hardware", content=body, headers=headers)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"]
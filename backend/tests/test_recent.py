@@ -0,0 +1,113 @@
+import sqlite3
+
+import pytest
+
+from history import query_history, query_recent
+from recent import HostRing, RecentStore
+from storage import MetricsWriter, init_schema
+
+T0 = 1_700_000_000
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "recent.db"))
+    init_schema(conn)
+    yield conn
+    conn.close()
+
+
+class Fleet:
+    """Writes reports to SQLite and feeds the same committed batches to a RecentStore"""
+
+    def __init__(self, conn, recent, make_report):
+        self.conn = conn
+        self.recent = recent
+        self.make_report = make_report
+        self.writer = MetricsWriter()
+
+    def commit(self, host, timestamps):
+        batch = [self.make_report(host, ts=ts, cpu=ts % 97, mem=ts % 89) for ts in timestamps]
+        with self.conn:
+            self.writer.write(self.conn, batch)
+        self.recent.observe_batch(batch)
+
+
+def without_source(history):
+    return {key: value for key, value in history.items() if key != "source"}
+
+
+def test_memory_and_sqlite_agree_on_a_covered_window(conn, make_report):
+    recent = RecentStore(capacity=100)
+    recent.complete_since = T0
+    Fleet(conn, recent, make_report).commit("pc-1", range(T0, T0 + 300, 5))
+
+    start, end = T0 + 60, T0 + 299
+    memory = query_recent(recent, "pc-1", start, end, step=10)
+    assert memory is not None and memory["source"] == "memory"
+    sqlite = query_history(conn, "pc-1", start, end, step=10)
+    assert sqlite["source"] == "samples"
+    assert without_source(memory) == without_source(sqlite)
+
+
+def test_window_before_the_ring_falls_through_to_sqlite(conn, make_report):
+    recent = RecentStore(capacity=20)
+    recent.complete_since = T0
+    Fleet(conn, recent, make_report).commit("pc-1", range(T0, T0 + 300, 5))
+    # The ring holds the last 20 samples (100 seconds) only.
+    assert query_recent(recent, "pc-1", T0 + 100, T0 + 299, step=10) is None
+    assert query_recent(recent, "pc-1", T0 + 210, T0 + 299, step=10) is not None
+    assert query_recent(recent, "unknown", T0 + 210, T0 + 299, step=10) is None
+
+
+def test_replayed_older_samples_send_the_window_to_sqlite(conn, make_report):
+    recent = RecentStore(capacity=50)
+    recent.complete_since = T0
+    fleet = Fleet(conn, recent, make_report)
+    fleet.commit("pc-1", range(T0, T0 + 100, 10))
+    fleet.commit("pc-1", range(T0 + 200, T0 + 300, 10))
+    # The agent replays what it spooled during the gap after the fresh batch.
+    fleet.commit("pc-1", range(T0 + 100, T0 + 200, 10))
+
+    assert query_recent(recent, "pc-1", T0, T0 + 299, step=10) is None
+    sqlite = query_history(conn, "pc-1", T0, T0 + 299, step=10)
+    assert len(sqlite["points"]) == 30
+    # Windows starting after the replayed samples are still served from memory.
+    assert query_recent(recent, "pc-1", T0 + 200, T0 + 299, step=10) is not None
+
+
+def test_resent_samples_do_not_mark_a_gap():
+    ring = HostRing(10)
+    values = (1000, 2000, 0, 5000, None)
+    for ts in (T0, T0 + 5, T0 + 10):
+        assert ring.append(ts, values)
+    assert not ring.append(T0 + 5, values)
+    assert ring.gap_ts is None
+    assert not ring.append(T0 + 7, values)
+    assert ring.gap_ts == T0 + 7
+    assert ring.complete(T0 + 8) and not ring.complete(T0 + 7)
+
+
+def test_gap_is_forgotten_once_the_ring_wraps_past_it():
+    recent = RecentStore(capacity=5)
+    recent.complete_since = T0
+    recent.observe_many([("pc-1", T0 + 10, (10.0, 20.0, 50.0, 0.0, None))])
+    recent.observe_many([("pc-1", T0 + 5, (10.0, 20.0, 50.0, 0.0, None))])
+    assert not recent.covers("pc-1", T0 + 5)
+    for i in range(5):
+        recent.observe_many([("pc-1", T0 + 20 + i, (10.0, 20.0, 50.0, 0.0, None))])
+    assert recent.covers("pc-1", T0 + 20)
+
+
+def test_warm_load_matches_live_feed(conn, make_report):
+    live = RecentStore(capacity=100)
+    live.complete_since = T0
+    Fleet(conn, live, make_report).commit("pc-1", range(T0, T0 + 200, 5))
+
+    warm = RecentStore(capacity=100)
+    assert warm.load(conn, T0) == 40
+    assert warm.complete_since == T0
+    assert warm.buckets("pc-1", T0, T0 + 199, 20) == live.buckets("pc-1", T0, T0 + 199, 20)
+    series = warm.series("pc-1", T0)
+    assert series["samples"] == 40
+    assert len(series["series"]["cores"]) == 4
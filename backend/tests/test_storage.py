@@ -0,0 +1,159 @@
+import sqlite3
+import time
+
+import pytest
+
+from storage import (
+    PARTITION_ROLLUP, SCALE, SCHEMA_VERSION, MetricsWriter, hist_decode, init_schema, to_epoch,
+)
+
+LEGACY_SCHEMA = """
+CREATE TABLE hardware_metrics (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    computer_name TEXT,
+    cpu REAL,
+    ram REAL,
+    disk REAL,
+    usb_devices TEXT,
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "storage.db"))
+    yield conn
+    conn.close()
+
+
+def tables(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def test_naive_timestamps_are_read_as_utc(monkeypatch):
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    try:
+        assert to_epoch("2024-01-01T10:00:00") == 1704103200
+        assert to_epoch("2024-01-01T10:00:00+00:00") == 1704103200
+        assert to_epoch("2024-01-01T05:00:00-05:00") == 1704103200
+        assert to_epoch("not a time", 7) == 7
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+
+def test_fresh_database_gets_the_current_schema(conn):
+    init_schema(conn)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert {"hosts", "samples", "sample_partitions", "rollup_1m", "rollup_1h", PARTITION_ROLLUP} <= tables(conn)
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2  # incremental
+
+
+def test_init_schema_is_idempotent(conn):
+    init_schema(conn)
+    init_schema(conn)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+
+
+def test_legacy_rows_are_migrated_and_rolled_up(conn):
+    conn.execute(LEGACY_SCHEMA)
+    conn.executemany(
+        "INSERT INTO hardware_metrics (computer_name, cpu, ram, disk, usb_devices, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            ("pc-1", 10.0, 40.0, 70.0, "/dev/sdb1, /dev/sdc1", "2024-01-01 10:00:00"),
+            ("pc-1", 30.0, 60.0, 71.0, "", "2024-01-01 10:00:30"),
+            ("pc-2", 50.5, 20.0, 10.0, "/dev/sdb1", "2024-01-01 11:15:00"),
+        ],
+    )
+    conn.commit()
+    init_schema(conn)
+
+    assert "hardware_metrics" not in tables(conn)
+    hosts = dict(conn.execute("SELECT computer_name, id FROM hosts"))
+    assert set(hosts) == {"pc-1", "pc-2"}
+    rows = conn.execute("SELECT host_id, ts, cpu_pct, mem_pct, disk_pct FROM samples ORDER BY ts").fetchall()
+    assert rows[0] == (hosts["pc-1"], 1704103200, 10 * SCALE, 40 * SCALE, 70 * SCALE)
+    assert rows[2][2] == 5050
+    usb = conn.execute("SELECT device FROM sample_usb ORDER BY device").fetchall()
+    assert usb == [("/dev/sdb1",), ("/dev/sdb1",), ("/dev/sdc1",)]
+
+    n, total, low, high, hist = conn.execute(
+        "SELECT cpu_n, cpu_sum, cpu_min, cpu_max, cpu_hist FROM rollup_1m WHERE host_id = ? AND bucket = ?",
+        (hosts["pc-1"], 1704103200),
+    ).fetchone()
+    assert (n, total, low, high) == (2, 40 * SCALE, 10 * SCALE, 30 * SCALE)
+    assert sum(hist_decode(hist)) == 2
+    assert conn.execute("SELECT cpu_n FROM rollup_1h WHERE host_id = ?", (hosts["pc-2"],)).fetchone() == (1,)
+
+
+def test_v4_database_gets_partition_rollups_backfilled(conn, make_report):
+    init_schema(conn)
+    writer = MetricsWriter()
+    with conn:
+        writer.write(conn, [make_report(ts=1_700_000_000 + i * 600, disk=50 + i) for i in range(12)])
+    expected = conn.execute(f"SELECT * FROM {PARTITION_ROLLUP} ORDER BY bucket").fetchall()
+    # Back to a v4 layout: no partition rollup yet.
+    conn.execute(f"DROP TABLE {PARTITION_ROLLUP}")
+    conn.execute("PRAGMA user_version = 4")
+    init_schema(conn)
+    assert conn.execute(f"SELECT * FROM {PARTITION_ROLLUP} ORDER BY bucket").fetchall() == expected
+
+
+def test_v5_samples_table_is_rebuilt_with_autoincrement(conn, make_report):
+    init_schema(conn)
+    with conn:
+        MetricsWriter().write(conn, [make_report(ts=1_700_000_000 + i) for i in range(3)])
+    # Back to a v5 layout: plain INTEGER PRIMARY KEY, no sqlite_sequence entry.
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'samples'").fetchone()[0]
+    conn.executescript(f"""
+        ALTER TABLE samples RENAME TO samples_new;
+        {sql.replace("AUTOINCREMENT", "")};
+        INSERT INTO samples SELECT * FROM samples_new;
+        DROP TABLE samples_new;
+        PRAGMA user_version = 5;
+    """)
+    init_schema(conn)
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'samples'").fetchone()[0]
+    assert "AUTOINCREMENT" in sql
+    assert [row[0] for row in conn.execute("SELECT id FROM samples ORDER BY id")] == [1, 2, 3]
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'idx_samples_host_ts'").fetchone()
+
+
+def test_sample_ids_are_not_reused_after_retention(conn, make_report):
+    init_schema(conn)
+    writer = MetricsWriter()
+    with conn:
+        writer.write(conn, [make_report(ts=1_700_000_000 + i) for i in range(3)])
+    with conn:
+        conn.execute("DELETE FROM samples")
+    with conn:
+        writer.write(conn, [make_report(ts=1_700_000_100)])
+    assert conn.execute("SELECT id FROM samples").fetchall() == [(4,)]
+
+
+def test_writer_fills_samples_details_and_rollups(conn, make_report):
+    init_schema(conn)
+    writer = MetricsWriter()
+    with conn:
+        writer.write(conn, [make_report("pc-1", ts=1_700_000_000, cpu=20.0), make_report("pc-1", ts=1_700_000_005, cpu=40.0)])
+    assert conn.execute("SELECT COUNT(*) FROM samples").fetchone() == (2,)
+    assert conn.execute("SELECT COUNT(*) FROM sample_cores").fetchone() == (8,)
+    assert conn.execute("SELECT COUNT(*) FROM partitions").fetchone() == (1,)
+    assert conn.execute("SELECT cpu_n, cpu_sum FROM rollup_1m").fetchone() == (2, 60 * SCALE)
+    n, pct_sum = conn.execute(f"SELECT n, pct_sum FROM {PARTITION_ROLLUP}").fetchone()
+    assert (n, pct_sum) == (2, 2 * 7520)
+
+
+def test_writer_rollback_forgets_uncommitted_ids(conn, make_report):
+    init_schema(conn)
+    writer = MetricsWriter()
+    conn.execute("BEGIN")
+    writer.write(conn, [make_report("pc-9")])
+    conn.rollback()
+    writer.rollback()
+    with conn:
+        writer.write(conn, [make_report("pc-9", ts=1_700_000_100)])
+    assert conn.execute("SELECT COUNT(*) FROM hosts WHERE computer_name = 'pc-9'").fetchone() == (1,)
+    assert conn.execute("SELECT COUNT(*) FROM samples").fetchone() == (1,)
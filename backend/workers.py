@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import BLOCKING_CALL, BLOCKING_WAIT
+
+
+class PoolBusy(Exception):
+    """Raised when a pool already has max_pending calls queued or running"""
+
+
+class BlockingPool:
+    """Bounded thread pool that async handlers use for blocking work.
+
+    SQLite queries, psutil walks and subprocesses run here instead of on
+    the event loop, so one slow call cannot stall unrelated requests such
+    as /health. At most max_pending calls may be queued or running; beyond
+    that run() raises PoolBusy instead of letting the backlog grow. Every
+    call is timed per label (queue wait and run time separately).
+    """
+
+    def __init__(self, name, max_workers=4, max_pending=64, samples=512):
+        self.name = name
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._samples = samples
+        self._timings = {}
+
+    def _record(self, label, waited, ran, failed):
+        BLOCKING_CALL.observe(ran, self.name, label)
+        BLOCKING_WAIT.observe(waited, self.name, label)
+        with self._lock:
+            timing = self._timings.get(label)
+            if timing is None:
+                timing = self._timings[label] = {
+                    "calls": 0, "errors": 0, "wait_ms": 0.0, "max_ms": 0.0,
+                    "recent": deque(maxlen=self._samples),
+                }
+            timing["calls"] += 1
+            timing["errors"] += failed
+            timing["wait_ms"] += waited * 1000
+            timing["max_ms"] = max(timing["max_ms"], ran * 1000)
+            timing["recent"].append(ran * 1000)
+
+    async def run(self, label, func, *args, timeout=None):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise PoolBusy(f"{self.name} pool is busy")
+            self._pending += 1
+        submitted = time.perf_counter()
+
+        def call():
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = func(*args)
+                failed = False
+                return result
+            finally:
+                self._record(label, started - submitted, time.perf_counter() - started, failed)
+                with self._lock:
+                    self._pending -= 1
+
+        future = asyncio.get_running_loop().run_in_executor(self._executor, call)
+        return await asyncio.wait_for(future, timeout) if timeout else await future
+
+    def stats(self):
+        with self._lock:
+            result = {"pending": self._pending, "max_pending": self.max_pending, "calls": {}}
+            for label, timing in self._timings.items():
+                recent = sorted(timing["recent"])
+                result["calls"][label] = {
+                    "calls": timing["calls"],
+                    "errors": timing["errors"],
+                    "avg_wait_ms": round(timing["wait_ms"] / timing["calls"], 2),
+                    "p50_ms": round(recent[len(recent) // 2], 2) if recent else 0.0,
+                    "p99_ms": round(recent[min(len(recent) - 1, int(len(recent) * 0.99))], 2) if recent else 0.0,
+                    "max_ms": round(timing["max_ms"], 2),
+                }
+            return result
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Per-request CPU cost of decoding reports and encoding responses.
+
+    python benchmarks/bench_codec.py --label orjson
+
+Compares the generic path (json.loads into HardwareData(**dict), and
+FastAPI's jsonable_encoder + json.dumps for responses) with the codec fast
+paths: pydantic-core validating straight from JSON bytes, MessagePack when
+installed, orjson for responses and the per-version encoded /get-hardware
+cache. Times are CPU microseconds per operation (best of --repeat runs).
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "backend"))
+sys.path.insert(0, HERE)
+
+from bench_ingest import RESULTS_DIR, git_revision  # noqa: E402
+from simulator import fleet  # noqa: E402
+
+
+def cpu_us(func, number, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.process_time()
+        for _ in range(number):
+            func()
+        best = min(best, time.process_time() - started)
+    return round(best / number * 1e6, 2)
+
+
+def run(args):
+    os.environ["HARDWARE_DB"] = os.path.join(tempfile.mkdtemp(prefix="hwbench-"), "hardware.db")
+    from fastapi.encoders import jsonable_encoder
+
+    import codec
+    from main import HardwareData
+    from state import LatestState
+
+    hosts = fleet(args.hosts, seed=args.seed)
+    reports = [host.report() for host in hosts]
+    one = json.dumps(reports[0]).encode()
+    batch = json.dumps(reports[:args.batch]).encode()
+    results = {"decode": {}, "encode": {}}
+    decode = results["decode"]
+
+    decode["single_json_baseline"] = cpu_us(lambda: HardwareData(**json.loads(one)), args.number, args.repeat)
+    decode["single_json_fast"] = cpu_us(
+        lambda: codec.decode_models(one, "application/json", None, HardwareData), args.number, args.repeat
+    )
+    decode[f"bulk{args.batch}_json_baseline"] = cpu_us(
+        lambda: [HardwareData(**r) for r in json.loads(batch)], max(1, args.number // args.batch), args.repeat
+    )
+    decode[f"bulk{args.batch}_json_fast"] = cpu_us(
+        lambda: codec.decode_models(batch, "application/json", None, HardwareData),
+        max(1, args.number // args.batch), args.repeat,
+    )
+    if codec.msgpack is not None:
+        packed = codec.msgpack.packb(reports[:args.batch], use_bin_type=True)
+        decode[f"bulk{args.batch}_msgpack"] = cpu_us(
+            lambda: codec.decode_models(packed, "application/msgpack", None, HardwareData),
+            max(1, args.number // args.batch), args.repeat,
+        )
+        results["bytes"] = {"json": len(batch), "msgpack": len(packed)}
+
+    state = LatestState()
+    state.update([HardwareData(**r) for r in reports])
+    version, rows = state.rows()
+    encode = results["encode"]
+    number = max(1, args.number // 10)
+    encode[f"get_hardware_{args.hosts}_baseline"] = cpu_us(
+        lambda: json.dumps(jsonable_encoder(rows)).encode(), number, args.repeat
+    )
+    encode[f"get_hardware_{args.hosts}_fast"] = cpu_us(lambda: codec.encode(rows), number, args.repeat)
+    encode[f"get_hardware_{args.hosts}_cached"] = cpu_us(
+        lambda: state.encoded_rows(codec.encode, codec.JSON_TYPE), number, args.repeat
+    )
+    if codec.msgpack is not None:
+        encode[f"get_hardware_{args.hosts}_msgpack"] = cpu_us(
+            lambda: codec.encode(rows, codec.MSGPACK_TYPES[0]), number, args.repeat
+        )
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=1000, help="hosts in the /get-hardware response")
+    parser.add_argument("--batch", type=int, default=50, help="reports per bulk body")
+    parser.add_argument("--number", type=int, default=2000, help="operations per timing run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="codec")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    result = run(args)
+    print(f"\n{'operation':<36}{'CPU us/op':>12}")
+    for group in ("decode", "encode"):
+        for name, value in result[group].items():
+            print(f"{name:<36}{value:>12}")
+    if "bytes" in result:
+        print(f"\nbulk body: {result['bytes']['json']} bytes JSON, {result['bytes']['msgpack']} bytes MessagePack")
+
+    if not args.no_save:
+        record = {
+            "label": args.label,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {k: v for k, v in vars(args).items() if k != "no_save"},
+            **result,
+        }
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{record['timestamp'].replace(':', '')}-{args.label}.json")
+        with open(path, "w") as f:
+            json.dump(record, f, indent=2)
+        print(f"\nSaved {path}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""Fleet-scale benchmark: simulated agents and dashboard readers against an in-process backend.
+
+    python benchmarks/bench_ingest.py --hosts 500 --interval 5 --duration 60 --label baseline
+    python benchmarks/bench_ingest.py --hosts 500 --compare benchmarks/results/<earlier>.json
+
+Each run uses a fresh database in a temporary directory and writes its
+results as JSON to benchmarks/results/ so runs can be compared over time.
+Latencies are measured client-side through httpx's ASGI transport, so they
+include request parsing and validation but no real network.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+RESULTS_DIR = os.path.join(HERE, "results")
+
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+sys.path.insert(0, HERE)
+
+from simulator import fleet  # noqa: E402
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class Recorder:
+    """Latency samples and status counts per endpoint"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+
+    def add(self, endpoint, seconds, status):
+        self.latencies.setdefault(endpoint, []).append(seconds * 1000)
+        counts = self.statuses.setdefault(endpoint, {})
+        counts[status] = counts.get(status, 0) + 1
+
+    async def timed(self, endpoint, request):
+        started = time.perf_counter()
+        try:
+            response = await request
+            status = response.status_code
+        except Exception as e:
+            status = type(e).__name__
+        self.add(endpoint, time.perf_counter() - started, status)
+
+    def summary(self):
+        result = {}
+        for endpoint, values in self.latencies.items():
+            statuses = self.statuses[endpoint]
+            ok = sum(count for status, count in statuses.items() if isinstance(status, int) and status < 400)
+            result[endpoint] = {
+                "requests": len(values),
+                "errors": len(values) - ok,
+                "statuses": {str(status): count for status, count in statuses.items()},
+                "p50_ms": round(percentile(values, 0.50), 2),
+                "p99_ms": round(percentile(values, 0.99), 2),
+                "max_ms": round(max(values), 2),
+            }
+        return result
+
+
+def db_bytes(db_file):
+    return sum(os.path.getsize(path) for path in (db_file, db_file + "-wal") if os.path.exists(path))
+
+
+async def agent_loop(client, recorder, host, args, deadline):
+    # Random phase so the fleet does not report in lock-step.
+    await asyncio.sleep(random.uniform(0, args.interval))
+    while time.monotonic() < deadline:
+        next_at = time.monotonic() + args.interval
+        if args.batch > 1:
+            reports = [host.report() for _ in range(args.batch)]
+            await recorder.timed("/update-hardware/bulk", client.post("/update-hardware/bulk", json=reports))
+        else:
+            await recorder.timed("/update-hardware", client.post("/update-hardware", json=host.report()))
+        await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+
+
+async def reader_loop(client, recorder, hosts, args, deadline):
+    etag = None
+    while time.monotonic() < deadline:
+        next_at = time.monotonic() + args.read_interval
+        headers = {"If-None-Match": etag} if etag else {}
+        started = time.perf_counter()
+        response = await client.get("/get-hardware", headers=headers)
+        recorder.add("/get-hardware", time.perf_counter() - started, response.status_code)
+        etag = response.headers.get("etag", etag)
+        if random.random() < args.history_ratio:
+            host = random.choice(hosts)
+            await recorder.timed(
+                "/hardware/history",
+                client.get(f"/hardware/history/{host.name}", params={"hours": random.choice((1, 6, 24))}),
+            )
+        await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+
+
+async def wait_for_drain(main, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = main.ingest.stats()
+        if not stats["queue_depth"]:
+            # One more flush interval for the batch the writer is holding.
+            await asyncio.sleep(main.ingest.flush_interval * 2)
+            return main.ingest.stats()
+        await asyncio.sleep(0.1)
+    return main.ingest.stats()
+
+
+async def run(args):
+    import httpx
+    import main
+
+    hosts = fleet(args.hosts, seed=args.seed)
+    recorder = Recorder()
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            size_before = db_bytes(main.DB_FILE)
+            committed_before = main.ingest.stats()["committed"]
+            started = time.monotonic()
+            deadline = started + args.duration
+            tasks = [agent_loop(client, recorder, host, args, deadline) for host in hosts]
+            tasks += [reader_loop(client, recorder, hosts, args, deadline) for _ in range(args.readers)]
+            await asyncio.gather(*tasks)
+            sent_for = time.monotonic() - started
+            ingest_stats = await wait_for_drain(main)
+            drained_for = time.monotonic() - started
+            committed = ingest_stats["committed"] - committed_before
+            size_after = db_bytes(main.DB_FILE)
+    return {
+        "endpoints": recorder.summary(),
+        "ingest": {
+            "committed": committed,
+            "rejected": ingest_stats["rejected"],
+            "failed": ingest_stats["failed"],
+            "batches": ingest_stats["batches"],
+            "offered_per_sec": round(args.hosts * args.batch / args.interval, 1),
+            "committed_per_sec": round(committed / drained_for, 1),
+            "send_seconds": round(sent_for, 2),
+            "drain_seconds": round(drained_for - sent_for, 2),
+        },
+        "db": {
+            "bytes_before": size_before,
+            "bytes_after": size_after,
+            "bytes_per_sample": round((size_after - size_before) / committed, 1) if committed else None,
+        },
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_report(result, previous=None):
+    print(f"\n{'endpoint':<24}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for endpoint, stats in sorted(result["endpoints"].items()):
+        line = (f"{endpoint:<24}{stats['requests']:>10}{stats['errors']:>8}"
+                f"{stats['p50_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+        before = (previous or {}).get("endpoints", {}).get(endpoint)
+        if before:
+            line += f"   (was p50 {before['p50_ms']}, p99 {before['p99_ms']})"
+        print(line)
+    ingest, db = result["ingest"], result["db"]
+    print(f"\ningest: {ingest['committed']} samples committed, {ingest['committed_per_sec']}/s "
+          f"(offered {ingest['offered_per_sec']}/s), {ingest['rejected']} rejected, "
+          f"drained {ingest['drain_seconds']}s after load stopped")
+    if previous:
+        print(f"        was {previous['ingest']['committed_per_sec']}/s")
+    print(f"db: {db['bytes_after'] - db['bytes_before']} bytes added, {db['bytes_per_sample']} bytes/sample")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=200, help="simulated agents")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between reports per agent")
+    parser.add_argument("--batch", type=int, default=1, help="reports per request; >1 uses the bulk endpoint")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument("--readers", type=int, default=4, help="simulated dashboards polling /get-hardware")
+    parser.add_argument("--read-interval", type=float, default=1.0)
+    parser.add_argument("--history-ratio", type=float, default=0.2, help="chance a poll also fetches history")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--compare", help="earlier results file to show deltas against")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    workdir = tempfile.mkdtemp(prefix="hwbench-")
+    os.environ["HARDWARE_DB"] = os.path.join(workdir, "hardware.db")
+    # Keep retention passes from competing with the measurement.
+    os.environ.setdefault("MAINTENANCE_INTERVAL", str(10 ** 9))
+    result = asyncio.run(run(args))
+
+    record = {
+        "label": args.label,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("compare", "no_save")},
+        **result,
+    }
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_report(record, previous)
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{record['timestamp'].replace(':', '')}-{args.label}.json")
+        with open(path, "w") as f:
+            json.dump(record, f, indent=2)
+        print(f"\nSaved {path}")
+
+
+if __name__ == "__main__":
+    main_cli()
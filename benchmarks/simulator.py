@@ -0,0 +1,159 @@
+import random
+import uuid
+from datetime import datetime, timedelta
+
+GB = 1024 ** 3
+
+PROCESS_NAMES = (
+    "python", "chrome", "postgres", "java", "node", "dockerd", "sshd", "systemd",
+    "nginx", "code", "firefox", "slack", "explorer.exe", "svchost.exe", "redis-server",
+)
+FSTYPES = ("ext4", "xfs", "btrfs", "NTFS", "apfs")
+GPUS = (("NVIDIA GeForce RTX 3060", 12288), ("NVIDIA Tesla T4", 15360), ("Intel UHD Graphics 630", 0))
+
+
+def _walk(rng, value, spread, low=0.0, high=100.0):
+    """One step of a bounded random walk"""
+    return min(high, max(low, value + rng.uniform(-spread, spread)))
+
+
+class VirtualHost:
+    """A simulated agent whose metrics drift realistically between reports.
+
+    Hardware shape (cores, partitions, NICs, GPU) is picked once per host;
+    usage values follow bounded random walks and byte counters only grow,
+    so the rollups, deltas and history queries see plausible data.
+    """
+
+    def __init__(self, name, seed=None):
+        self.random = random.Random(seed if seed is not None else name)
+        r = self.random
+        self.name = name
+        self.machine_id = str(uuid.UUID(int=r.getrandbits(128)))
+        self.physical_cores = r.choice((2, 4, 6, 8, 16, 32))
+        self.total_cores = self.physical_cores * r.choice((1, 2))
+        self.max_frequency = float(r.choice((2400, 3000, 3600, 4200, 5000)))
+        self.windows = r.random() < 0.4
+        self.memory_total = r.choice((4, 8, 16, 32, 64, 128)) * GB
+        self.swap_total = r.choice((0, 2, 4, 8)) * GB
+        self.partitions = [
+            {
+                "device": f"{chr(67 + i)}:\\" if self.windows else f"/dev/sd{chr(97 + i)}1",
+                "mountpoint": f"{chr(67 + i)}:\\" if self.windows else ("/" if i == 0 else f"/mnt/data{i}"),
+                "fstype": "NTFS" if self.windows else r.choice(FSTYPES),
+                "total": r.choice((128, 256, 512, 1024, 2048)) * GB,
+                "used_pct": r.uniform(10, 90),
+            }
+            for i in range(r.randint(1, 6))
+        ]
+        self.nics = {
+            name: {"speed": r.choice((100, 1000, 10000)), "ipv4": f"10.{r.randint(0, 255)}.{r.randint(0, 255)}.{r.randint(1, 254)}"}
+            for name in ("eth0", "eth1", "wlan0", "docker0")[:r.randint(1, 4)]
+        }
+        self.gpu = r.choice(GPUS)
+        self.cpu = r.uniform(5, 60)
+        self.cores = [r.uniform(0, 100) for _ in range(self.total_cores)]
+        self.mem_pct = r.uniform(20, 80)
+        self.swap_pct = r.uniform(0, 30) if self.swap_total else 0.0
+        self.temperature = r.uniform(35, 70)
+        self.disk_read = r.randint(0, 10 ** 10)
+        self.disk_write = r.randint(0, 10 ** 10)
+        self.net_bytes = {name: [r.randint(0, 10 ** 9), r.randint(0, 10 ** 9)] for name in self.nics}
+        self.process_total = r.randint(80, 600)
+        self.usb = [f"/dev/sd{chr(110 + i)}1" for i in range(r.randint(0, 2))]
+        self.boot_time = datetime.now() - timedelta(seconds=r.randint(600, 30 * 86400))
+
+    def report(self, timestamp=None):
+        """Advance the walks by one interval and return a HardwareData dict"""
+        r = self.random
+        now = timestamp or datetime.now()
+        self.cpu = _walk(r, self.cpu, 8)
+        self.cores = [_walk(r, c, 15) for c in self.cores]
+        self.mem_pct = _walk(r, self.mem_pct, 2, 5, 99)
+        self.swap_pct = _walk(r, self.swap_pct, 1) if self.swap_total else 0.0
+        self.temperature = _walk(r, self.temperature, 2, 25, 95)
+        self.disk_read += r.randint(0, 50 * 1024 ** 2)
+        self.disk_write += r.randint(0, 20 * 1024 ** 2)
+        for counters in self.net_bytes.values():
+            counters[0] += r.randint(0, 5 * 1024 ** 2)
+            counters[1] += r.randint(0, 20 * 1024 ** 2)
+        mem_used = int(self.memory_total * self.mem_pct / 100)
+        swap_used = int(self.swap_total * self.swap_pct / 100)
+        partitions = []
+        for p in self.partitions:
+            p["used_pct"] = _walk(r, p["used_pct"], 0.05, 1, 99.9)
+            used = int(p["total"] * p["used_pct"] / 100)
+            partitions.append({
+                "device": p["device"], "mountpoint": p["mountpoint"], "fstype": p["fstype"],
+                "total": p["total"], "used": used, "free": p["total"] - used, "percent": round(p["used_pct"], 1),
+            })
+        top = sorted(
+            (
+                {
+                    "pid": r.randint(1, 65535),
+                    "name": r.choice(PROCESS_NAMES),
+                    "cpu_percent": round(r.expovariate(1 / 8), 1),
+                    "memory_percent": round(r.expovariate(1 / 2), 2),
+                    "status": r.choice(("running", "sleeping", "sleeping")),
+                }
+                for _ in range(5)
+            ),
+            key=lambda p: p["cpu_percent"],
+            reverse=True,
+        )
+        gpu_name, gpu_total = self.gpu
+        return {
+            "system_info": {
+                "computer_name": self.name,
+                "os": "Windows" if self.windows else "Linux",
+                "os_version": "10.0.19045" if self.windows else "6.5.0-35-generic",
+                "architecture": "AMD64" if self.windows else "x86_64",
+                "processor": "Intel64 Family 6 Model 158" if self.windows else "x86_64",
+                "machine_id": self.machine_id,
+                "boot_time": self.boot_time.isoformat(),
+                "uptime": str(now - self.boot_time).split(".")[0],
+            },
+            "cpu": {
+                "physical_cores": self.physical_cores,
+                "total_cores": self.total_cores,
+                "max_frequency": self.max_frequency,
+                "current_frequency": round(self.max_frequency * r.uniform(0.4, 1.0), 1),
+                "cpu_usage_per_core": [round(c, 1) for c in self.cores],
+                "total_cpu_usage": round(self.cpu, 1),
+                "temperature": None if self.windows else round(self.temperature, 1),
+            },
+            "memory": {
+                "total": self.memory_total,
+                "available": self.memory_total - mem_used,
+                "used": mem_used,
+                "percentage": round(self.mem_pct, 1),
+                "swap_total": self.swap_total,
+                "swap_used": swap_used,
+                "swap_free": self.swap_total - swap_used,
+                "swap_percent": round(self.swap_pct, 1),
+            },
+            "disk": {"partitions": partitions, "total_read": self.disk_read, "total_write": self.disk_write},
+            "network": {
+                name: {
+                    "speed": nic["speed"], "ipv4": nic["ipv4"], "ipv6": None,
+                    "bytes_sent": self.net_bytes[name][0], "bytes_recv": self.net_bytes[name][1],
+                }
+                for name, nic in self.nics.items()
+            },
+            "gpu": {
+                "name": gpu_name,
+                "memory": f"{r.randint(0, gpu_total)}MiB / {gpu_total}MiB" if gpu_total else "Shared",
+            },
+            "processes": {
+                "total": self.process_total + r.randint(-5, 5),
+                "running": r.randint(1, 6),
+                "top_cpu": top,
+            },
+            "usb_devices": list(self.usb),
+            "timestamp": now.isoformat(),
+        }
+
+
+def fleet(size, prefix="sim-host", seed=0):
+    """size virtual hosts with reproducible hardware shapes"""
+    return [VirtualHost(f"{prefix}-{i:05d}", seed=seed * 1_000_003 + i) for i in range(size)]
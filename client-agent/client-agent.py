@@ -1,162 +1,99 @@
-import psutil
-import platform
+import os
+import random
 import socket
-import requests
-import time
 import datetime
-import os
-import sys
-import uuid
 import json
-import subprocess
 
-SERVER_URL = "http://192.168.29.133:5000/update-hardware"
-COMPUTER_NAME = socket.gethostname()
+import psutil
 
-def get_gpu_info():
-    try:
-        if platform.system() == "Windows":
-            import wmi
-            w = wmi.WMI()
-            gpu_info = w.Win32_VideoController()[0]
-            return {
-                "name": gpu_info.Name,
-                "memory": gpu_info.AdapterRAM if hasattr(gpu_info, 'AdapterRAM') else "Unknown"
-            }
-        else:
-            # For Linux systems with nvidia-smi
-            try:
-                output = subprocess.check_output(["nvidia-smi", "--query-gpu=name,memory.total,memory.used", "--format=csv,noheader"]).decode()
-                name, total, used = output.strip().split(",")
-                return {
-                    "name": name.strip(),
-                    "memory": f"{used.strip()}/{total.strip()}"
-                }
-            except:
-                return {"name": "Integrated Graphics", "memory": "Unknown"}
-    except:
-        return {"name": "Unknown", "memory": "Unknown"}
+from collector import Collector, SECTIONS
+from delta import DeltaEncoder
+from mounts import MountWatcher
+from scheduler import Scheduler
+from spool import Spool
+from transport import Transport
+
+SERVER_URL = os.environ.get("SERVER_URL", "http://localhost:5001/update-hardware")
+COMPUTER_NAME = socket.gethostname()
+REPORT_INTERVAL = 5  # seconds between collected reports
+BATCH_SIZE = 3  # reports per request to the bulk endpoint
+BATCH_MAX_DELAY = 15  # seconds a report may wait for its batch to fill
+SPOOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "spool")
+SPOOL_MAX_BYTES = 64 * 1024 * 1024  # on-disk cap for reports buffered during outages
+SPOOL_MAX_AGE = 7 * 86400  # seconds before spooled reports are discarded
+REPLAY_RATE = 20  # spooled reports per second resent after an outage
+SERIALIZATION = "json"  # or "msgpack" (needs the msgpack package on both ends)
+DELTA_REPORTING = True  # send only changed fields after a full snapshot
+DELTA_DEADBAND = 0.5  # float changes smaller than this are not resent
+DELTA_FULL_EVERY = 720  # reports between full snapshots
+MOUNT_PROBE_TIMEOUT = 2  # seconds a mount's disk usage may take before its last value is reported
+MOUNT_PROBE_TIMEOUTS = {}  # per-mountpoint overrides, e.g. {"/mnt/nfs": 5}
 
-def get_network_info():
-    network_info = {}
-    for interface, stats in psutil.net_if_stats().items():
-        if stats.isup:
-            addrs = psutil.net_if_addrs().get(interface, [])
-            ipv4 = next((addr.address for addr in addrs if addr.family == socket.AF_INET), None)
-            ipv6 = next((addr.address for addr in addrs if addr.family == socket.AF_INET6), None)
-            network_info[interface] = {
-                "speed": stats.speed,
-                "ipv4": ipv4,
-                "ipv6": ipv6,
-                "bytes_sent": psutil.net_io_counters(pernic=True)[interface].bytes_sent,
-                "bytes_recv": psutil.net_io_counters(pernic=True)[interface].bytes_recv
-            }
-    return network_info
+# Per-section sampling interval in seconds, and whether the section blocks
+# (subprocesses, full process-table walks) and must run off the main loop.
+COLLECTORS = {
+    "cpu": {"interval": 1},
+    "memory": {"interval": 5},
+    "network": {"interval": 5},
+    "disk": {"interval": 15, "blocking": True, "timeout": 10},
+    "usb_devices": {"interval": 5},
+    "processes": {"interval": 30, "blocking": True, "timeout": 20},
+    "gpu": {"interval": 60, "blocking": True, "timeout": 15},
+    "system_info": {"interval": 60},
+}
 
-def get_hardware_details():
-    boot_time = datetime.datetime.fromtimestamp(psutil.boot_time())
-    uptime = datetime.datetime.now() - boot_time
-    
-    # Get CPU temperature if available
-    cpu_temp = None
-    if hasattr(psutil, "sensors_temperatures"):
-        temps = psutil.sensors_temperatures()
-        if temps:
-            cpu_temp = next((temp.current for sensor in temps.values() 
-                           for temp in sensor if "cpu" in sensor.lower()), None)
+AGENT_PROCESS = psutil.Process()
 
-    # Get disk partitions with detailed information
-    disk_info = []
-    for partition in psutil.disk_partitions():
-        try:
-            usage = psutil.disk_usage(partition.mountpoint)
-            disk_info.append({
-                "device": partition.device,
-                "mountpoint": partition.mountpoint,
-                "fstype": partition.fstype,
-                "total": usage.total,
-                "used": usage.used,
-                "free": usage.free,
-                "percent": usage.percent
-            })
-        except:
-            continue
+def agent_stats(scheduler, transport):
+    """What the agent itself costs: per-collector timings, sends and process usage"""
+    with AGENT_PROCESS.oneshot():
+        process = {
+            # CPU used by the agent since the previous report
+            "cpu_percent": AGENT_PROCESS.cpu_percent(),
+            "rss_bytes": AGENT_PROCESS.memory_info().rss,
+            "threads": AGENT_PROCESS.num_threads(),
+        }
+    return {"collectors": scheduler.stats(), "transport": transport.stats(), "process": process}
 
-    # Get detailed memory information
-    memory = psutil.virtual_memory()
-    swap = psutil.swap_memory()
+def build_report(results, agent=None):
+    """Merge the latest result of every section into one report"""
+    if any(section not in results for section in SECTIONS):
+        return None
+    report = {section: results[section] for section in SECTIONS}
+    report["timestamp"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    if agent is not None:
+        report["agent"] = agent
+    return report
 
-    return {
-        "system_info": {
-            "computer_name": socket.gethostname(),
-            "os": f"{platform.system()} {platform.release()}",
-            "os_version": platform.version(),
-            "architecture": platform.machine(),
-            "processor": platform.processor(),
-            "machine_id": str(uuid.getnode()),
-            "boot_time": boot_time.isoformat(),
-            "uptime": str(uptime).split('.')[0]
-        },
-        "cpu": {
-            "physical_cores": psutil.cpu_count(logical=False),
-            "total_cores": psutil.cpu_count(logical=True),
-            "max_frequency": psutil.cpu_freq().max if psutil.cpu_freq() else None,
-            "current_frequency": psutil.cpu_freq().current if psutil.cpu_freq() else None,
-            "cpu_usage_per_core": psutil.cpu_percent(percpu=True),
-            "total_cpu_usage": psutil.cpu_percent(),
-            "temperature": cpu_temp
-        },
-        "memory": {
-            "total": memory.total,
-            "available": memory.available,
-            "used": memory.used,
-            "percentage": memory.percent,
-            "swap_total": swap.total,
-            "swap_used": swap.used,
-            "swap_free": swap.free,
-            "swap_percent": swap.percent
-        },
-        "disk": {
-            "partitions": disk_info,
-            "total_read": psutil.disk_io_counters().read_bytes,
-            "total_write": psutil.disk_io_counters().write_bytes
-        },
-        "network": get_network_info(),
-        "gpu": get_gpu_info(),
-        "processes": {
-            "total": len(psutil.pids()),
-            "running": len([p for p in psutil.process_iter(['status']) 
-                          if p.info['status'] == 'running']),
-            "top_cpu": [
-                {
-                    "pid": p.pid,
-                    "name": p.name(),
-                    "cpu_percent": p.cpu_percent(),
-                    "memory_percent": p.memory_percent(),
-                    "status": p.status()
-                }
-                for p in sorted(
-                    psutil.process_iter(['name', 'cpu_percent', 'memory_percent', 'status']),
-                    key=lambda p: p.cpu_percent(),
-                    reverse=True
-                )[:5]
-            ]
-        },
-        "usb_devices": [device.device for device in psutil.disk_partitions() 
-                       if "removable" in device.opts or "usb" in device.opts.lower()],
-        "timestamp": datetime.datetime.now().isoformat()
-    }
+def send_report(scheduler, transport):
+    data = build_report(scheduler.snapshot(), agent_stats(scheduler, transport))
+    if data is None:
+        print("Waiting for first collection of every section")
+        return
+    transport.add(data)
+    try:
+        response = transport.flush()
+    except Exception as e:
+        print(f"Error: {e}")
+        return
+    if response is not None:
+        print(f"Synced: {response.status_code} ({transport.sent} reports sent)")
+        print(f"System Info: {json.dumps(data['system_info'], indent=2)}")
 
 def sync_with_server():
-    while True:
-        try:
-            data = get_hardware_details()
-            response = requests.post(SERVER_URL, json=data)
-            print(f"Synced: {response.status_code}")
-            print(f"System Info: {json.dumps(data['system_info'], indent=2)}")
-        except Exception as e:
-            print(f"Error: {e}")
-        time.sleep(5)  # Sync every 5 seconds
+    collector = Collector(mounts=MountWatcher(MOUNT_PROBE_TIMEOUT, MOUNT_PROBE_TIMEOUTS))
+    scheduler = Scheduler()
+    spool = Spool(SPOOL_DIR, max_bytes=SPOOL_MAX_BYTES, max_age=SPOOL_MAX_AGE)
+    transport = Transport(SERVER_URL, batch_size=BATCH_SIZE, max_delay=BATCH_MAX_DELAY,
+                          spool=spool, replay_rate=REPLAY_RATE, serialization=SERIALIZATION,
+                          delta=DeltaEncoder(DELTA_DEADBAND, DELTA_FULL_EVERY) if DELTA_REPORTING else None)
+    for section, options in COLLECTORS.items():
+        scheduler.add(section, getattr(collector, section), **options)
+    # Start reporting at a random phase so agents started together (or
+    # reconnecting after a backend restart) do not all send at once.
+    scheduler.add("report", lambda: send_report(scheduler, transport), REPORT_INTERVAL,
+                  blocking=True, timeout=15, delay=1.0 + random.uniform(0, REPORT_INTERVAL))
+    scheduler.run_forever()
 
 if __name__ == "__main__":
     print(f"Starting monitoring for {socket.gethostname()}")
@@ -0,0 +1,227 @@
+import datetime
+import heapq
+import platform
+import socket
+import subprocess
+import time
+import uuid
+
+import psutil
+
+from mounts import MountWatcher
+
+TOP_PROCESSES = 5
+PROCESS_ATTRS = ["pid", "name", "status", "cpu_percent", "memory_percent"]
+TEMPERATURE_SENSORS = ("coretemp", "k10temp", "cpu_thermal", "cpu-thermal", "zenpower", "acpitz")
+
+
+def get_gpu_info(timeout=10):
+    try:
+        if platform.system() == "Windows":
+            import wmi
+            w = wmi.WMI()
+            gpu_info = w.Win32_VideoController()[0]
+            return {
+                "name": gpu_info.Name,
+                "memory": str(gpu_info.AdapterRAM) if hasattr(gpu_info, 'AdapterRAM') else "Unknown"
+            }
+        else:
+            # For Linux systems with nvidia-smi
+            try:
+                output = subprocess.check_output(["nvidia-smi", "--query-gpu=name,memory.total,memory.used", "--format=csv,noheader"], timeout=timeout).decode()
+                name, total, used = output.strip().split(",")
+                return {
+                    "name": name.strip(),
+                    "memory": f"{used.strip()}/{total.strip()}"
+                }
+            except:
+                return {"name": "Integrated Graphics", "memory": "Unknown"}
+    except:
+        return {"name": "Unknown", "memory": "Unknown"}
+
+
+# Report sections; each one is produced by the Collector method of the same name.
+SECTIONS = ("system_info", "cpu", "memory", "disk", "network", "gpu", "processes", "usb_devices")
+
+
+def _rate(current, previous, elapsed):
+    if previous is None or elapsed <= 0 or current < previous:
+        return 0.0
+    return round((current - previous) / elapsed, 1)
+
+
+class Collector:
+    """Stateful hardware collector.
+
+    Static facts (core counts, platform strings, machine id) are read once at
+    startup, and the partition table only when mounts change (see
+    MountWatcher). Each section method reads its psutil sources exactly once, and
+    counters are turned into per-second rates against that section's
+    previous reading, so sections can be sampled at different intervals.
+    """
+
+    def __init__(self, top_n=TOP_PROCESSES, mounts=None):
+        self.top_n = top_n
+        self.mounts = mounts if mounts is not None else MountWatcher()
+        self.mounts.start()
+        freq = psutil.cpu_freq()
+        boot_time = datetime.datetime.fromtimestamp(psutil.boot_time(), datetime.timezone.utc)
+        self.boot_time = boot_time
+        self.static = {
+            "computer_name": socket.gethostname(),
+            "os": f"{platform.system()} {platform.release()}",
+            "os_version": platform.version(),
+            "architecture": platform.machine(),
+            "processor": platform.processor(),
+            "machine_id": str(uuid.getnode()),
+            "boot_time": boot_time.isoformat(),
+        }
+        self.physical_cores = psutil.cpu_count(logical=False)
+        self.total_cores = psutil.cpu_count(logical=True)
+        self.max_frequency = freq.max if freq and freq.max else None
+        self._previous_disk = (None, None)
+        self._previous_net = (None, {})
+        # The first cpu_percent() calls only establish a baseline; prime them
+        # so the first real report carries meaningful numbers.
+        psutil.cpu_percent(percpu=True)
+        for _ in psutil.process_iter(["cpu_percent"]):
+            pass
+
+    def system_info(self):
+        uptime = datetime.datetime.now(datetime.timezone.utc) - self.boot_time
+        return dict(self.static, uptime=str(uptime).split('.')[0])
+
+    def cpu(self):
+        per_core = psutil.cpu_percent(percpu=True)
+        freq = psutil.cpu_freq()
+        return {
+            "physical_cores": self.physical_cores,
+            "total_cores": self.total_cores,
+            "max_frequency": self.max_frequency,
+            "current_frequency": freq.current if freq else None,
+            "cpu_usage_per_core": per_core,
+            "total_cpu_usage": round(sum(per_core) / len(per_core), 1) if per_core else 0.0,
+            "temperature": self.temperature(),
+        }
+
+    def temperature(self):
+        if not hasattr(psutil, "sensors_temperatures"):
+            return None
+        try:
+            temps = psutil.sensors_temperatures()
+        except Exception:
+            return None
+        for name, entries in temps.items():
+            if entries and (name in TEMPERATURE_SENSORS or "cpu" in name.lower()):
+                return entries[0].current
+        return None
+
+    def memory(self):
+        memory = psutil.virtual_memory()
+        swap = psutil.swap_memory()
+        return {
+            "total": memory.total,
+            "available": memory.available,
+            "used": memory.used,
+            "percentage": memory.percent,
+            "swap_total": swap.total,
+            "swap_used": swap.used,
+            "swap_free": swap.free,
+            "swap_percent": swap.percent
+        }
+
+    def _elapsed(self, previous_time, now):
+        return now - previous_time if previous_time else 0.0
+
+    def disk(self):
+        disk_info = []
+        for partition, usage in self.mounts.usage():
+            disk_info.append({
+                "device": partition.device,
+                "mountpoint": partition.mountpoint,
+                "fstype": partition.fstype,
+                "total": usage.total,
+                "used": usage.used,
+                "free": usage.free,
+                "percent": usage.percent
+            })
+        now = time.monotonic()
+        io = psutil.disk_io_counters()
+        previous_time, previous = self._previous_disk
+        elapsed = self._elapsed(previous_time, now)
+        self._previous_disk = (now, io)
+        return {
+            "partitions": disk_info,
+            "total_read": io.read_bytes if io else 0,
+            "total_write": io.write_bytes if io else 0,
+            "read_bytes_per_sec": _rate(io.read_bytes, previous and previous.read_bytes, elapsed) if io else 0.0,
+            "write_bytes_per_sec": _rate(io.write_bytes, previous and previous.write_bytes, elapsed) if io else 0.0,
+            "read_iops": _rate(io.read_count, previous and previous.read_count, elapsed) if io else 0.0,
+            "write_iops": _rate(io.write_count, previous and previous.write_count, elapsed) if io else 0.0,
+        }
+
+    def network(self):
+        stats = psutil.net_if_stats()
+        addrs = psutil.net_if_addrs()
+        now = time.monotonic()
+        counters = psutil.net_io_counters(pernic=True)
+        previous_time, previous_counters = self._previous_net
+        elapsed = self._elapsed(previous_time, now)
+        network_info = {}
+        for interface, stat in stats.items():
+            io = counters.get(interface)
+            if not stat.isup or io is None:
+                continue
+            nic_addrs = addrs.get(interface, [])
+            previous = previous_counters.get(interface)
+            network_info[interface] = {
+                "speed": stat.speed,
+                "ipv4": next((a.address for a in nic_addrs if a.family == socket.AF_INET), None),
+                "ipv6": next((a.address for a in nic_addrs if a.family == socket.AF_INET6), None),
+                "bytes_sent": io.bytes_sent,
+                "bytes_recv": io.bytes_recv,
+                "send_bytes_per_sec": _rate(io.bytes_sent, previous and previous.bytes_sent, elapsed),
+                "recv_bytes_per_sec": _rate(io.bytes_recv, previous and previous.bytes_recv, elapsed),
+            }
+        self._previous_net = (now, counters)
+        return network_info
+
+    def gpu(self):
+        return get_gpu_info()
+
+    def usb_devices(self):
+        return self.mounts.usb_devices()
+
+    def processes(self):
+        # One pass over the process table: process_iter() reuses cached
+        # Process objects (so cpu_percent is a delta since the last tick) and
+        # reads the requested attributes inside oneshot().
+        total = running = 0
+        candidates = []
+        for p in psutil.process_iter(PROCESS_ATTRS):
+            info = p.info
+            total += 1
+            if info["status"] == psutil.STATUS_RUNNING:
+                running += 1
+            candidates.append(info)
+        top = heapq.nlargest(self.top_n, candidates, key=lambda info: info["cpu_percent"] or 0.0)
+        return {
+            "total": total,
+            "running": running,
+            "top_cpu": [
+                {
+                    "pid": info["pid"],
+                    "name": info["name"] or "",
+                    "cpu_percent": info["cpu_percent"] or 0.0,
+                    "memory_percent": round(info["memory_percent"] or 0.0, 2),
+                    "status": info["status"] or "",
+                }
+                for info in top
+            ]
+        }
+
+    def collect(self):
+        """Read every section at once into a full report"""
+        report = {section: getattr(self, section)() for section in SECTIONS}
+        report["timestamp"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        return report
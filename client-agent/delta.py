@@ -0,0 +1,198 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+def _same(a, b, deadband):
+    if type(a) is float and type(b) is float:
+        return abs(a - b) < deadband
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_same(x, y, deadband) for x, y in zip(a, b))
+    return a == b
+
+
+def diff(old, new, deadband=0.0):
+    """Return (set, unset) that turn old into new.
+
+    set is a nested dict of changed values (dicts are diffed recursively,
+    lists and scalars are replaced whole); unset lists the key paths that
+    disappeared. Floats that moved less than deadband count as unchanged.
+    """
+    changes, removed = {}, []
+    for key, value in new.items():
+        if key not in old:
+            changes[key] = value
+            continue
+        before = old[key]
+        if isinstance(value, dict) and isinstance(before, dict):
+            sub_changes, sub_removed = diff(before, value, deadband)
+            if sub_changes:
+                changes[key] = sub_changes
+            removed.extend([key, *path] for path in sub_removed)
+        elif not _same(before, value, deadband):
+            changes[key] = value
+    removed.extend([key] for key in old if key not in new)
+    return changes, removed
+
+
+class DeltaGap(Exception):
+    """A change-only message did not follow the last one applied for its session"""
+
+
+# patch(), DeltaGap and DeltaDecoder mirror backend/deltas.py line for line so
+# the relay reconstructs reports exactly as the server would;
+# backend/tests/test_deltas.py runs the same tests against both copies.
+def patch(base, changes, removed=()):
+    """Apply an agent diff without mutating base; untouched sub-dicts are shared"""
+    result = dict(base)
+    for key, value in changes.items():
+        current = result.get(key)
+        if isinstance(value, dict) and isinstance(current, dict):
+            result[key] = patch(current, value)
+        else:
+            result[key] = value
+    for path in removed:
+        node = result
+        for key in path[:-1]:
+            child = node.get(key)
+            if not isinstance(child, dict):
+                node = None
+                break
+            child = dict(child)
+            node[key] = child
+            node = child
+        if node is not None and path:
+            node.pop(path[-1], None)
+    return result
+
+
+class DeltaEncoder:
+    """Turns successive reports into change-only messages for /update-hardware/delta.
+
+    The first message of a session (and every full_every-th after it, or the
+    next one after reset()) carries the whole report; the rest carry only
+    what changed since the state the server last reconstructed, with a
+    sequence number the server uses to detect gaps. Float fields that moved
+    less than deadband are not resent, and because diffs are taken against
+    what was sent rather than what was observed, small moves cannot drift.
+    """
+
+    def __init__(self, deadband=0.5, full_every=720):
+        self.deadband = deadband
+        self.full_every = full_every
+        self.session = uuid.uuid4().hex
+        self.seq = 0
+        self._sent = None
+        self._since_full = 0
+        self.full_messages = 0
+        self.delta_messages = 0
+
+    def reset(self):
+        """Start over with a full snapshot, e.g. after a failed send or a resync request"""
+        self._sent = None
+
+    def encode(self, report):
+        self.seq += 1
+        if self._sent is None or self._since_full >= self.full_every:
+            self._sent = report
+            self._since_full = 0
+            self.full_messages += 1
+            return {"session": self.session, "seq": self.seq, "full": report}
+        changes, removed = diff(self._sent, report, self.deadband)
+        self._sent = patch(self._sent, changes, removed)
+        self._since_full += 1
+        self.delta_messages += 1
+        message = {"session": self.session, "seq": self.seq, "set": changes}
+        if removed:
+            message["unset"] = removed
+        return message
+
+    def encode_batch(self, reports):
+        return [self.encode(report) for report in reports]
+
+
+class DeltaDecoder:
+    """The receiving side of DeltaEncoder, for a relay standing in for the server.
+
+    Each agent session starts with a full report and then sends diffs
+    numbered seq + 1, seq + 2, ... A diff for an unknown session or with a
+    skipped number cannot be applied; apply_many() stops there and the
+    caller tells the agent to resync. Sessions idle for longer than ttl
+    seconds, or beyond max_sessions, are forgotten (oldest first) and simply
+    resync on their next message.
+    """
+
+    def __init__(self, max_sessions=10000, ttl=3600.0):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.full = 0
+        self.deltas = 0
+        self.resyncs = 0
+
+    def _expire(self, now):
+        while self._sessions:
+            session, (_, _, seen) = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - seen <= self.ttl:
+                break
+            del self._sessions[session]
+
+    def _apply(self, message, staged):
+        session, seq = message.get("session"), message.get("seq")
+        if not isinstance(session, str) or not isinstance(seq, int):
+            raise ValueError("Delta messages need a session string and an integer seq")
+        if "full" in message:
+            return session, seq, message["full"]
+        current = staged.get(session) or self._sessions.get(session)
+        if current is None or seq != current[0] + 1:
+            raise DeltaGap(session)
+        return session, seq, patch(current[1], message.get("set") or {}, message.get("unset") or ())
+
+    def apply_many(self, messages, validate, accept=None):
+        """Apply messages in order; returns (validated reports, resync needed).
+
+        validate(report dict) checks a reconstructed report, returns what to
+        keep, and may raise. Session updates are staged and only kept once
+        the batch is accepted: up to a gap (the reports before it are
+        returned with resync set), or to the end, and once accept(reports)
+        has returned. If anything raises, no session moves, so the agent's
+        resend of the batch still applies.
+        """
+        reports = []
+        staged = {}
+        counts = {"full": 0, "deltas": 0}
+        resync = False
+        now = time.monotonic()
+        with self._lock:
+            for message in messages:
+                if not isinstance(message, dict):
+                    raise ValueError("Expected an array of delta messages")
+                try:
+                    session, seq, report = self._apply(message, staged)
+                except DeltaGap:
+                    self.resyncs += 1
+                    resync = True
+                    break
+                reports.append(validate(report))
+                staged[session] = (seq, report, now)
+                counts["full" if "full" in message else "deltas"] += 1
+            if accept is not None:
+                accept(reports)
+            for session, state in staged.items():
+                self._sessions[session] = state
+                self._sessions.move_to_end(session)
+            self.full += counts["full"]
+            self.deltas += counts["deltas"]
+            self._expire(now)
+        return reports, resync
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "full": self.full,
+                "deltas": self.deltas,
+                "resyncs": self.resyncs,
+            }
@@ -0,0 +1,192 @@
+import os
+import select
+import threading
+import time
+
+import psutil
+
+MOUNTINFO = "/proc/self/mountinfo"
+# Mounts often change in bursts (a container starting, a disk with several
+# partitions); wait this long after a notification before re-reading.
+SETTLE_SECONDS = 0.2
+
+
+def _is_usb(partition):
+    """Removable or USB-attached device, from sysfs where available, else from the mount options"""
+    opts = partition.opts.lower()
+    if "removable" in opts or "usb" in opts:
+        return True
+    name = os.path.basename(partition.device)
+    path = os.path.join("/sys/class/block", name)
+    if not name or not os.path.exists(path):
+        return False
+    try:
+        device = os.path.realpath(path)
+        if "/usb" in device:
+            return True
+        # A partition's removable flag lives on its parent disk.
+        for candidate in (device, os.path.dirname(device)):
+            flag = os.path.join(candidate, "removable")
+            if os.path.exists(flag):
+                with open(flag) as f:
+                    return f.read().strip() == "1"
+    except OSError:
+        pass
+    return False
+
+
+class _Probe:
+    __slots__ = ("thread", "started", "usage", "timed_out")
+
+    def __init__(self):
+        self.thread = None
+        self.started = 0.0
+        self.usage = None
+        self.timed_out = False
+
+
+class MountWatcher:
+    """Partition and USB device table, re-read only when the mount table changes.
+
+    On Linux the kernel flags /proc/self/mountinfo (POLLPRI) whenever a
+    filesystem is mounted or unmounted, so a thread sleeps in poll() and
+    enumerates partitions only then; elsewhere the table is re-read every
+    fallback_interval seconds. Disk usage is probed per mount, each on its
+    own thread with its own timeout (timeouts maps mountpoint -> seconds,
+    default probe_timeout). A mount whose probe does not answer in time,
+    such as a hung network share, is reported with its last known usage and
+    is not probed again until that probe returns, even if it is unmounted
+    and mounted again meanwhile, so it ties up one thread and never stalls
+    the disk collector. At most max_probes probes run at once; mounts over
+    that limit keep their last known usage until a probe thread is free.
+    """
+
+    def __init__(self, probe_timeout=2.0, timeouts=None, fallback_interval=30.0, max_probes=16):
+        self.probe_timeout = probe_timeout
+        self.timeouts = dict(timeouts or {})
+        self.fallback_interval = fallback_interval
+        self.max_probes = max_probes
+        self.changes = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._partitions = []
+        self._usb = []
+        self._probes = {}
+        self._running = 0
+        self.refresh()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="mount-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def refresh(self):
+        """Re-enumerate partitions; returns True if the table changed"""
+        partitions = psutil.disk_partitions()
+        usb = [p.device for p in partitions if _is_usb(p)]
+        with self._lock:
+            if partitions == self._partitions:
+                return False
+            self._partitions, self._usb = partitions, usb
+            mounted = {p.mountpoint for p in partitions}
+            # A probe still stuck on an unmounted path stays, so the path is
+            # not probed again (by a second thread) until it returns.
+            for mountpoint in [m for m, probe in self._probes.items() if m not in mounted and probe.thread is None]:
+                del self._probes[mountpoint]
+            self.changes += 1
+        return True
+
+    def _safe_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Reading the mount table failed: {e}")
+
+    def _watch(self):
+        try:
+            mountinfo = open(MOUNTINFO, "rb")
+        except OSError:
+            mountinfo = None
+        if mountinfo is None or not hasattr(select, "poll"):
+            while not self._stop.wait(self.fallback_interval):
+                self._safe_refresh()
+            return
+        with mountinfo:
+            poller = select.poll()
+            poller.register(mountinfo, select.POLLPRI | select.POLLERR)
+            mountinfo.read()
+            while not self._stop.is_set():
+                if not poller.poll(1000):
+                    continue
+                self._stop.wait(SETTLE_SECONDS)
+                # Reading the file to the end re-arms the notification.
+                mountinfo.seek(0)
+                mountinfo.read()
+                self._safe_refresh()
+
+    def usb_devices(self):
+        with self._lock:
+            return list(self._usb)
+
+    def _run_probe(self, probe, mountpoint):
+        try:
+            usage = psutil.disk_usage(mountpoint)
+        except OSError:
+            usage = None
+        with self._lock:
+            probe.usage = usage
+            probe.thread = None
+            probe.timed_out = False
+            self._running -= 1
+            if all(p.mountpoint != mountpoint for p in self._partitions):
+                self._probes.pop(mountpoint, None)
+
+    def usage(self):
+        """(partition, usage) for every mount that has answered a probe, fresh where possible"""
+        with self._lock:
+            partitions = list(self._partitions)
+            started = []
+            now = time.monotonic()
+            for p in partitions:
+                probe = self._probes.get(p.mountpoint)
+                if probe is None:
+                    probe = self._probes[p.mountpoint] = _Probe()
+                if probe.thread is None:
+                    if self._running >= self.max_probes:
+                        self.skipped += 1
+                        continue
+                    self._running += 1
+                    probe.started = now
+                    probe.thread = threading.Thread(
+                        target=self._run_probe, args=(probe, p.mountpoint), name="disk-usage", daemon=True
+                    )
+                    probe.thread.start()
+                    started.append((p.mountpoint, probe))
+        for mountpoint, probe in started:
+            thread = probe.thread
+            if thread is not None:
+                deadline = probe.started + self.timeouts.get(mountpoint, self.probe_timeout)
+                thread.join(max(0.0, deadline - time.monotonic()))
+        result = []
+        with self._lock:
+            for p in partitions:
+                probe = self._probes.get(p.mountpoint)
+                if probe is None:
+                    continue
+                if probe.thread is not None and not probe.timed_out:
+                    probe.timed_out = True
+                    print(f"Disk usage of {p.mountpoint} did not answer within "
+                          f"{self.timeouts.get(p.mountpoint, self.probe_timeout)}s, reporting its last known usage")
+                if probe.usage is not None:
+                    result.append((p, probe.usage))
+        return result
@@ -0,0 +1,329 @@
+import json
+import os
+import threading
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from delta import DeltaDecoder
+from spool import Spool
+from transport import BodyError, Transport, decode
+
+# Where the relay forwards to (the backend, or another relay), in the same
+# form as the agent's SERVER_URL; agents point their SERVER_URL at the relay.
+UPSTREAM_URL = os.environ.get("RELAY_UPSTREAM", "http://localhost:5001/update-hardware")
+LISTEN_HOST = os.environ.get("RELAY_HOST", "0.0.0.0")
+LISTEN_PORT = int(os.environ.get("RELAY_PORT", 5080))
+FORWARD_INTERVAL = 2  # seconds a report may wait before its batch goes upstream
+MAX_BATCH = 500  # reports per upstream request
+MAX_PENDING = 50000  # reports held in memory before agents are told to back off (503)
+MAX_PER_HOST = 720  # pending reports kept per host; older ones are dropped first
+LATEST_ONLY = False  # forward only each host's newest report per batch (thin WAN links)
+SPOOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "relay-spool")
+SPOOL_MAX_BYTES = 512 * 1024 * 1024
+SPOOL_MAX_AGE = 7 * 86400
+# Once the spool is this full, stop draining the queue until replay catches up,
+# so backpressure reaches the agents before the spool has to drop anything.
+SPOOL_HIGH_WATER = 0.8
+REPLAY_RATE = 200  # spooled reports per second resent once upstream is back
+SERIALIZATION = "json"  # or "msgpack" upstream
+COMPRESSION = "gzip"  # or "zstd" when the backend has the zstandard package too
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+def check_report(report):
+    """Enough of a report for the relay to route it; the backend validates the rest"""
+    if not isinstance(report, dict):
+        raise BodyError("Reports must be objects")
+    system_info = report.get("system_info")
+    if not isinstance(system_info, dict) or not isinstance(system_info.get("computer_name"), str):
+        raise BodyError("Report without system_info.computer_name")
+    if not isinstance(report.get("timestamp"), str):
+        raise BodyError("Report without a timestamp")
+    return report
+
+
+class RelayFull(Exception):
+    """The relay's queue cannot take a request's reports"""
+
+
+class Coalescer:
+    """Per-host queues of reports waiting to go upstream.
+
+    Reports are deduplicated on (host, timestamp), so an agent resending a
+    batch whose reply it never got is forwarded once. Each host keeps at
+    most max_per_host pending reports, dropping its oldest, or only its
+    newest with latest_only. take() draws round-robin across hosts, so one
+    agent replaying a long outage cannot crowd the others out of a batch.
+    add() refuses a whole request once max_pending reports are waiting;
+    the relay answers 503 and the agents keep the reports in their own
+    spools until it has room again.
+    """
+
+    def __init__(self, max_pending=MAX_PENDING, max_per_host=MAX_PER_HOST, latest_only=False, remember=256):
+        self.max_pending = max_pending
+        self.max_per_host = max_per_host
+        self.latest_only = latest_only
+        self.remember = remember
+        self._lock = threading.Lock()
+        self._queues = OrderedDict()
+        self._seen = {}
+        self._pending = 0
+        self._counters = {"received": 0, "duplicates": 0, "coalesced": 0, "refused": 0, "taken": 0}
+
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def full(self):
+        with self._lock:
+            return self._pending >= self.max_pending
+
+    def add(self, reports):
+        """Queue reports; returns how many were new, or None when the relay is full"""
+        with self._lock:
+            if self._pending + len(reports) > self.max_pending:
+                self._counters["refused"] += len(reports)
+                return None
+            self._counters["received"] += len(reports)
+            added = 0
+            for report in reports:
+                host, ts = report["system_info"]["computer_name"], report["timestamp"]
+                seen = self._seen.get(host)
+                if seen is None:
+                    seen = self._seen[host] = (deque(), set())
+                order, stamps = seen
+                if ts in stamps:
+                    self._counters["duplicates"] += 1
+                    continue
+                order.append(ts)
+                stamps.add(ts)
+                if len(order) > self.remember:
+                    stamps.discard(order.popleft())
+                queue = self._queues.get(host)
+                if queue is None:
+                    queue = self._queues[host] = deque()
+                if self.latest_only and queue:
+                    if queue[-1]["timestamp"] > ts:
+                        self._counters["coalesced"] += 1
+                        continue
+                    self._counters["coalesced"] += len(queue)
+                    self._pending -= len(queue)
+                    queue.clear()
+                elif len(queue) >= self.max_per_host:
+                    queue.popleft()
+                    self._counters["coalesced"] += 1
+                    self._pending -= 1
+                queue.append(report)
+                self._pending += 1
+                added += 1
+            return added
+
+    def take(self, limit):
+        """Up to limit reports, one per host in turn"""
+        batch = []
+        with self._lock:
+            while self._queues and len(batch) < limit:
+                host, queue = next(iter(self._queues.items()))
+                batch.append(queue.popleft())
+                if queue:
+                    self._queues.move_to_end(host)
+                else:
+                    del self._queues[host]
+            self._pending -= len(batch)
+            self._counters["taken"] += len(batch)
+        return batch
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, pending=self._pending, hosts=len(self._seen), queued_hosts=len(self._queues))
+
+
+class Relay:
+    """Fan-in between a site's agents and the backend.
+
+    Agents post to the relay exactly as they would to the backend (single,
+    bulk or change-only reports). The relay queues them per host and a
+    forwarding thread ships them upstream as compressed bulk batches over
+    one keep-alive connection: at most one request per FORWARD_INTERVAL
+    unless more than MAX_BATCH reports are waiting. When upstream is down
+    the Transport spools to disk and replays later; once the spool passes
+    its high-water mark the queue stops draining until replay has caught
+    up, and agents get 503s once the queue is full.
+    """
+
+    def __init__(self, transport, coalescer=None, deltas=None, tick=0.25, spool_high_water=SPOOL_HIGH_WATER):
+        self.transport = transport
+        self.coalescer = coalescer or Coalescer()
+        self.deltas = deltas or DeltaDecoder()
+        self.tick = tick
+        self.spool_high_water = spool_high_water
+        self.held = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="relay-forward", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Stop forwarding and keep everything not yet sent in the spool"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        spool = self.transport.spool
+        if spool is not None:
+            spool.append(self.coalescer.take(self.coalescer.pending()))
+            self.transport.spool_buffered()
+
+    def _spool_full(self):
+        spool = self.transport.spool
+        return spool is not None and spool.stats()["bytes"] >= spool.max_bytes * self.spool_high_water
+
+    def pump(self):
+        """Move queued reports into the upstream transport and send whatever batch is due"""
+        while True:
+            if self._spool_full():
+                # Leave new reports queued (and agents refused once the queue
+                # fills) until replay has drained the spool below high water.
+                self.held += 1
+            else:
+                room = self.transport.max_batch - self.transport.stats()["buffered"]
+                for report in self.coalescer.take(max(0, room)):
+                    self.transport.add(report)
+            try:
+                response = self.transport.flush()
+            except requests.RequestException as e:
+                print(f"Upstream send failed: {e}")
+                return
+            # Keep sending while full batches are waiting rather than one per tick.
+            if response is None or self._spool_full() or self.coalescer.pending() < self.transport.max_batch:
+                return
+
+    def _run(self):
+        while not self._stop.wait(self.tick):
+            try:
+                self.pump()
+            except Exception as e:
+                print(f"Relay forwarding failed: {e}")
+
+    def _queue(self, reports):
+        if self.coalescer.add(reports) is None:
+            raise RelayFull()
+
+    def accept(self, path, body, content_type, content_encoding):
+        """Handle one agent POST; returns (status, response body)"""
+        records = decode(body, content_type, content_encoding, MAX_BODY_BYTES)
+        resync = None
+        try:
+            if path.endswith("/delta"):
+                # Queued before the sessions advance, so a refused batch can be resent as is.
+                reports, resync = self.deltas.apply_many(records, check_report, self._queue)
+            else:
+                for report in records:
+                    check_report(report)
+                reports = records
+                self._queue(reports)
+        except RelayFull:
+            return 503, {"detail": "Relay queue full, retry later"}
+        result = {"message": "Hardware data queued", "accepted": len(reports)}
+        if resync is not None:
+            result["resync"] = resync
+        return 202, result
+
+    def stats(self):
+        spool = self.transport.spool
+        return {
+            "queue": self.coalescer.stats(),
+            "upstream": self.transport.stats(),
+            "spool": spool.stats() if spool is not None else None,
+            "deltas": self.deltas.stats(),
+            "held": self.held,
+            "backing_off": self.transport.backing_off(),
+        }
+
+
+def make_handler(relay):
+    class RelayHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Idle agent connections are closed after this many seconds.
+        timeout = 60
+
+        def _reply(self, status, payload, headers=()):
+            body = json.dumps(payload, separators=(",", ":")).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if self.path.split("?")[0] not in ("/update-hardware", "/update-hardware/bulk", "/update-hardware/delta"):
+                return self._reply(404, {"detail": "Not Found"})
+            length = self.headers.get("Content-Length")
+            if length is None:
+                return self._reply(411, {"detail": "Content-Length required"})
+            try:
+                length = int(length)
+                if length < 0:
+                    raise ValueError(length)
+            except ValueError:
+                # The body cannot be framed, so the connection cannot be reused either.
+                self.close_connection = True
+                return self._reply(400, {"detail": "Invalid Content-Length"})
+            if length > MAX_BODY_BYTES:
+                self.close_connection = True
+                return self._reply(413, {"detail": "Body too large"})
+            body = self.rfile.read(length)
+            try:
+                status, result = relay.accept(
+                    self.path.split("?")[0], body, self.headers.get("Content-Type"), self.headers.get("Content-Encoding")
+                )
+            except ValueError as e:
+                return self._reply(400, {"detail": str(e)})
+            self._reply(status, result, [("Retry-After", str(FORWARD_INTERVAL))] if status == 503 else ())
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/health":
+                full = relay.coalescer.full()
+                return self._reply(503 if full else 200, {"status": "full" if full else "ok"})
+            if path == "/relay/stats":
+                return self._reply(200, relay.stats())
+            self._reply(404, {"detail": "Not Found"})
+
+        def log_message(self, format, *args):
+            # Agents post every few seconds; only errors are worth a line.
+            pass
+
+    return RelayHandler
+
+
+def run_relay():
+    spool = Spool(SPOOL_DIR, max_bytes=SPOOL_MAX_BYTES, max_age=SPOOL_MAX_AGE)
+    transport = Transport(UPSTREAM_URL, batch_size=MAX_BATCH, max_delay=FORWARD_INTERVAL, max_batch=MAX_BATCH,
+                          max_buffer=2 * MAX_BATCH, compression=COMPRESSION, spool=spool, replay_rate=REPLAY_RATE,
+                          serialization=SERIALIZATION)
+    relay = Relay(transport, Coalescer(MAX_PENDING, MAX_PER_HOST, LATEST_ONLY))
+    server = ThreadingHTTPServer((LISTEN_HOST, LISTEN_PORT), make_handler(relay))
+    server.daemon_threads = True
+    relay.start()
+    print(f"Relaying http://{LISTEN_HOST}:{LISTEN_PORT}/update-hardware to {UPSTREAM_URL}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        relay.stop()
+        transport.close()
+
+
+if __name__ == "__main__":
+    run_relay()
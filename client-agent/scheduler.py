@@ -0,0 +1,158 @@
+import heapq
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    def __init__(self, name, func, interval, blocking=False, timeout=None, window=60):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.blocking = blocking
+        self.timeout = timeout
+        self.future = None
+        self.started = None
+        self.overrun = False
+        self.runs = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.last_duration = 0.0
+        # (wall, cpu) seconds of the most recent runs
+        self.timings = deque(maxlen=window)
+
+
+class Scheduler:
+    """Runs jobs at their own intervals on a monotonic-clock timer heap.
+
+    Jobs are scheduled at fixed rate (next run = previous due time +
+    interval), so the time a job takes never shifts later runs. Blocking
+    jobs (subprocesses, process-table walks, network I/O) run on a worker
+    pool with one thread per blocking job, so none waits behind another;
+    a blocking job that is still running when it is due again is skipped
+    rather than queued. Once a run passes its timeout it is counted as a
+    timeout and whatever it returns later is discarded (Python cannot stop
+    the thread itself), so a stale value never replaces a fresh one.
+    """
+
+    def __init__(self, max_workers=None):
+        self.results = {}
+        self.jobs = {}
+        self.max_workers = max_workers
+        self._heap = []
+        self._pool = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def add(self, name, func, interval, blocking=False, timeout=None, delay=0.0):
+        job = Job(name, func, interval, blocking, timeout)
+        self.jobs[name] = job
+        heapq.heappush(self._heap, (time.monotonic() + delay, name))
+        return job
+
+    def stop(self):
+        self._stop.set()
+
+    def _finish(self, job, duration, cpu, value=None, error=None):
+        job.last_duration = duration
+        job.timings.append((duration, cpu))
+        job.runs += 1
+        if error is not None:
+            job.errors += 1
+            print(f"Collector {job.name} failed: {error}")
+            return
+        with self._lock:
+            self.results[job.name] = value
+
+    @staticmethod
+    def _timed(func):
+        """Run func, returning (value, error, wall seconds, CPU seconds of this thread)"""
+        started, cpu_started = time.monotonic(), time.thread_time()
+        try:
+            value, error = func(), None
+        except Exception as e:
+            value, error = None, e
+        return value, error, time.monotonic() - started, time.thread_time() - cpu_started
+
+    def _harvest(self, job, now):
+        if job.future is None:
+            return True
+        if job.future.done():
+            value, error, duration, cpu = job.future.result()
+            if job.overrun:
+                job.last_duration = duration
+                job.timings.append((duration, cpu))
+                job.runs += 1
+            else:
+                self._finish(job, duration, cpu, value, error)
+            job.future = None
+            job.overrun = False
+            return True
+        if job.timeout and not job.overrun and now - job.started > job.timeout:
+            job.overrun = True
+            job.timeouts += 1
+            print(f"Collector {job.name} overran its {job.timeout}s timeout, discarding this run")
+        return False
+
+    def _deadline(self, due):
+        """When the main loop next has to wake: the next due job or the next running job's timeout"""
+        for job in self.jobs.values():
+            if job.future is not None and job.timeout and not job.overrun:
+                due = min(due, job.started + job.timeout)
+        return due
+
+    def _run(self, job, now):
+        if job.blocking:
+            if self._harvest(job, now):
+                job.started = now
+                job.future = self._pool.submit(self._timed, job.func)
+            return
+        value, error, duration, cpu = self._timed(job.func)
+        self._finish(job, duration, cpu, value, error)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.results)
+
+    def stats(self):
+        """Per-job counters plus wall and CPU cost averaged over the recent runs"""
+        result = {}
+        for name, job in self.jobs.items():
+            timings = list(job.timings)
+            result[name] = {
+                "interval": job.interval,
+                "runs": job.runs,
+                "errors": job.errors,
+                "timeouts": job.timeouts,
+                "last_duration_ms": round(job.last_duration * 1000, 2),
+                "avg_ms": round(sum(w for w, _ in timings) / len(timings) * 1000, 2) if timings else 0.0,
+                "max_ms": round(max(w for w, _ in timings) * 1000, 2) if timings else 0.0,
+                "cpu_ms": round(sum(c for _, c in timings) / len(timings) * 1000, 2) if timings else 0.0,
+            }
+        return result
+
+    def run_forever(self):
+        workers = self.max_workers or max(1, sum(job.blocking for job in self.jobs.values()))
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="collector")
+        try:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                for job in self.jobs.values():
+                    if job.future is not None:
+                        self._harvest(job, now)
+                due, name = self._heap[0]
+                if due > now:
+                    self._stop.wait(max(0.0, self._deadline(due) - now))
+                    continue
+                heapq.heappop(self._heap)
+                job = self.jobs[name]
+                self._run(job, now)
+                # Fixed-rate: skip whole intervals we have fallen behind on
+                # instead of firing a burst of catch-up runs.
+                next_due = due + job.interval
+                if next_due <= now:
+                    next_due += ((now - next_due) // job.interval + 1) * job.interval
+                heapq.heappush(self._heap, (next_due, name))
+        finally:
+            self._pool.shutdown(wait=False)
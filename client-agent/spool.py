@@ -0,0 +1,157 @@
+import json
+import os
+import threading
+import time
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".ndjson"
+CURSOR_FILE = "cursor.json"
+
+
+class Spool:
+    """Append-only on-disk buffer for reports that could not be sent.
+
+    Reports are written as NDJSON into numbered segment files. The writer
+    always appends to the newest segment and starts a new one once it
+    reaches segment_bytes; replay reads the oldest segment from a saved
+    cursor and deletes it once fully sent. Whole segments are discarded,
+    oldest first, when the spool grows past max_bytes or a segment is older
+    than max_age seconds.
+    """
+
+    def __init__(self, directory, segment_bytes=1024 * 1024, max_bytes=64 * 1024 * 1024, max_age=7 * 86400):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.dropped_segments = 0
+        self.spooled = 0
+        self.replayed = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        segments = self._segments()
+        self._next_seq = self._seq(segments[-1]) + 1 if segments else 0
+        self._active = None
+
+    @staticmethod
+    def _seq(name):
+        return int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _segments(self):
+        names = [n for n in os.listdir(self.directory) if n.startswith(SEGMENT_PREFIX) and n.endswith(SEGMENT_SUFFIX)]
+        return sorted(names, key=self._seq)
+
+    def _new_segment(self):
+        self._active = f"{SEGMENT_PREFIX}{self._next_seq:012d}{SEGMENT_SUFFIX}"
+        self._next_seq += 1
+        return self._active
+
+    def _read_cursor(self):
+        try:
+            with open(self._path(CURSOR_FILE)) as f:
+                cursor = json.load(f)
+            return cursor["segment"], cursor["offset"]
+        except (OSError, ValueError, KeyError):
+            return None, 0
+
+    def _write_cursor(self, segment, offset):
+        tmp = self._path(CURSOR_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"segment": segment, "offset": offset}, f)
+        os.replace(tmp, self._path(CURSOR_FILE))
+
+    def _enforce_limits(self):
+        segments = self._segments()
+        sizes = {name: os.path.getsize(self._path(name)) for name in segments}
+        total = sum(sizes.values())
+        now = time.time()
+        for name in segments:
+            if name == self._active:
+                break
+            too_old = now - os.path.getmtime(self._path(name)) > self.max_age
+            if total <= self.max_bytes and not too_old:
+                break
+            os.remove(self._path(name))
+            total -= sizes[name]
+            self.dropped_segments += 1
+
+    def append(self, records):
+        if not records:
+            return
+        lines = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records)
+        with self._lock:
+            name = self._active or self._new_segment()
+            path = self._path(name)
+            if os.path.exists(path) and os.path.getsize(path) >= self.segment_bytes:
+                path = self._path(self._new_segment())
+            with open(path, "a") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            self.spooled += len(records)
+            self._enforce_limits()
+
+    def pending(self):
+        with self._lock:
+            return bool(self._segments())
+
+    def read_batch(self, max_records):
+        """Return (records, token) from the oldest segment; pass token to commit()"""
+        with self._lock:
+            segments = self._segments()
+            if not segments:
+                return [], None
+            name = segments[0]
+            if name == self._active:
+                # Never read the segment that is still being appended to.
+                self._active = None
+            cursor_segment, offset = self._read_cursor()
+            if cursor_segment != name:
+                offset = 0
+            records = []
+            with open(self._path(name), "rb") as f:
+                f.seek(offset)
+                while len(records) < max_records:
+                    line = f.readline()
+                    if not line:
+                        break
+                    if not line.endswith(b"\n"):
+                        # A torn write from a crash; skip the partial record.
+                        offset = f.tell()
+                        continue
+                    offset = f.tell()
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+                finished = not f.readline()
+            return records, (name, offset, finished, len(records))
+
+    def commit(self, token):
+        if token is None:
+            return
+        name, offset, finished, count = token
+        with self._lock:
+            self.replayed += count
+            if finished:
+                try:
+                    os.remove(self._path(name))
+                except FileNotFoundError:
+                    pass
+                self._write_cursor(None, 0)
+            else:
+                self._write_cursor(name, offset)
+
+    def stats(self):
+        with self._lock:
+            segments = self._segments()
+            return {
+                "segments": len(segments),
+                "bytes": sum(os.path.getsize(self._path(n)) for n in segments),
+                "spooled": self.spooled,
+                "replayed": self.replayed,
+                "dropped_segments": self.dropped_segments,
+            }
@@ -0,0 +1,171 @@
+import os
+import time
+
+import pytest
+import requests
+
+from spool import CURSOR_FILE, Spool
+from transport import Transport, decode
+
+
+def report(i, host="pc-1"):
+    return {"system_info": {"computer_name": host}, "timestamp": f"2024-01-01T00:00:{i:02d}", "n": i}
+
+
+def segment_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.startswith("segment-"))
+
+
+def drain(spool, batch=4):
+    records = []
+    while spool.pending():
+        batch_records, token = spool.read_batch(batch)
+        records.extend(batch_records)
+        spool.commit(token)
+    return records
+
+
+def test_records_come_back_in_order_across_segments(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=200)
+    for i in range(10):
+        spool.append([report(i)])
+    assert len(segment_files(tmp_path)) > 1
+    assert [r["n"] for r in drain(spool)] == list(range(10))
+    assert segment_files(tmp_path) == []
+    assert spool.stats()["replayed"] == 10
+
+
+def test_cursor_survives_a_restart(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append([report(i) for i in range(6)])
+    records, token = spool.read_batch(2)
+    spool.commit(token)
+    assert [r["n"] for r in records] == [0, 1]
+    assert os.path.exists(tmp_path / CURSOR_FILE)
+
+    # A new process picks up after the committed records, not from the start.
+    reopened = Spool(str(tmp_path))
+    assert [r["n"] for r in drain(reopened)] == [2, 3, 4, 5]
+
+
+def test_uncommitted_reads_are_read_again(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append([report(i) for i in range(3)])
+    spool.read_batch(2)  # sent but never acknowledged
+    assert [r["n"] for r in drain(Spool(str(tmp_path)))] == [0, 1, 2]
+
+
+def test_torn_write_is_skipped(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append([report(0)])
+    with open(tmp_path / segment_files(tmp_path)[0], "a") as f:
+        f.write('{"system_info": {"computer_na')
+    spool = Spool(str(tmp_path))
+    spool.append([report(1)])
+    assert [r["n"] for r in drain(spool)] == [0, 1]
+
+
+def test_oldest_segments_are_dropped_past_max_bytes(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=100, max_bytes=400)
+    for i in range(30):
+        spool.append([report(i)])
+    assert spool.stats()["bytes"] <= 400 + 100
+    assert spool.stats()["dropped_segments"] > 0
+    remaining = [r["n"] for r in drain(spool)]
+    assert remaining == list(range(30 - len(remaining), 30))
+
+
+class FakeResponse:
+    def __init__(self, status_code=202, payload=None):
+        self.status_code = status_code
+        self._payload = payload or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}", response=self)
+
+    def json(self):
+        return self._payload
+
+
+class FakeServer:
+    """Stands in for the transport's requests session"""
+
+    def __init__(self):
+        self.up = True
+        self.received = []
+
+    def post(self, url, data=None, timeout=None):
+        if not self.up:
+            raise requests.ConnectionError("connection refused")
+        self.received.extend(decode(data, "application/json", "gzip"))
+        return FakeResponse()
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def server():
+    return FakeServer()
+
+
+def make_transport(tmp_path, server):
+    transport = Transport("http://backend/update-hardware", batch_size=2, max_delay=0, max_batch=10,
+                          spool=Spool(str(tmp_path / "spool")), replay_rate=1000, backoff_base=0.01, backoff_max=0.01)
+    transport.session = server
+    return transport
+
+
+def test_outage_is_spooled_and_replayed_in_order(tmp_path, server):
+    transport = make_transport(tmp_path, server)
+    server.up = False
+    transport.add(report(0))
+    transport.add(report(1))
+    with pytest.raises(requests.ConnectionError):
+        transport.flush()
+    assert transport.spool.stats()["spooled"] == 2
+    transport._retry_at = 0  # backoff over
+
+    server.up = True
+    transport.add(report(2))
+    transport.add(report(3))
+    transport.flush()
+    # Replay is rate limited; give it a few ticks' worth of tokens.
+    for _ in range(100):
+        if not transport.spool.pending():
+            break
+        time.sleep(0.01)
+        transport.replay()
+    # Fresh reports go first, then the spool is replayed.
+    assert [r["n"] for r in server.received] == [2, 3, 0, 1]
+    assert not transport.spool.pending()
+    assert transport.stats()["sent"] == 2
+
+
+def test_reports_collected_while_backing_off_go_to_disk(tmp_path, server):
+    transport = make_transport(tmp_path, server)
+    transport.backoff_base = transport.backoff_max = 60
+    server.up = False
+    transport.add(report(0))
+    transport.add(report(1))
+    with pytest.raises(requests.ConnectionError):
+        transport.flush()
+    assert transport.backing_off()
+    transport.add(report(2))
+    transport.add(report(3))
+    assert transport.flush() is None
+    assert transport.stats()["buffered"] == 0
+    assert transport.spool.stats()["spooled"] == 4
+
+
+def test_rejected_batches_are_dropped_not_spooled(tmp_path, server):
+    transport = make_transport(tmp_path, server)
+    server.post = lambda url, data=None, timeout=None: FakeResponse(422)
+    transport.add(report(0))
+    transport.add(report(1))
+    with pytest.raises(requests.HTTPError):
+        transport.flush()
+    assert transport.stats()["dropped"] == 2
+    assert not transport.spool.pending()
+    assert not transport.backing_off()
@@ -0,0 +1,320 @@
+import gzip
+import json
+import random
+import threading
+import time
+import zlib
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def bulk_url(server_url):
+    """The bulk endpoint that sits next to the single-report SERVER_URL"""
+    return server_url.rstrip("/") + "/bulk"
+
+
+def delta_url(server_url):
+    """The change-only endpoint that sits next to SERVER_URL"""
+    return server_url.rstrip("/") + "/delta"
+
+
+class BodyError(ValueError):
+    """A request body that decode() cannot read"""
+
+
+def decode(body, content_type, content_encoding, max_bytes=32 * 1024 * 1024):
+    """The reports of a body as Transport.post() (or a plain JSON post) sends it, as a list.
+
+    The inverse of serialize() and compress(), for a relay receiving from
+    agents; the backend's own decoder accepts more formats.
+    """
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding in ("identity", ""):
+        data = body
+    elif encoding == "gzip":
+        decoder = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        try:
+            data = decoder.decompress(body, max_bytes)
+        except zlib.error as e:
+            raise BodyError(f"Invalid gzip body: {e}")
+        if decoder.unconsumed_tail:
+            raise BodyError("Decompressed body too large")
+    elif encoding == "zstd" and zstandard is not None:
+        try:
+            data = zstandard.ZstdDecompressor().decompress(body, max_output_size=max_bytes)
+        except zstandard.ZstdError as e:
+            raise BodyError(f"Invalid zstd body: {e}")
+    else:
+        raise BodyError(f"Unsupported Content-Encoding: {content_encoding}")
+    is_msgpack = (content_type or "").split(";")[0].strip().lower() == "application/msgpack"
+    if is_msgpack and msgpack is None:
+        raise BodyError("MessagePack bodies need the msgpack package")
+    try:
+        records = msgpack.unpackb(data, raw=False) if is_msgpack else json.loads(data)
+    except Exception as e:
+        raise BodyError(f"Invalid body: {e}")
+    if isinstance(records, dict):
+        records = [records]
+    if not isinstance(records, list):
+        raise BodyError("Expected a report or an array of reports")
+    return records
+
+
+class Transport:
+    """Batches reports and ships them compressed over one keep-alive session.
+
+    Reports are buffered until batch_size of them are waiting or the oldest
+    has waited max_delay seconds, then sent as one gzip (or zstd, when the
+    zstandard package is installed) JSON array to the bulk endpoint, at most
+    max_batch per request. With serialization="msgpack" (and the msgpack
+    package installed) the array is sent as MessagePack instead. With a
+    DeltaEncoder, fresh batches go to the delta endpoint as change-only
+    messages; spooled reports are always replayed in full. Reports from a failed send go to the on-disk
+    spool when one is configured (otherwise back to the front of the
+    bounded in-memory buffer).
+
+    After a failure the transport backs off exponentially with full jitter
+    before touching the network again, so a fleet does not reconnect in
+    lock-step when the backend comes back. Spooled reports are replayed
+    after successful sends, limited to replay_rate reports per second.
+    """
+
+    def __init__(self, server_url, batch_size=3, max_delay=15.0, max_batch=50, max_buffer=500,
+                 timeout=10, compression="gzip", spool=None, replay_rate=20.0,
+                 backoff_base=2.0, backoff_max=300.0, serialization="json", delta=None):
+        self.url = bulk_url(server_url)
+        self.delta_url = delta_url(server_url)
+        self.delta = delta
+        self.batch_size = batch_size
+        self.max_batch = max(batch_size, max_batch)
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.compression = compression if compression != "zstd" or zstandard else "gzip"
+        self.serialization = serialization if serialization != "msgpack" or msgpack else "json"
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.headers.update({
+            "Content-Type": "application/msgpack" if self.serialization == "msgpack" else "application/json",
+            "Content-Encoding": self.compression,
+        })
+        self._buffer = deque(maxlen=max_buffer)
+        self._oldest = None
+        self._lock = threading.Lock()
+        self.spool = spool
+        self.replay_rate = replay_rate
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._failures = 0
+        self._retry_at = 0.0
+        self._replay_tokens = 0.0
+        self._replay_checked = time.monotonic()
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.requests = 0
+        self.errors = 0
+        # (seconds, raw bytes, wire bytes) of the most recent requests
+        self.timings = deque(maxlen=60)
+
+    def add(self, report):
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(report)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def due(self):
+        with self._lock:
+            if not self._buffer:
+                return False
+            return len(self._buffer) >= self.batch_size or time.monotonic() - self._oldest >= self.max_delay
+
+    def serialize(self, batch):
+        if self.serialization == "msgpack":
+            return msgpack.packb(batch, use_bin_type=True)
+        return json.dumps(batch, separators=(",", ":")).encode()
+
+    def compress(self, body):
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor(level=3).compress(body)
+        return gzip.compress(body, compresslevel=6)
+
+    def post(self, batch, url=None):
+        """Send one batch; raises on network errors and non-2xx responses"""
+        url = url or self.url
+        raw = self.serialize(batch)
+        body = self.compress(raw)
+        started = time.monotonic()
+        self.requests += 1
+        try:
+            response = self.session.post(url, data=body, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException:
+            self.errors += 1
+            raise
+        finally:
+            self.timings.append((time.monotonic() - started, len(raw), len(body)))
+        return response
+
+    @staticmethod
+    def rejected(error):
+        """True when the server refused the batch itself, so resending cannot help"""
+        response = getattr(error, "response", None)
+        return response is not None and 400 <= response.status_code < 500 and response.status_code not in (408, 429)
+
+    def backing_off(self):
+        return time.monotonic() < self._retry_at
+
+    def _backoff(self):
+        self._failures += 1
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (self._failures - 1))
+        self._retry_at = time.monotonic() + random.uniform(0, delay)
+
+    def _take_batch(self):
+        with self._lock:
+            batch = list(self._buffer)[:self.max_batch]
+            for _ in batch:
+                self._buffer.popleft()
+            self._oldest = time.monotonic() if self._buffer else None
+        return batch
+
+    def send(self, batch):
+        """Post a fresh batch, change-only when delta reporting is on; returns (response, accepted)"""
+        if self.delta is None:
+            return self.post(batch), len(batch)
+        try:
+            response = self.post(self.delta.encode_batch(batch), self.delta_url)
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code not in (404, 405):
+                raise
+            print("Server has no delta endpoint, sending full reports")
+            self.delta = None
+            return self.post(batch), len(batch)
+        result = response.json()
+        accepted = result.get("accepted", len(batch))
+        if result.get("resync"):
+            # The server lost track of this session (restart or gap): resend
+            # the reports it did not take, starting with a full snapshot.
+            self.delta.reset()
+            self._unshift(batch[accepted:])
+        return response, accepted
+
+    def _requeue(self, batch):
+        if self.spool is not None:
+            self.spool.append(batch)
+            return
+        self._unshift(batch)
+
+    def _unshift(self, batch):
+        with self._lock:
+            # Put the batch back in front of anything collected meanwhile.
+            room = self._buffer.maxlen - len(self._buffer)
+            self.dropped += max(0, len(batch) - room)
+            self._buffer.extendleft(reversed(batch[-room:] if room else []))
+            if self._oldest is None and self._buffer:
+                self._oldest = time.monotonic()
+
+    def flush(self, force=False):
+        """Send buffered reports if a batch is due; returns the response or None"""
+        if self.backing_off():
+            # While the backend is unreachable keep memory flat by moving
+            # everything collected so far to disk.
+            if self.spool is not None and self.due():
+                self.spool.append(self._take_batch())
+            return None
+        if not force and not self.due():
+            self.replay()
+            return None
+        batch = self._take_batch()
+        if not batch:
+            return None
+        try:
+            response, accepted = self.send(batch)
+        except requests.RequestException as e:
+            if self.delta is not None:
+                # The server may not have applied this batch; start over.
+                self.delta.reset()
+            self.failed += len(batch)
+            if self.rejected(e):
+                self.dropped += len(batch)
+            else:
+                self._requeue(batch)
+                self._backoff()
+            raise
+        self.sent += accepted
+        self._failures = 0
+        self.replay()
+        return response
+
+    def replay(self):
+        """Resend spooled reports, at most replay_rate per second on average"""
+        if self.spool is None or self.backing_off():
+            return 0
+        now = time.monotonic()
+        burst = max(self.max_batch, self.replay_rate)
+        self._replay_tokens = min(burst, self._replay_tokens + (now - self._replay_checked) * self.replay_rate)
+        self._replay_checked = now
+        replayed = 0
+        while self._replay_tokens >= 1 and self.spool.pending():
+            records, token = self.spool.read_batch(min(self.max_batch, int(self._replay_tokens)))
+            if records:
+                try:
+                    self.post(records)
+                except requests.RequestException as e:
+                    if not self.rejected(e):
+                        print(f"Replay failed, backing off: {e}")
+                        self._backoff()
+                        break
+                    print(f"Server rejected {len(records)} spooled reports: {e}")
+                    self.dropped += len(records)
+            self.spool.commit(token)
+            self._replay_tokens -= len(records)
+            replayed += len(records)
+        if replayed:
+            print(f"Replayed {replayed} spooled reports")
+        return replayed
+
+    def spool_buffered(self):
+        """Move every buffered report to the spool (on shutdown); returns how many"""
+        moved = 0
+        while self.spool is not None:
+            batch = self._take_batch()
+            if not batch:
+                break
+            self.spool.append(batch)
+            moved += len(batch)
+        return moved
+
+    def stats(self):
+        timings = list(self.timings)
+        with self._lock:
+            buffered = len(self._buffer)
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "requests": self.requests,
+            "errors": self.errors,
+            "buffered": buffered,
+            "send_ms": round(sum(t for t, _, _ in timings) / len(timings) * 1000, 2) if timings else 0.0,
+            "send_max_ms": round(max(t for t, _, _ in timings) * 1000, 2) if timings else 0.0,
+            "raw_bytes": timings[-1][1] if timings else 0,
+            "wire_bytes": timings[-1][2] if timings else 0,
+        }
+
+    def close(self):
+        self.session.close()
@@ -9,10 +9,16 @@ import { useSettings } from '../contexts/SettingsContext';
 import { NotificationService } from '../services/notifications';
 import { SystemHealth } from './SystemHealth';
 
+// Errors in a row before the dashboard polls instead of the live stream,
+// and how long it polls before trying the stream again.
+const STREAM_MAX_FAILURES = 3;
+const STREAM_RETRY_MS = 30000;
+
 export default function Dashboard() {
   const [hardwareData, setHardwareData] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const [degraded, setDegraded] = useState(null);
   const intervalRef = useRef(null);
   const [selectedComputer, setSelectedComputer] = useState(null);
   const [timeRange, setTimeRange] = useState('1h'); // 1h, 24h, 7d
@@ -81,20 +87,97 @@ export default function Dashboard() {
   }, []);
 
   useEffect(() => {
+    let source = null;
+    let streamFailures = 0;
+    let retryTimer = null;
+
+    const startPolling = () => {
+      if (!intervalRef.current) {
+        intervalRef.current = setInterval(fetchHardwareData, settings.alerts.refreshInterval * 1000);
+      }
+    };
+
+    const stopPolling = () => {
+      clearInterval(intervalRef.current);
+      intervalRef.current = null;
+    };
+
+    // Prefer the server-sent event stream; fall back to polling if the
+    // browser or backend does not support it.
+    const startStream = () => {
+      retryTimer = null;
+      if (typeof EventSource === "undefined") {
+        startPolling();
+        return;
+      }
+      if (source) source.close();
+      source = new EventSource("http://localhost:5001/stream/hardware");
+      source.onopen = () => {
+        streamFailures = 0;
+        stopPolling();
+      };
+      source.addEventListener("snapshot", (event) => {
+        setHardwareData(JSON.parse(event.data).hosts);
+        setLoading(false);
+      });
+      source.addEventListener("update", (event) => {
+        const changed = JSON.parse(event.data).hosts;
+        setHardwareData((previous) => {
+          const byComputer = new Map(previous.map((system) => [system.computer, system]));
+          changed.forEach((system) => byComputer.set(system.computer, system));
+          return Array.from(byComputer.values());
+        });
+      });
+      source.onerror = () => {
+        // EventSource reconnects by itself after a restart or an idle
+        // timeout. Only once it has failed repeatedly (or given up) poll
+        // instead, and try the stream again later.
+        streamFailures += 1;
+        if (source.readyState !== EventSource.CLOSED && streamFailures < STREAM_MAX_FAILURES) {
+          return;
+        }
+        console.error("Live stream unavailable, polling until it comes back");
+        source.close();
+        source = null;
+        startPolling();
+        if (!retryTimer) {
+          retryTimer = setTimeout(startStream, STREAM_RETRY_MS);
+        }
+      };
+    };
+
     const checkBackendHealth = async () => {
       try {
         await axios.get("http://localhost:5001/health");
         console.log("Backend is healthy");
         fetchHardwareData();
+        startStream();
       } catch (error) {
+        const health = error.response?.status === 503 ? error.response.data : null;
+        if (health?.status) {
+          // Reachable but not ready (database or ingest failing its check):
+          // keep showing live data and say what is wrong.
+          const failing = Object.entries(health.checks || {})
+            .filter(([, check]) => check.ok === false || check.writable === false)
+            .map(([name]) => name);
+          console.warn("Backend is degraded:", health);
+          setDegraded(`Backend is ${health.status}${failing.length ? ` (${failing.join(", ")})` : ""}; data may be delayed.`);
+          fetchHardwareData();
+          startStream();
+          return;
+        }
         console.error("Backend health check failed:", error);
         setError("Cannot connect to backend server. Please ensure it's running.");
+        startPolling();
       }
     };
 
     checkBackendHealth();
-    intervalRef.current = setInterval(fetchHardwareData, settings.alerts.refreshInterval * 1000);
-    return () => clearInterval(intervalRef.current);
+    return () => {
+      if (source) source.close();
+      clearTimeout(retryTimer);
+      stopPolling();
+    };
   }, [fetchHardwareData, settings.alerts.refreshInterval]);
 
   useEffect(() => {
@@ -335,6 +418,18 @@ export default function Dashboard() {
             </div>
 
             <div className="card-body">
+              {degraded && !error && (
+                <div className="alert alert-warning d-flex align-items-center mb-4" role="alert">
+                  <i className="bi bi-exclamation-circle-fill me-2"></i>
+                  {degraded}
+                  <button 
+                    type="button" 
+                    className="btn-close ms-auto" 
+                    onClick={() => setDegraded(null)}
+                  ></button>
+                </div>
+              )}
+
               {error && (
                 <div className="alert alert-danger d-flex align-items-center mb-4" role="alert">
                   <i className="bi bi-exclamation-triangle-fill me-2"></i>